@@ -0,0 +1,275 @@
+"""
+Async access to the same database as get_db(), for routers and async services.
+
+Postgres goes through an asyncpg pool and SQLite through a pool of aiosqlite
+connections (each runs its queries on its own thread), so awaiting a query
+never blocks the event loop. Single writes on SQLite still go through the
+single writer thread of app.database.
+
+Every function takes either a named statement from app.queries, which is
+rendered for both dialects and timed, or SQL text with %s or ? placeholders,
+which is rewritten to $1, $2, ... for asyncpg. Rows support row["column"],
+row[0] and dict(row) with both drivers.
+
+    row = await fetch_one(queries.USER_BY_EMAIL, (email,))
+    async with transaction() as conn:
+        await conn.execute(queries.DELETE_USER_FLAGS, (email,))
+        await conn.execute_many(queries.INSERT_USER_FLAG, rows)
+"""
+import asyncio
+import logging
+import sqlite3
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence
+
+import aiosqlite
+import asyncpg
+
+from . import database
+from .database import get_db_type, settings, sqlite_pragmas, sqlite_writer
+from .queries import Query, QueryText, query_stats, to_asyncpg
+
+logger = logging.getLogger(__name__)
+
+def render(query: QueryText, dialect: str) -> str:
+    """The SQL text to send for a named statement or raw query"""
+    if isinstance(query, Query):
+        return query.sql(dialect)
+    return to_asyncpg(query) if dialect == "postgres" else query
+
+class AsyncConnection:
+    """One pooled connection, with the same query methods as the module functions"""
+
+    def __init__(self, conn, dialect: str):
+        self._conn = conn
+        self.dialect = dialect
+
+    async def fetch_one(self, query: QueryText, params: Sequence = ()):
+        sql = render(query, self.dialect)
+        with query_stats.measure(query):
+            if self.dialect == "postgres":
+                return await self._conn.fetchrow(sql, *params)
+            async with self._conn.execute(sql, params) as cursor:
+                return await cursor.fetchone()
+
+    async def fetch_all(self, query: QueryText, params: Sequence = ()) -> List:
+        sql = render(query, self.dialect)
+        with query_stats.measure(query):
+            if self.dialect == "postgres":
+                return await self._conn.fetch(sql, *params)
+            async with self._conn.execute(sql, params) as cursor:
+                return list(await cursor.fetchall())
+
+    async def execute(self, query: QueryText, params: Sequence = ()) -> int:
+        """Run one statement, returning its rowcount"""
+        sql = render(query, self.dialect)
+        with query_stats.measure(query):
+            if self.dialect == "postgres":
+                status = await self._conn.execute(sql, *params)
+                # Status strings look like "UPDATE 3" or "INSERT 0 1"
+                last = status.rsplit(" ", 1)[-1]
+                return int(last) if last.isdigit() else -1
+            async with self._conn.execute(sql, params) as cursor:
+                return cursor.rowcount
+
+    async def execute_many(self, query: QueryText, rows: Sequence[Sequence]):
+        sql = render(query, self.dialect)
+        with query_stats.measure(query):
+            await self._conn.executemany(sql, rows)
+
+    async def iterate(self, query: QueryText, params: Sequence = (), batch_size: int = 1000) -> AsyncIterator:
+        """Rows from a cursor, fetched batch_size at a time so memory stays flat however many match"""
+        sql = render(query, self.dialect)
+        with query_stats.measure(query):
+            if self.dialect == "postgres":
+                # Server-side cursors only live inside a transaction
+                async with self._conn.transaction(readonly=True):
+                    async for row in self._conn.cursor(sql, *params, prefetch=batch_size):
+                        yield row
+                return
+            async with self._conn.execute(sql, params) as cursor:
+                while True:
+                    rows = await cursor.fetchmany(batch_size)
+                    if not rows:
+                        return
+                    for row in rows:
+                        yield row
+
+class AsyncSQLitePool:
+    """
+    Up to max_size aiosqlite connections, opened on demand and reused.
+
+    Connections run in autocommit mode; transaction() opens an explicit
+    BEGIN IMMEDIATE so a read-then-write transaction waits for the write lock
+    up front instead of failing with "database is locked" halfway.
+    """
+
+    def __init__(self, path: str, max_size: int, timeout: float):
+        self.path = path
+        self.max_size = max_size
+        self.timeout = timeout
+        self._idle: List[aiosqlite.Connection] = []
+        self._open = 0
+        self._slots = asyncio.Semaphore(max_size)
+
+    async def acquire(self) -> aiosqlite.Connection:
+        await asyncio.wait_for(self._slots.acquire(), self.timeout)
+        try:
+            if self._idle:
+                return self._idle.pop()
+            conn = aiosqlite.connect(
+                self.path,
+                timeout=settings.sqlite_busy_timeout_ms / 1000,
+                isolation_level=None,
+                cached_statements=settings.db_statement_cache_size
+            )
+            # The worker thread starts on await; as a daemon it cannot hold up exit when a script
+            # ends its event loop without close_async_db() (interpreter shutdown joins other threads before atexit)
+            conn._thread.daemon = True
+            conn = await conn
+            conn.row_factory = sqlite3.Row
+            for pragma in sqlite_pragmas():
+                await conn.execute(pragma)
+            self._open += 1
+            return conn
+        except Exception:
+            self._slots.release()
+            raise
+
+    async def release(self, conn: aiosqlite.Connection):
+        try:
+            if conn.in_transaction:
+                await conn.rollback()
+            self._idle.append(conn)
+        except Exception:
+            self._open -= 1
+            await conn.close()
+        finally:
+            self._slots.release()
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        for conn in idle:
+            await conn.close()
+        self._open -= len(idle)
+
+    def stats(self) -> Dict:
+        return {"open": self._open, "idle": len(self._idle), "max_size": self.max_size}
+
+# Pools belong to the event loop they were created on
+_pool: Any = None
+_pool_loop: Optional[asyncio.AbstractEventLoop] = None
+_pool_lock: Optional[asyncio.Lock] = None
+
+async def _get_pool():
+    global _pool, _pool_loop, _pool_lock
+    loop = asyncio.get_running_loop()
+    if _pool is not None and _pool_loop is loop:
+        return _pool
+    if _pool_loop is not loop:
+        if _pool is not None:
+            _discard_pool(_pool)
+        _pool, _pool_loop, _pool_lock = None, loop, asyncio.Lock()
+    async with _pool_lock:
+        if _pool is None:
+            if get_db_type() == "postgres":
+                _pool = await asyncpg.create_pool(
+                    settings.supabase_db_url,
+                    min_size=settings.db_pool_min_size,
+                    max_size=settings.db_pool_max_size,
+                    max_inactive_connection_lifetime=settings.db_pool_max_lifetime_seconds,
+                    timeout=settings.db_pool_timeout_seconds,
+                    # Each connection prepares a statement on first use and reuses its plan after that
+                    statement_cache_size=settings.db_statement_cache_size,
+                    max_cached_statement_lifetime=0
+                )
+            else:
+                _pool = AsyncSQLitePool(database.SQLITE_PATH, settings.db_pool_max_size, settings.db_pool_timeout_seconds)
+        return _pool
+
+def _discard_pool(pool):
+    # The loop it belonged to is gone, so its connections cannot be closed gracefully
+    if isinstance(pool, AsyncSQLitePool):
+        for conn in pool._idle:
+            conn.stop()
+    else:
+        pool.terminate()
+
+@asynccontextmanager
+async def connection() -> AsyncIterator[AsyncConnection]:
+    """A pooled connection for several queries; outside transaction() each statement commits on its own"""
+    pool = await _get_pool()
+    if isinstance(pool, AsyncSQLitePool):
+        conn = await pool.acquire()
+        try:
+            yield AsyncConnection(conn, "sqlite")
+        finally:
+            await pool.release(conn)
+    else:
+        async with pool.acquire(timeout=settings.db_pool_timeout_seconds) as conn:
+            yield AsyncConnection(conn, "postgres")
+
+@asynccontextmanager
+async def transaction() -> AsyncIterator[AsyncConnection]:
+    """A pooled connection inside a transaction, committed on success and rolled back on error"""
+    async with connection() as conn:
+        if conn.dialect == "postgres":
+            async with conn._conn.transaction():
+                yield conn
+            return
+        await conn._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            await conn._conn.rollback()
+            raise
+        await conn._conn.commit()
+
+async def fetch_one(query: QueryText, params: Sequence = ()):
+    async with connection() as conn:
+        return await conn.fetch_one(query, params)
+
+async def fetch_all(query: QueryText, params: Sequence = ()) -> List:
+    async with connection() as conn:
+        return await conn.fetch_all(query, params)
+
+async def stream(query: QueryText, params: Sequence = (), batch_size: int = 1000) -> AsyncIterator:
+    """
+    Rows of a large result one at a time, for streaming responses
+
+    Holds one pooled connection until the rows run out or the iterator is closed.
+    """
+    async with connection() as conn:
+        async for row in conn.iterate(query, params, batch_size):
+            yield row
+
+async def execute(query: QueryText, params: Sequence = ()) -> int:
+    """
+    Run and commit one INSERT, UPDATE or DELETE, returning its rowcount
+
+    With SQLite (and sqlite_single_writer on) the statement is queued to the
+    writer thread, which commits it together with other queued writes.
+    """
+    if get_db_type() == "sqlite" and settings.sqlite_single_writer:
+        with query_stats.measure(query):
+            return await asyncio.wrap_future(sqlite_writer().submit(render(query, "sqlite"), params))
+    async with connection() as conn:
+        return await conn.execute(query, params)
+
+async def close_async_db():
+    """Close the pool of the running event loop"""
+    global _pool
+    pool, _pool = _pool, None
+    if pool is None:
+        return
+    if _pool_loop is asyncio.get_running_loop():
+        await pool.close()
+    else:
+        _discard_pool(pool)
+
+def async_db_stats() -> Dict:
+    if _pool is None:
+        return {}
+    if isinstance(_pool, AsyncSQLitePool):
+        return _pool.stats()
+    return {"open": _pool.get_size(), "idle": _pool.get_idle_size(), "max_size": _pool.get_max_size()}
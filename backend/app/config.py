@@ -31,10 +31,92 @@ class Settings(BaseSettings):
     supabase_key: str = ""
     supabase_db_url: str = ""  # Full PostgreSQL connection string
     
+    # Connection pool settings
+    db_pool_min_size: int = 1  # Postgres connections opened up front
+    db_pool_max_size: int = 10  # Callers wait for a free connection beyond this
+    db_pool_max_lifetime_seconds: int = 1800  # Postgres connections are recycled after this
+    db_pool_health_check_seconds: int = 30  # Connections idle longer than this are pinged before reuse
+    db_pool_timeout_seconds: float = 30.0  # How long get_db() waits for a free connection
+    db_statement_cache_size: int = 256  # Prepared statements kept per async connection; 0 behind PgBouncer in transaction mode
+    query_stats_window: int = 500  # Recent calls per named query kept for latency percentiles
+    session_details_page_size: int = 500  # Log rows per /sorting/session/{id}/details page by default
+    max_page_size: int = 5000  # Upper bound on the limit of paged endpoints
+    export_fetch_size: int = 1000  # Rows fetched per round trip while streaming an export
+    
+    # SQLite tuning (ignored with Postgres)
+    sqlite_journal_mode: str = "WAL"  # Readers proceed while a write is in progress
+    sqlite_synchronous: str = "NORMAL"  # Safe with WAL; fsyncs at checkpoints instead of every commit
+    sqlite_mmap_size_mb: int = 256
+    sqlite_cache_size_mb: int = 16  # Page cache per connection
+    sqlite_busy_timeout_ms: int = 5000  # How long a connection waits on a lock before "database is locked"
+    sqlite_single_writer: bool = True  # Route hot writes through one writer thread
+    sqlite_writer_batch_size: int = 500  # Most queued writes committed in one transaction
+    
+    # Processing log buffering
+    processing_log_batch_size: int = 200  # Buffered email_processing_log rows that trigger a flush
+    processing_log_flush_seconds: float = 1.0  # Longest a row waits in the buffer
+    processing_log_max_pending: int = 20000  # Rows kept for retry while the database is failing
+    processing_log_max_attempts: int = 3  # Failed single-row inserts before a row goes to the dead letter file
+    processing_log_dead_letter_path: str = "processing_log_dead_letter.jsonl"  # Rows that could not be written; "" only logs them
+    
+    # Processing log retention
+    log_retention_months: int = 6  # Whole months kept besides the current one; 0 keeps everything
+    log_archive_dir: str = "log_archive"  # Expired rows are written here as gzipped CSV first; "" discards them
+    log_archive_interval_seconds: float = 3600.0  # How often the archiver runs
+    log_partitions_ahead: int = 2  # Postgres monthly partitions created ahead of the current month
+    log_archive_delete_batch: int = 5000  # SQLite rows deleted per write transaction
+    
     # AI API keys
     openai_api_key: str
     gemini_api_key: str
     
+    # Gemini request limits
+    gemini_timeout_seconds: float = 20.0  # Per-call deadline, including time queued for a slot
+    gemini_max_concurrency: int = 4  # Process-wide cap on in-flight Gemini requests
+    gemini_cache_max_entries: int = 1024  # Cached Gemini responses, evicted least recently used
+    gemini_cache_ttl_seconds: int = 3600  # How long a cached Gemini response stays valid
+    gemini_sorting_timeout_seconds: float = 5.0  # Deadline for Gemini keywords while sorting an email
+    llm_session_max_calls: int = 40  # Gemini calls allowed per sorting session (0 = unlimited)
+    llm_session_max_tokens: int = 40000  # Estimated prompt tokens allowed per session (0 = unlimited)
+    llm_max_ambiguity: float = 0.2  # Only decisions closer than this (top-2 margin or threshold distance) use Gemini
+    
+    # Gemini circuit breaker settings
+    gemini_breaker_window: int = 20  # Recent calls considered
+    gemini_breaker_min_requests: int = 5  # Calls needed before the circuit can open
+    gemini_breaker_max_error_rate: float = 0.5  # Open when this share of recent calls failed
+    gemini_breaker_max_p95_latency: float = 8.0  # Open when p95 latency (seconds) reaches this
+    gemini_breaker_open_seconds: float = 30.0  # How long to skip Gemini before probing again
+    gemini_breaker_half_open_probes: int = 1  # Concurrent probe calls while half-open
+    
+    # Learned classifier settings
+    classifier_model_dir: str = "models"  # Where per-user classifier files are stored
+    classifier_min_confidence: float = 0.85  # Close rule decisions are confirmed without Gemini only at or above this
+    classifier_min_samples: int = 50  # Training rows required before a user's model is trusted
+    
+    # Sender decision cache settings
+    sender_cache_min_confidence: float = 0.5  # Past assignments below this don't count as support
+    sender_cache_min_support: int = 3  # Confident assignments needed before a sender is memoized
+    sender_cache_min_consistency: float = 0.9  # Share of the sender's emails that must agree
+    sender_cache_ttl_seconds: int = 3600  # Rebuild decisions at least this often
+    sender_cache_history_rows: int = 5000  # Most recent log rows considered per user
+    
+    # Near-duplicate detection settings
+    near_duplicate_max_distance: int = 3  # Max differing SimHash bits (at most 3)
+    near_duplicate_min_tokens: int = 8  # Shorter emails are never grouped
+    
+    # Labels applied per email while sorting: 1 = best flag only, k = top k, 0 = every flag above the threshold
+    sorting_max_labels: int = 1
+    progress_persist_seconds: float = 2.0  # Most often a running session's progress is written to sorting_sessions
+    
+    # Per-stage scoring profiles (opt-in; also enabled per session with "profile": true on /sorting/start)
+    scoring_profile_enabled: bool = False
+    scoring_profile_slowest_emails: int = 20  # Slowest emails listed in a session profile
+    
+    # Logging settings
+    log_level: str = "INFO"
+    log_sample_rate: float = 0.1  # Share of per-email debug records kept
+    log_per_email_rate_limit: float = 20.0  # Max per-email records per second for each message
+    
     class Config:
         env_file = "details.env"
 
@@ -1,130 +1,378 @@
+import logging
+import os
+import queue
 import sqlite3
+import threading
+import time
+from concurrent.futures import Future
 from contextlib import contextmanager
-from typing import Optional
+from typing import Dict, List, Optional, Sequence
 import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
 from psycopg2.extras import RealDictCursor
 from .config import get_settings
+from .migrations import migrate
+from .queries import Query, QueryText, query_stats
+
+logger = logging.getLogger(__name__)
 
 settings = get_settings()
 
+SQLITE_PATH = "app.db"
+
+# Idle SQLite connections kept per thread (more are opened only for nested get_db() calls)
+SQLITE_IDLE_PER_THREAD = 2
+
 def get_db_type():
     """Determine which database to use based on configuration"""
     return "postgres" if settings.supabase_db_url else "sqlite"
 
+class PostgresPool:
+    """
+    Thread-safe pool of Postgres connections.
+    
+    Wraps psycopg2's ThreadedConnectionPool and adds what it lacks: callers
+    block (up to timeout) instead of failing when every connection is in use,
+    connections older than max_lifetime are replaced, and connections idle
+    longer than health_check_after are pinged before being handed out.
+    Returned connections are rolled back, so no transaction leaks between users.
+    """
+    
+    def __init__(self, dsn: str, min_size: int, max_size: int, max_lifetime: float,
+                 health_check_after: float, timeout: float):
+        self.max_lifetime = max_lifetime
+        self.health_check_after = health_check_after
+        self.timeout = timeout
+        self._pool = psycopg2.pool.ThreadedConnectionPool(min_size, max_size, dsn, cursor_factory=RealDictCursor)
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._created: Dict[int, float] = {}
+        self._last_used: Dict[int, float] = {}
+        self._lock = threading.Lock()
+        self.replaced = 0
+        self.waits = 0
+    
+    def getconn(self):
+        if not self._slots.acquire(blocking=False):
+            self.waits += 1
+            if not self._slots.acquire(timeout=self.timeout):
+                raise psycopg2.pool.PoolError(f"No database connection free after {self.timeout}s")
+        try:
+            return self._healthy_conn()
+        except Exception:
+            self._slots.release()
+            raise
+    
+    def _healthy_conn(self):
+        # A few attempts: stale connections are discarded and replaced
+        for _ in range(3):
+            conn = self._pool.getconn()
+            now = time.monotonic()
+            with self._lock:
+                created = self._created.setdefault(id(conn), now)
+                last_used = self._last_used.get(id(conn), now)
+            
+            if conn.closed or now - created > self.max_lifetime:
+                self._discard(conn)
+                continue
+            if now - last_used > self.health_check_after:
+                try:
+                    with conn.cursor() as cursor:
+                        cursor.execute("SELECT 1")
+                    conn.rollback()
+                except Exception as e:
+                    logger.info("Discarding unhealthy database connection: %s", e)
+                    self._discard(conn)
+                    continue
+            return conn
+        return self._pool.getconn()
+    
+    def _discard(self, conn):
+        with self._lock:
+            self._created.pop(id(conn), None)
+            self._last_used.pop(id(conn), None)
+        self.replaced += 1
+        self._pool.putconn(conn, close=True)
+    
+    def putconn(self, conn):
+        try:
+            if conn.closed:
+                self._discard(conn)
+                return
+            try:
+                # Uncommitted work is discarded, as closing the connection used to do
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                self._discard(conn)
+                return
+            with self._lock:
+                self._last_used[id(conn)] = time.monotonic()
+            self._pool.putconn(conn)
+        finally:
+            self._slots.release()
+    
+    def closeall(self):
+        self._pool.closeall()
+    
+    def stats(self) -> Dict:
+        return {
+            "open": len(self._pool._used) + len(self._pool._pool),
+            "in_use": len(self._pool._used),
+            "max_size": self._pool.maxconn,
+            "replaced": self.replaced,
+            "waits": self.waits
+        }
+
+_postgres_pool: Optional[PostgresPool] = None
+_postgres_pool_pid: Optional[int] = None
+_postgres_pool_lock = threading.Lock()
+
+def _get_postgres_pool() -> PostgresPool:
+    global _postgres_pool, _postgres_pool_pid
+    # Connections must not be shared with a forked child process
+    if _postgres_pool is not None and _postgres_pool_pid == os.getpid():
+        return _postgres_pool
+    with _postgres_pool_lock:
+        if _postgres_pool is None or _postgres_pool_pid != os.getpid():
+            _postgres_pool = PostgresPool(
+                settings.supabase_db_url,
+                min_size=settings.db_pool_min_size,
+                max_size=settings.db_pool_max_size,
+                max_lifetime=settings.db_pool_max_lifetime_seconds,
+                health_check_after=settings.db_pool_health_check_seconds,
+                timeout=settings.db_pool_timeout_seconds
+            )
+            _postgres_pool_pid = os.getpid()
+        return _postgres_pool
+
+def sqlite_pragmas() -> List[str]:
+    """Journal, sync and cache settings applied to every SQLite connection"""
+    # journal_mode is stored in the database file; the others are per connection
+    return [
+        f"PRAGMA journal_mode={settings.sqlite_journal_mode}",
+        f"PRAGMA synchronous={settings.sqlite_synchronous}",
+        f"PRAGMA mmap_size={settings.sqlite_mmap_size_mb * 1024 * 1024}",
+        f"PRAGMA cache_size={-settings.sqlite_cache_size_mb * 1024}",
+    ]
+
+def _connect_sqlite(path: Optional[str] = None) -> sqlite3.Connection:
+    """Open a SQLite connection with sqlite_pragmas() applied"""
+    conn = sqlite3.connect(path or SQLITE_PATH, timeout=settings.sqlite_busy_timeout_ms / 1000)
+    conn.row_factory = sqlite3.Row
+    for pragma in sqlite_pragmas():
+        conn.execute(pragma)
+    return conn
+
+# Idle SQLite connections of the current thread; sqlite3 connections stay on the thread that opened them
+_sqlite_local = threading.local()
+
+def _get_sqlite_conn() -> sqlite3.Connection:
+    idle: List[sqlite3.Connection] = getattr(_sqlite_local, 'idle', None)
+    if idle is None:
+        idle = _sqlite_local.idle = []
+    if idle:
+        return idle.pop()
+    return _connect_sqlite()
+
+def _put_sqlite_conn(conn: sqlite3.Connection):
+    try:
+        if conn.in_transaction:
+            conn.rollback()
+    except sqlite3.Error:
+        conn.close()
+        return
+    idle = _sqlite_local.idle
+    if len(idle) < SQLITE_IDLE_PER_THREAD:
+        idle.append(conn)
+    else:
+        conn.close()
+
+class SQLiteWriter:
+    """
+    One thread owning a SQLite connection that all queued writes go through.
+    
+    SQLite allows a single writer at a time, so concurrent sorting sessions that
+    each commit their own statements queue up on the file lock. Here writes from
+    any thread or coroutine are queued instead, and whatever is queued when the
+    writer gets to it is committed as one transaction (up to batch_size). If a
+    batch fails its statements are retried one by one, so only the failing
+    write reports an error.
+    """
+    
+    def __init__(self, path: str, batch_size: int):
+        self.path = path
+        self.batch_size = batch_size
+        self.batches = 0
+        self.writes = 0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+        self._thread.start()
+    
+    def submit(self, query: str, params: Sequence = ()) -> Future:
+        """Queue one statement; the future resolves to its rowcount once committed"""
+        future = Future()
+        self._queue.put((query, params, future, False))
+        return future
+    
+    def submit_many(self, query: str, rows: Sequence[Sequence]) -> Future:
+        """Queue one statement run for each row of params (executemany), committed together"""
+        future = Future()
+        self._queue.put((query, rows, future, True))
+        return future
+    
+    def stop(self):
+        """Commit everything already queued, then end the thread"""
+        self._queue.put(None)
+        self._thread.join()
+    
+    def pending(self) -> int:
+        return self._queue.qsize()
+    
+    def _run(self):
+        conn = _connect_sqlite(self.path)
+        try:
+            stopping = False
+            while not stopping:
+                batch = []
+                item = self._queue.get()
+                while item is not None:
+                    # Cancelled callers are dropped; the rest can no longer be cancelled
+                    if item[2].set_running_or_notify_cancel():
+                        batch.append(item)
+                    if len(batch) >= self.batch_size:
+                        break
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                stopping = item is None
+                if batch:
+                    self._commit(conn, batch)
+        finally:
+            conn.close()
+    
+    @staticmethod
+    def _execute(conn: sqlite3.Connection, query: str, params: Sequence, many: bool) -> int:
+        if many:
+            return conn.executemany(query, params).rowcount
+        return conn.execute(query, params).rowcount
+    
+    def _commit(self, conn: sqlite3.Connection, batch: List):
+        try:
+            rowcounts = [self._execute(conn, query, params, many) for query, params, _, many in batch]
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.warning("SQLite write batch of %d failed, retrying one by one: %s", len(batch), e)
+            for query, params, future, many in batch:
+                try:
+                    rowcount = self._execute(conn, query, params, many)
+                    conn.commit()
+                except Exception as statement_error:
+                    conn.rollback()
+                    future.set_exception(statement_error)
+                else:
+                    future.set_result(rowcount)
+        else:
+            for (_, _, future, _), rowcount in zip(batch, rowcounts):
+                future.set_result(rowcount)
+        self.batches += 1
+        self.writes += len(batch)
+    
+    def stats(self) -> Dict:
+        return {"queued": self.pending(), "batches": self.batches, "writes": self.writes}
+
+_sqlite_writer: Optional[SQLiteWriter] = None
+_sqlite_writer_pid: Optional[int] = None
+_sqlite_writer_lock = threading.Lock()
+
+def sqlite_writer() -> SQLiteWriter:
+    """This process's SQLite writer thread, started on first use"""
+    global _sqlite_writer, _sqlite_writer_pid
+    if _sqlite_writer is not None and _sqlite_writer_pid == os.getpid():
+        return _sqlite_writer
+    with _sqlite_writer_lock:
+        if _sqlite_writer is None or _sqlite_writer_pid != os.getpid():
+            _sqlite_writer = SQLiteWriter(SQLITE_PATH, settings.sqlite_writer_batch_size)
+            _sqlite_writer_pid = os.getpid()
+        return _sqlite_writer
+
 @contextmanager
 def get_db():
-    """Database connection context manager"""
+    """
+    Database connection context manager
+    
+    Connections come from a pool (Postgres) or a per-thread cache (SQLite) and go
+    back on exit with any uncommitted work rolled back, so commit() before leaving.
+    """
     if get_db_type() == "postgres":
-        conn = psycopg2.connect(
-            settings.supabase_db_url,
-            cursor_factory=RealDictCursor
-        )
+        pool = _get_postgres_pool()
+        conn = pool.getconn()
+        try:
+            yield conn
+        finally:
+            pool.putconn(conn)
     else:
-        conn = sqlite3.connect("app.db")
-        conn.row_factory = sqlite3.Row
+        conn = _get_sqlite_conn()
+        try:
+            yield conn
+        finally:
+            _put_sqlite_conn(conn)
+
+def sync_sql(query: QueryText) -> str:
+    """The text get_db() connections take for a named statement; raw text is already in the driver's format"""
+    return query.sync_sql(get_db_type()) if isinstance(query, Query) else query
+
+def execute_query(cursor, query: QueryText, params: Sequence = ()):
+    """Run a named statement (timed into query_stats) or raw query on a get_db() cursor"""
+    with query_stats.measure(query):
+        cursor.execute(sync_sql(query), params)
+    return cursor
+
+def execute_write_many(query: QueryText, rows: Sequence[Sequence]) -> int:
+    """
+    Run query once per row of params and commit them as one transaction, blocking until done
     
-    try:
-        yield conn
-    finally:
+    With SQLite (and sqlite_single_writer on) the rows go through the writer thread.
+    On Postgres prefer psycopg2.extras.execute_values, which sends one multi-row INSERT.
+    """
+    sql = sync_sql(query)
+    with query_stats.measure(query):
+        if get_db_type() == "sqlite" and settings.sqlite_single_writer:
+            return sqlite_writer().submit_many(sql, rows).result()
+        with get_db() as conn:
+            cursor = conn.cursor()
+            cursor.executemany(sql, rows)
+            conn.commit()
+            return cursor.rowcount
+
+def close_db_pool():
+    """Close pooled Postgres connections, flush the SQLite writer and close this thread's cached SQLite connections"""
+    global _postgres_pool, _sqlite_writer
+    with _postgres_pool_lock:
+        if _postgres_pool is not None:
+            _postgres_pool.closeall()
+            _postgres_pool = None
+    with _sqlite_writer_lock:
+        if _sqlite_writer is not None:
+            if _sqlite_writer_pid == os.getpid():
+                _sqlite_writer.stop()
+            _sqlite_writer = None
+    for conn in getattr(_sqlite_local, 'idle', []):
         conn.close()
+    _sqlite_local.idle = []
+
+def db_pool_stats() -> Dict:
+    """Connection pool counters for the status endpoints"""
+    if get_db_type() == "postgres":
+        return _get_postgres_pool().stats()
+    stats = {"idle_sqlite_connections": len(getattr(_sqlite_local, 'idle', []))}
+    if _sqlite_writer is not None:
+        stats["writer"] = _sqlite_writer.stats()
+    return stats
 
 def init_db():
-    """Initialize database tables"""
+    """Initialize database tables by applying pending schema migrations (see app/migrations.py)"""
     with get_db() as conn:
-        cur = conn.cursor()
-        
-        # Users table for OAuth credentials
-        if get_db_type() == "postgres":
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    email TEXT PRIMARY KEY,
-                    credentials JSONB
-                )
-            """)
-        else:
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    email TEXT PRIMARY KEY,
-                    credentials TEXT
-                )
-            """)
-        
-        # User flags table
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS user_flags (
-                email TEXT,
-                flag_name TEXT,
-                flag_description TEXT,
-                flag_color TEXT,
-                is_active BOOLEAN DEFAULT FALSE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                PRIMARY KEY (email, flag_name),
-                FOREIGN KEY (email) REFERENCES users(email) ON DELETE CASCADE
-            )
-        """)
-        
-        # Flag history table
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS flag_history (
-                id SERIAL PRIMARY KEY,
-                email TEXT,
-                message_id TEXT,
-                flag_name TEXT,
-                action TEXT,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (email) REFERENCES users(email) ON DELETE CASCADE
-            )
-        """)
-        
-        # Gmail labels table
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS gmail_labels (
-                id SERIAL PRIMARY KEY,
-                email TEXT,
-                label_name TEXT,
-                label_id TEXT,
-                label_color TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                is_active BOOLEAN DEFAULT TRUE,
-                UNIQUE(email, label_name),
-                FOREIGN KEY (email) REFERENCES users(email) ON DELETE CASCADE
-            )
-        """)
-        
-        # Sorting sessions table
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS sorting_sessions (
-                id SERIAL PRIMARY KEY,
-                email TEXT,
-                session_id TEXT UNIQUE,
-                start_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                end_time TIMESTAMP,
-                status TEXT DEFAULT 'running',
-                total_emails INTEGER DEFAULT 0,
-                processed_emails INTEGER DEFAULT 0,
-                error_message TEXT,
-                flags_used TEXT,
-                FOREIGN KEY (email) REFERENCES users(email) ON DELETE CASCADE
-            )
-        """)
-        
-        # Email processing log table
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS email_processing_log (
-                id SERIAL PRIMARY KEY,
-                session_id TEXT,
-                email_id TEXT,
-                email_subject TEXT,
-                email_from TEXT,
-                assigned_label TEXT,
-                confidence_score REAL,
-                processing_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                status TEXT DEFAULT 'success',
-                error_details TEXT,
-                FOREIGN KEY (session_id) REFERENCES sorting_sessions(session_id) ON DELETE CASCADE
-            )
-        """)
-        
-        conn.commit() 
\ No newline at end of file
+        migrate(conn, get_db_type())
@@ -0,0 +1,97 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+import random
+import threading
+import time
+from typing import Dict, Optional, TextIO, Tuple
+
+from .config import get_settings
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+# Pass as extra= on high-volume per-email records so they are sampled and rate-limited
+PER_EMAIL = {'per_email': True}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+class PerEmailSampler(logging.Filter):
+    """
+    Sampling and rate limiting for records logged with extra=PER_EMAIL.
+
+    A sample_rate share of such records is kept, and each message template
+    (logger name + unformatted message) may emit at most max_per_second
+    records per second through a token bucket. Other records pass untouched.
+    """
+
+    def __init__(self, sample_rate: float, max_per_second: float):
+        super().__init__()
+        self.sample_rate = sample_rate
+        self.max_per_second = max_per_second
+        self.dropped = 0
+        self._buckets: Dict[Tuple[str, str], Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, 'per_email', False):
+            return True
+
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            self.dropped += 1
+            return False
+
+        key = (record.name, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(key, (self.max_per_second, now))
+            tokens = min(self.max_per_second, tokens + (now - last) * self.max_per_second)
+            if tokens < 1.0:
+                self._buckets[key] = (tokens, now)
+                self.dropped += 1
+                return False
+            self._buckets[key] = (tokens - 1.0, now)
+        return True
+
+def setup_logging(level: Optional[str] = None, stream: Optional[TextIO] = None) -> logging.handlers.QueueListener:
+    """
+    Route all logging through a queue so request and scoring code never block on output
+
+    Records are filtered and enqueued in the calling thread; a background
+    QueueListener thread formats and writes them to stderr. Safe to call more
+    than once - later calls only update the level.
+
+    Args:
+        level: Overrides settings.log_level
+        stream: Where records are written (default stderr)
+    """
+    global _listener
+    settings = get_settings()
+    root = logging.getLogger()
+    root.setLevel((level or settings.log_level).upper())
+
+    if _listener is not None:
+        return _listener
+
+    stream_handler = logging.StreamHandler(stream)
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(-1)
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(PerEmailSampler(settings.log_sample_rate, settings.log_per_email_rate_limit))
+
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+def stop_logging():
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
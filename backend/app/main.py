@@ -1,7 +1,15 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from app.logging_config import setup_logging
 from app.routers import auth, flags, email_sorting
-from app.database import init_db
+from app.async_database import async_db_stats, close_async_db
+from app.database import close_db_pool, db_pool_stats, init_db
+from app.queries import query_stats
+from app.services.log_retention import log_archiver
+from app.services.processing_log import processing_log
+
+# Non-blocking, leveled logging for every module logger
+setup_logging()
 
 app = FastAPI()
 
@@ -22,6 +30,28 @@ app.include_router(auth.router)
 app.include_router(flags.router)
 app.include_router(email_sorting.router)
 
+@app.on_event("startup")
+def start_log_archiver():
+    log_archiver.start()
+
+@app.on_event("shutdown")
+async def shutdown_db_pool():
+    log_archiver.stop()
+    # Buffered log rows go out before the connections close
+    processing_log.close()
+    await close_async_db()
+    close_db_pool()
+
+@app.get("/db/stats")
+def get_db_stats():
+    """Connection pool usage, per-query call counts and latency percentiles, and log retention runs"""
+    return {
+        "pool": db_pool_stats(),
+        "async_pool": async_db_stats(),
+        "queries": query_stats.stats(),
+        "log_retention": log_archiver.stats()
+    }
+
 @app.get("/")
 def read_root():
     return {"message": "Email Flag Agent API"} 
\ No newline at end of file
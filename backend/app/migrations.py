@@ -0,0 +1,387 @@
+"""
+Versioned schema migrations shared by init_db() and the Supabase scripts.
+
+Each migration has a version, a name and one function per dialect that runs
+its statements on a cursor. Applied versions are recorded in
+schema_migrations, so a database only runs migrations newer than its latest
+one. Statements are written to be idempotent (IF NOT EXISTS, guarded column
+additions): databases created before this table existed already have most of
+the schema, and rerunning a half-applied SQLite migration must be safe because
+SQLite DDL is not always part of the surrounding transaction.
+
+To change the schema, append a migration; never edit one that has shipped.
+"""
+import logging
+from datetime import date, datetime
+from typing import Callable, List, NamedTuple, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    postgres: Callable
+    sqlite: Callable
+
+def _create_tables(cur, credentials_type: str):
+    # Users table for OAuth credentials
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS users (
+            email TEXT PRIMARY KEY,
+            credentials {credentials_type}
+        )
+    """)
+
+    # User flags table
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS user_flags (
+            email TEXT,
+            flag_name TEXT,
+            flag_description TEXT,
+            flag_color TEXT,
+            is_active BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (email, flag_name),
+            FOREIGN KEY (email) REFERENCES users(email) ON DELETE CASCADE
+        )
+    """)
+
+    # Flag history table
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS flag_history (
+            id SERIAL PRIMARY KEY,
+            email TEXT,
+            message_id TEXT,
+            flag_name TEXT,
+            action TEXT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (email) REFERENCES users(email) ON DELETE CASCADE
+        )
+    """)
+
+    # Gmail labels table
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS gmail_labels (
+            id SERIAL PRIMARY KEY,
+            email TEXT,
+            label_name TEXT,
+            label_id TEXT,
+            label_color TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            is_active BOOLEAN DEFAULT TRUE,
+            UNIQUE(email, label_name),
+            FOREIGN KEY (email) REFERENCES users(email) ON DELETE CASCADE
+        )
+    """)
+
+    # Sorting sessions table
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS sorting_sessions (
+            id SERIAL PRIMARY KEY,
+            email TEXT,
+            session_id TEXT UNIQUE,
+            start_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            end_time TIMESTAMP,
+            status TEXT DEFAULT 'running',
+            total_emails INTEGER DEFAULT 0,
+            processed_emails INTEGER DEFAULT 0,
+            error_message TEXT,
+            flags_used TEXT,
+            profile TEXT,
+            FOREIGN KEY (email) REFERENCES users(email) ON DELETE CASCADE
+        )
+    """)
+
+    # Email processing log table
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS email_processing_log (
+            id SERIAL PRIMARY KEY,
+            session_id TEXT,
+            email_id TEXT,
+            email_subject TEXT,
+            email_from TEXT,
+            assigned_label TEXT,
+            confidence_score REAL,
+            processing_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            status TEXT DEFAULT 'success',
+            error_details TEXT,
+            cluster_id TEXT,
+            FOREIGN KEY (session_id) REFERENCES sorting_sessions(session_id) ON DELETE CASCADE
+        )
+    """)
+
+    # Per-user keyword and domain table overrides (see services/rule_tables.py)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS user_rule_tables (
+            email TEXT PRIMARY KEY,
+            category_keywords TEXT,
+            domain_categories TEXT,
+            content_hash TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (email) REFERENCES users(email) ON DELETE CASCADE
+        )
+    """)
+
+def _initial_schema_postgres(cur):
+    _create_tables(cur, "JSONB")
+
+def _initial_schema_sqlite(cur):
+    _create_tables(cur, "TEXT")
+
+# Columns added after their table was first created; present already in tables created by version 1
+LATE_COLUMNS = (
+    ("email_processing_log", "cluster_id", "TEXT"),
+    ("sorting_sessions", "profile", "TEXT"),
+)
+
+def _add_columns_postgres(cur, columns):
+    for table, column, column_type in columns:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {column_type}")
+
+def _add_columns_sqlite(cur, columns):
+    for table, column, column_type in columns:
+        cur.execute(f"PRAGMA table_info({table})")
+        if column not in [row[1] for row in cur.fetchall()]:
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+
+def _late_columns_postgres(cur):
+    _add_columns_postgres(cur, LATE_COLUMNS)
+
+def _late_columns_sqlite(cur):
+    _add_columns_sqlite(cur, LATE_COLUMNS)
+
+# Composite indexes for the router and service queries, named so EXPLAIN output can be checked
+HOT_QUERY_INDEXES = {
+    # Session details, undo and revert: WHERE session_id = ? [AND status = ...] ORDER BY processing_time
+    "idx_processing_log_session_time": "email_processing_log (session_id, processing_time)",
+    # Status and history: WHERE email = ? ORDER BY start_time DESC
+    "idx_sorting_sessions_email_start": "sorting_sessions (email, start_time)",
+    # Last completed session: WHERE email = ? AND status = 'completed' ORDER BY start_time DESC
+    "idx_sorting_sessions_email_status_start": "sorting_sessions (email, status, start_time)",
+    # Reverted-session check in sender cache and classifier training: WHERE email = ? AND flags_used = ?
+    "idx_sorting_sessions_email_flags": "sorting_sessions (email, flags_used)",
+    # Active flags: WHERE email = ? AND is_active
+    "idx_user_flags_email_active": "user_flags (email, is_active)",
+}
+
+def _hot_query_indexes(cur):
+    for name, target in HOT_QUERY_INDEXES.items():
+        cur.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target}")
+
+# email_processing_log is partitioned by month on Postgres; app/services/log_retention.py
+# creates upcoming partitions and archives and drops expired ones
+LOG_TABLE = "email_processing_log"
+LOG_PARTITION_PREFIX = f"{LOG_TABLE}_y"
+LOG_DEFAULT_PARTITION = f"{LOG_TABLE}_default"
+
+def month_start(value) -> date:
+    return date(value.year, value.month, 1)
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+def partition_name(month: date) -> str:
+    return f"{LOG_PARTITION_PREFIX}{month.year}m{month.month:02d}"
+
+def partition_month(name: str) -> Optional[date]:
+    """The month a partition covers, or None for the default partition and other tables"""
+    if not name.startswith(LOG_PARTITION_PREFIX):
+        return None
+    try:
+        year, month = name[len(LOG_PARTITION_PREFIX):].split("m")
+        return date(int(year), int(month), 1)
+    except ValueError:
+        return None
+
+def _regclass_exists(cur, name: str) -> bool:
+    cur.execute("SELECT to_regclass(%s) AS oid", (name,))
+    row = cur.fetchone()
+    return (row["oid"] if isinstance(row, dict) else row[0]) is not None
+
+def create_log_partition(cur, month: date):
+    """
+    Create the partition for a month unless it exists
+
+    Postgres refuses to create it while the default partition holds rows for
+    that month (logged while the partition was missing), so those rows are
+    moved out first and inserted back once it exists. Runs in the caller's
+    transaction, so a failure rolls the move back with it.
+    """
+    name = partition_name(month)
+    if _regclass_exists(cur, name):
+        return
+    bounds = (month.isoformat(), add_months(month, 1).isoformat())
+
+    stranded = False
+    if _regclass_exists(cur, LOG_DEFAULT_PARTITION):
+        cur.execute(f"""
+            SELECT 1 FROM {LOG_DEFAULT_PARTITION} WHERE processing_time >= %s AND processing_time < %s LIMIT 1
+        """, bounds)
+        stranded = cur.fetchone() is not None
+    if stranded:
+        # Writers wait until the partition exists, so no row can slip in between the copy and the delete
+        cur.execute(f"LOCK TABLE {LOG_DEFAULT_PARTITION} IN EXCLUSIVE MODE")
+        cur.execute(f"""
+            CREATE TEMP TABLE stranded_log_rows AS
+            SELECT * FROM {LOG_DEFAULT_PARTITION} WHERE processing_time >= %s AND processing_time < %s
+        """, bounds)
+        cur.execute(f"DELETE FROM {LOG_DEFAULT_PARTITION} WHERE processing_time >= %s AND processing_time < %s", bounds)
+
+    cur.execute(f"""
+        CREATE TABLE {name} PARTITION OF {LOG_TABLE}
+        FOR VALUES FROM ('{bounds[0]}') TO ('{bounds[1]}')
+    """)
+    if stranded:
+        cur.execute(f"INSERT INTO {LOG_TABLE} SELECT * FROM stranded_log_rows")
+        cur.execute("DROP TABLE stranded_log_rows")
+
+def _partition_processing_log_postgres(cur):
+    cur.execute("SELECT relkind FROM pg_class WHERE relname = %s AND relnamespace = 'public'::regnamespace", (LOG_TABLE,))
+    row = cur.fetchone()
+    if row and (row["relkind"] if isinstance(row, dict) else row[0]) == "p":
+        return
+    # The existing table's index, key and sequence keep their names, so move them out of the way
+    cur.execute(f"ALTER TABLE {LOG_TABLE} RENAME TO {LOG_TABLE}_unpartitioned")
+    cur.execute("ALTER INDEX IF EXISTS idx_processing_log_session_time RENAME TO idx_processing_log_session_time_unpartitioned")
+    cur.execute("SELECT 1 FROM pg_constraint WHERE conname = %s", (f"{LOG_TABLE}_pkey",))
+    if cur.fetchone():
+        cur.execute(f"ALTER TABLE {LOG_TABLE}_unpartitioned RENAME CONSTRAINT {LOG_TABLE}_pkey TO {LOG_TABLE}_unpartitioned_pkey")
+    # The partition key must be part of the primary key
+    cur.execute(f"""
+        CREATE TABLE {LOG_TABLE} (
+            id BIGINT NOT NULL DEFAULT nextval('{LOG_TABLE}_id_seq'),
+            session_id TEXT,
+            email_id TEXT,
+            email_subject TEXT,
+            email_from TEXT,
+            assigned_label TEXT,
+            confidence_score REAL,
+            processing_time TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            status TEXT DEFAULT 'success',
+            error_details TEXT,
+            cluster_id TEXT,
+            PRIMARY KEY (id, processing_time),
+            FOREIGN KEY (session_id) REFERENCES sorting_sessions(session_id) ON DELETE CASCADE
+        ) PARTITION BY RANGE (processing_time)
+    """)
+    cur.execute(f"CREATE INDEX idx_processing_log_session_time ON {LOG_TABLE} (session_id, processing_time)")
+    # Rows outside every monthly partition land here instead of failing
+    cur.execute(f"CREATE TABLE {LOG_DEFAULT_PARTITION} PARTITION OF {LOG_TABLE} DEFAULT")
+
+    cur.execute(f"SELECT MIN(processing_time) AS oldest FROM {LOG_TABLE}_unpartitioned")
+    row = cur.fetchone()
+    oldest = row["oldest"] if isinstance(row, dict) else row[0]
+    month = month_start(oldest or datetime.utcnow())
+    # The current month and the next; the archiver keeps creating them ahead from here on
+    last = add_months(month_start(datetime.utcnow()), 1)
+    while month <= last:
+        create_log_partition(cur, month)
+        month = add_months(month, 1)
+
+    columns = "id, session_id, email_id, email_subject, email_from, assigned_label, confidence_score, status, error_details, cluster_id"
+    cur.execute(f"""
+        INSERT INTO {LOG_TABLE} ({columns}, processing_time)
+        SELECT {columns}, COALESCE(processing_time, CURRENT_TIMESTAMP) FROM {LOG_TABLE}_unpartitioned
+    """)
+    cur.execute(f"ALTER SEQUENCE {LOG_TABLE}_id_seq OWNED BY {LOG_TABLE}.id")
+    cur.execute(f"DROP TABLE {LOG_TABLE}_unpartitioned")
+
+def _processing_log_time_index_sqlite(cur):
+    # SQLite has no partitioning; the archiver removes expired rows from the hot table by time range
+    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_processing_log_time ON {LOG_TABLE} (processing_time)")
+
+# Keyset pagination orders by (time, id). SQLite indexes end in rowid already, so only Postgres needs these
+KEYSET_INDEXES = {
+    "idx_processing_log_session_time_id": f"{LOG_TABLE} (session_id, processing_time, id)",
+    "idx_sorting_sessions_email_start_id": "sorting_sessions (email, start_time, id)",
+}
+
+def _keyset_indexes_postgres(cur):
+    for name, target in KEYSET_INDEXES.items():
+        cur.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target}")
+
+def _keyset_indexes_sqlite(cur):
+    pass
+
+# Which local step or Gemini decided each logged row; NULL for rows logged before it was recorded
+DECISION_SOURCE_COLUMNS = (
+    ("email_processing_log", "decision_source", "TEXT"),
+)
+
+def _decision_source_postgres(cur):
+    _add_columns_postgres(cur, DECISION_SOURCE_COLUMNS)
+
+def _decision_source_sqlite(cur):
+    _add_columns_sqlite(cur, DECISION_SOURCE_COLUMNS)
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "initial_schema", _initial_schema_postgres, _initial_schema_sqlite),
+    Migration(2, "late_columns", _late_columns_postgres, _late_columns_sqlite),
+    Migration(3, "hot_query_indexes", _hot_query_indexes, _hot_query_indexes),
+    Migration(4, "processing_log_retention", _partition_processing_log_postgres, _processing_log_time_index_sqlite),
+    Migration(5, "keyset_pagination_indexes", _keyset_indexes_postgres, _keyset_indexes_sqlite),
+    Migration(6, "processing_log_decision_source", _decision_source_postgres, _decision_source_sqlite),
+]
+
+# Key for the Postgres advisory lock that serializes concurrent migrators
+MIGRATION_LOCK_KEY = 7350412
+
+def applied_versions(conn) -> Set[int]:
+    """Versions recorded in schema_migrations, creating the table if needed"""
+    cur = conn.cursor()
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.commit()
+    cur.execute("SELECT version FROM schema_migrations")
+    # Pooled Postgres connections return dict rows
+    return {row["version"] if isinstance(row, dict) else row[0] for row in cur.fetchall()}
+
+def migrate(conn, dialect: str) -> List[int]:
+    """
+    Apply pending migrations in version order, each in its own transaction
+
+    Args:
+        conn: Open psycopg2 or sqlite3 connection
+        dialect: "postgres" or "sqlite"
+
+    Returns:
+        Versions applied by this call
+    """
+    applied = applied_versions(conn)
+    placeholder = "%s" if dialect == "postgres" else "?"
+    newly_applied = []
+
+    for migration in MIGRATIONS:
+        if migration.version in applied:
+            continue
+        cur = conn.cursor()
+        if dialect == "postgres":
+            # Another process may have applied it while this one waited for the lock
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_KEY,))
+            cur.execute("SELECT 1 FROM schema_migrations WHERE version = %s", (migration.version,))
+            if cur.fetchone():
+                conn.commit()
+                continue
+            migration.postgres(cur)
+        else:
+            migration.sqlite(cur)
+        cur.execute(
+            f"INSERT INTO schema_migrations (version, name) VALUES ({placeholder}, {placeholder})",
+            (migration.version, migration.name)
+        )
+        conn.commit()
+        newly_applied.append(migration.version)
+        logger.info("Applied schema migration %d (%s)", migration.version, migration.name)
+
+    return newly_applied
+
+def latest_version() -> int:
+    return MIGRATIONS[-1].version
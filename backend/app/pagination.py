@@ -0,0 +1,36 @@
+"""
+Opaque cursors for keyset pagination.
+
+A page is fetched with limit + 1 rows. If the extra row is there, the page
+has a next_cursor: the (time, row_id) sort key of its last row, as URL-safe
+base64 JSON. The next page's query asks for rows below that key, so it costs
+the same however deep it is and is not thrown off by rows added meanwhile.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Sequence, Tuple
+
+def encode_cursor(sort_time: Any, row_id: int) -> str:
+    # Postgres returns datetimes; SQLite returns the stored text, which must come back unchanged
+    value = sort_time.isoformat() if isinstance(sort_time, datetime) else sort_time
+    return base64.urlsafe_b64encode(json.dumps([value, row_id]).encode()).decode()
+
+def decode_cursor(cursor: str, dialect: str) -> Tuple[Any, int]:
+    """The (time, row_id) key in a cursor, with the time typed for the dialect; ValueError if malformed"""
+    try:
+        value, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(value, str) or not isinstance(row_id, int):
+        raise ValueError("Invalid cursor")
+    return (datetime.fromisoformat(value) if dialect == "postgres" else value), row_id
+
+def split_page(rows: Sequence, limit: int, time_column: str) -> Tuple[List, Optional[str]]:
+    """The first limit rows of a limit + 1 fetch, and the cursor for the page after them"""
+    page = list(rows[:limit])
+    if len(rows) <= limit:
+        return page, None
+    last = page[-1]
+    return page, encode_cursor(last[time_column], last["row_id"])
@@ -0,0 +1,336 @@
+"""
+Named SQL statements used by the routers and services.
+
+Each statement is written once with ? placeholders and rendered for both
+dialects at import: $1, $2, ... for asyncpg and unchanged for SQLite. Pass a
+Query wherever app.async_database takes SQL text:
+
+    row = await fetch_one(queries.USER_BY_EMAIL, (email,))
+
+Code on worker threads runs them through app.database.execute_query, which
+uses a %s rendering for psycopg2:
+
+    with get_db() as db:
+        execute_query(db.cursor(), queries.USER_RULE_TABLES, (email,))
+
+On each pooled async connection, the drivers' statement caches prepare a
+statement the first time it runs and reuse it after that. Postgres keeps
+server-side prepared statements with cached plans, and sqlite3 keeps compiled
+statements (on the sync connections too). Both caches are sized by
+db_statement_cache_size. Every call to a named statement is timed into
+query_stats, whichever layer runs it.
+
+Both dialects share the SQL below (SQLite 3.24+ has ON CONFLICT ... DO UPDATE
+and TRUE). A statement that cannot be shared takes postgres= / sqlite= overrides.
+"""
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Deque, Dict, Iterator, Optional, Union
+
+from .config import get_settings
+
+# String literals are skipped so a '?' inside quotes is left alone
+_PLACEHOLDER = re.compile(r"'(?:[^']|'')*'|%s|\?")
+_PYFORMAT_TOKEN = re.compile(r"'(?:[^']|'')*'|%s|\?|%")
+
+@lru_cache(maxsize=1024)
+def to_asyncpg(sql: str) -> str:
+    """Rewrite %s / ? placeholders to asyncpg's numbered $n form"""
+    count = 0
+
+    def number(match):
+        nonlocal count
+        if match.group(0).startswith("'"):
+            return match.group(0)
+        count += 1
+        return f"${count}"
+
+    return _PLACEHOLDER.sub(number, sql)
+
+@lru_cache(maxsize=1024)
+def to_pyformat(sql: str) -> str:
+    """Rewrite ? placeholders to psycopg2's %s, escaping any other % (psycopg2 formats the whole string)"""
+    def convert(match):
+        token = match.group(0)
+        if token.startswith("'"):
+            return token.replace("%", "%%")
+        return "%s" if token in ("?", "%s") else "%%"
+
+    return _PYFORMAT_TOKEN.sub(convert, sql)
+
+@dataclass(frozen=True)
+class Query:
+    name: str
+    postgres: str
+    sqlite: str
+    psycopg: str
+
+    def sql(self, dialect: str) -> str:
+        return self.postgres if dialect == "postgres" else self.sqlite
+
+    def sync_sql(self, dialect: str) -> str:
+        """The text for app.database's psycopg2 / sqlite3 connections"""
+        return self.psycopg if dialect == "postgres" else self.sqlite
+
+QUERIES: Dict[str, Query] = {}
+
+def with_row_id(sql: str) -> Dict[str, str]:
+    """Per-dialect SQL for {row_id}: the id column on Postgres, rowid on SQLite (whose SERIAL id stays NULL)"""
+    return {"postgres": sql.format(row_id="id"), "sqlite": sql.format(row_id="rowid")}
+
+def define(name: str, sql: Optional[str] = None, postgres: Optional[str] = None,
+           sqlite: Optional[str] = None) -> Query:
+    """Register a named statement, rendered for both dialects"""
+    if name in QUERIES:
+        raise ValueError(f"Query '{name}' is defined twice")
+    query = Query(name, to_asyncpg(postgres or sql), sqlite or sql, to_pyformat(postgres or sql))
+    QUERIES[name] = query
+    return query
+
+# SQL text or a named statement; only named statements are timed
+QueryText = Union[str, Query]
+
+class QueryStats:
+    """Call count, errors and recent latency of each named statement"""
+
+    def __init__(self, window_size: int = 500):
+        self.window_size = window_size
+        self._calls: Dict[str, int] = {}
+        self._errors: Dict[str, int] = {}
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float, ok: bool = True):
+        with self._lock:
+            self._calls[name] = self._calls.get(name, 0) + 1
+            if not ok:
+                self._errors[name] = self._errors.get(name, 0) + 1
+            latencies = self._latencies.get(name)
+            if latencies is None:
+                latencies = self._latencies[name] = deque(maxlen=self.window_size)
+            latencies.append(seconds)
+
+    @contextmanager
+    def measure(self, query: QueryText) -> Iterator[None]:
+        if not isinstance(query, Query):
+            yield
+            return
+        start = time.perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self.record(query.name, time.perf_counter() - start, ok)
+
+    def reset(self):
+        with self._lock:
+            self._calls.clear()
+            self._errors.clear()
+            self._latencies.clear()
+
+    def stats(self) -> Dict[str, Dict]:
+        """Per statement: calls, errors and latency percentiles (ms) over the last window_size calls"""
+        with self._lock:
+            snapshot = {name: (calls, self._errors.get(name, 0), sorted(self._latencies[name]))
+                        for name, calls in self._calls.items()}
+        return {name: {"calls": calls, "errors": errors, **_latency_summary(latencies)}
+                for name, (calls, errors, latencies) in sorted(snapshot.items())}
+
+def _latency_summary(latencies) -> Dict[str, float]:
+    def percentile(fraction: float) -> float:
+        return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] * 1000
+
+    return {
+        "mean_ms": sum(latencies) / len(latencies) * 1000,
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+        "max_ms": latencies[-1] * 1000
+    }
+
+query_stats = QueryStats(get_settings().query_stats_window)
+
+# Users
+USER_BY_EMAIL = define("user_by_email", "SELECT email, credentials FROM users WHERE email = ?")
+ANY_USER = define("any_user", "SELECT email, credentials FROM users LIMIT 1")
+UPSERT_USER = define("upsert_user", """
+    INSERT INTO users (email, credentials) VALUES (?, ?)
+    ON CONFLICT (email) DO UPDATE SET credentials = EXCLUDED.credentials
+""")
+CLEAR_CREDENTIALS = define("clear_credentials", "UPDATE users SET credentials = NULL WHERE credentials IS NOT NULL")
+DELETE_ALL_FLAG_HISTORY = define("delete_all_flag_history", "DELETE FROM flag_history")
+DELETE_ALL_USER_FLAGS = define("delete_all_user_flags", "DELETE FROM user_flags")
+DELETE_ALL_USERS = define("delete_all_users", "DELETE FROM users")
+
+# Flags
+USER_FLAGS = define("user_flags", """
+    SELECT flag_name, flag_description, flag_color, is_active
+    FROM user_flags
+    WHERE email = ?
+    ORDER BY flag_name
+""")
+ACTIVE_USER_FLAGS = define("active_user_flags", """
+    SELECT flag_name, flag_description, flag_color, is_active
+    FROM user_flags
+    WHERE email = ? AND is_active = TRUE
+""")
+DELETE_USER_FLAGS = define("delete_user_flags", "DELETE FROM user_flags WHERE email = ?")
+INSERT_USER_FLAG = define("insert_user_flag", """
+    INSERT INTO user_flags (email, flag_name, flag_description, flag_color, is_active)
+    VALUES (?, ?, ?, ?, ?)
+""")
+
+# Gmail labels
+GMAIL_LABELS = define("gmail_labels", "SELECT label_name, label_id FROM gmail_labels WHERE email = ?")
+UPSERT_GMAIL_LABEL = define("upsert_gmail_label", """
+    INSERT INTO gmail_labels (email, label_name, label_id, label_color, updated_at)
+    VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+    ON CONFLICT (email, label_name) DO UPDATE SET
+        label_id = EXCLUDED.label_id,
+        label_color = EXCLUDED.label_color,
+        updated_at = CURRENT_TIMESTAMP
+""")
+DELETE_GMAIL_LABEL = define("delete_gmail_label", "DELETE FROM gmail_labels WHERE email = ? AND label_name = ?")
+
+# Sorting sessions
+INSERT_SORTING_SESSION = define("insert_sorting_session", """
+    INSERT INTO sorting_sessions (session_id, email, flags_used, status)
+    VALUES (?, ?, ?, ?)
+""")
+INSERT_FINISHED_SESSION = define("insert_finished_session", """
+    INSERT INTO sorting_sessions (session_id, email, flags_used, status, processed_emails, total_emails)
+    VALUES (?, ?, ?, ?, ?, ?)
+""")
+LATEST_SESSION = define("latest_session", """
+    SELECT session_id, status, start_time, end_time,
+           total_emails, processed_emails, error_message
+    FROM sorting_sessions
+    WHERE email = ?
+    ORDER BY start_time DESC
+    LIMIT 1
+""")
+# History and session details are paged by keyset, newest first: the next page starts below the
+# (time, row_id) of the last row returned, so no page reads the rows before it
+SESSION_HISTORY = define("session_history", **with_row_id("""
+    SELECT {row_id} AS row_id, session_id, status, start_time, end_time,
+           total_emails, processed_emails, error_message, flags_used
+    FROM sorting_sessions
+    WHERE email = ?
+    ORDER BY start_time DESC, {row_id} DESC
+    LIMIT ?
+"""))
+SESSION_HISTORY_AFTER = define("session_history_after", **with_row_id("""
+    SELECT {row_id} AS row_id, session_id, status, start_time, end_time,
+           total_emails, processed_emails, error_message, flags_used
+    FROM sorting_sessions
+    WHERE email = ? AND (start_time, {row_id}) < (?, ?)
+    ORDER BY start_time DESC, {row_id} DESC
+    LIMIT ?
+"""))
+LAST_COMPLETED_SESSION = define("last_completed_session", """
+    SELECT session_id, flags_used
+    FROM sorting_sessions
+    WHERE email = ? AND status = 'completed'
+    ORDER BY start_time DESC
+    LIMIT 1
+""")
+SESSION_PROFILE = define("session_profile", "SELECT profile FROM sorting_sessions WHERE session_id = ?")
+
+# Processing log
+SESSION_LOG_PAGE = define("session_log_page", **with_row_id("""
+    SELECT {row_id} AS row_id, email_id, email_subject, email_from, assigned_label,
+           confidence_score, processing_time, status, error_details, cluster_id
+    FROM email_processing_log
+    WHERE session_id = ?
+    ORDER BY processing_time DESC, {row_id} DESC
+    LIMIT ?
+"""))
+SESSION_LOG_PAGE_AFTER = define("session_log_page_after", **with_row_id("""
+    SELECT {row_id} AS row_id, email_id, email_subject, email_from, assigned_label,
+           confidence_score, processing_time, status, error_details, cluster_id
+    FROM email_processing_log
+    WHERE session_id = ? AND (processing_time, {row_id}) < (?, ?)
+    ORDER BY processing_time DESC, {row_id} DESC
+    LIMIT ?
+"""))
+# Whole log of a session, oldest first, for streamed exports
+SESSION_LOG_EXPORT = define("session_log_export", **with_row_id("""
+    SELECT email_id, email_subject, email_from, assigned_label,
+           confidence_score, processing_time, status, error_details, cluster_id
+    FROM email_processing_log
+    WHERE session_id = ?
+    ORDER BY processing_time, {row_id}
+"""))
+REVERTIBLE_EMAILS = define("revertible_emails", """
+    SELECT email_id, assigned_label
+    FROM email_processing_log
+    WHERE session_id = ? AND status = 'success' AND assigned_label IS NOT NULL
+""")
+# On Postgres, psycopg2's execute_values expands VALUES %s into one multi-row INSERT;
+# SQLite runs the single-row statement once per row
+INSERT_PROCESSING_LOG = define(
+    "insert_processing_log",
+    postgres="""
+        INSERT INTO email_processing_log (session_id, email_id, email_subject, email_from, assigned_label,
+                                          confidence_score, status, error_details, cluster_id, decision_source)
+        VALUES %s
+    """,
+    sqlite="""
+        INSERT INTO email_processing_log (session_id, email_id, email_subject, email_from, assigned_label,
+                                          confidence_score, status, error_details, cluster_id, decision_source)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """
+)
+# Reverted sessions are left out of everything learned from the log, since the user undid them
+SENDER_HISTORY = define("sender_history", """
+    SELECT l.email_from, l.assigned_label, l.confidence_score, l.status
+    FROM email_processing_log l
+    JOIN sorting_sessions s ON s.session_id = l.session_id
+    WHERE s.email = ?
+      AND l.status IN ('success', 'skipped')
+      AND NOT EXISTS (
+          SELECT 1 FROM sorting_sessions r
+          WHERE r.email = s.email AND r.flags_used = 'REVERT:' || s.session_id
+      )
+    ORDER BY l.processing_time DESC
+    LIMIT ?
+""")
+# Skipped emails are kept as "no flag" examples. Labels chosen by the sender memo or the
+# classifier itself are left out, so the classifier does not learn its own decisions back
+CLASSIFIER_TRAINING_ROWS = define("classifier_training_rows", **with_row_id("""
+    SELECT l.{row_id} AS id, l.email_subject, l.email_from, l.assigned_label, l.confidence_score, l.status
+    FROM email_processing_log l
+    JOIN sorting_sessions s ON s.session_id = l.session_id
+    WHERE s.email = ?
+      AND ((l.status = 'success' AND l.assigned_label IS NOT NULL) OR l.status = 'skipped')
+      AND COALESCE(l.decision_source, '') NOT IN ('sender', 'classifier')
+      AND l.{row_id} > ?
+      AND NOT EXISTS (
+          SELECT 1 FROM sorting_sessions r
+          WHERE r.email = s.email AND r.flags_used = 'REVERT:' || s.session_id
+      )
+    ORDER BY l.{row_id}
+"""))
+
+# Rule tables
+USER_RULE_TABLES = define("user_rule_tables", """
+    SELECT category_keywords, domain_categories
+    FROM user_rule_tables
+    WHERE email = ?
+""")
+UPSERT_USER_RULE_TABLES = define("upsert_user_rule_tables", """
+    INSERT INTO user_rule_tables (email, category_keywords, domain_categories, content_hash, updated_at)
+    VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+    ON CONFLICT (email) DO UPDATE SET
+        category_keywords = EXCLUDED.category_keywords,
+        domain_categories = EXCLUDED.domain_categories,
+        content_hash = EXCLUDED.content_hash,
+        updated_at = CURRENT_TIMESTAMP
+""")
+DELETE_USER_RULE_TABLES = define("delete_user_rule_tables", "DELETE FROM user_rule_tables WHERE email = ?")
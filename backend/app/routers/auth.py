@@ -4,11 +4,15 @@ from google_auth_oauthlib.flow import Flow
 from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
 import json
+import logging
 import os
 from typing import Optional
-from ..database import get_db, get_db_type
+from .. import queries
+from ..async_database import execute, fetch_one, transaction
 from ..models import User
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/auth", tags=["auth"])
 
 # Load client secrets from the downloaded OAuth 2.0 credentials
@@ -68,49 +72,28 @@ async def callback(request: Request):
         user = User(email=email, credentials=credentials_to_dict(credentials))
         
         try:
-            with get_db() as db:
-                cursor = db.cursor()
-                
-                if get_db_type() == "postgres":
-                    # PostgreSQL syntax
-                    cursor.execute(
-                        "INSERT INTO users (email, credentials) VALUES (%s, %s) ON CONFLICT (email) DO UPDATE SET credentials = EXCLUDED.credentials",
-                        (user.email, json.dumps(user.credentials))
-                    )
-                else:
-                    # SQLite syntax
-                    cursor.execute(
-                        "INSERT OR REPLACE INTO users (email, credentials) VALUES (?, ?)",
-                        (user.email, json.dumps(user.credentials))
-                    )
-                db.commit()
+            await execute(queries.UPSERT_USER, (user.email, json.dumps(user.credentials)))
         except Exception as db_error:
-            print(f"Database error: {str(db_error)}")
+            logger.error("Database error: %s", db_error)
             raise HTTPException(
                 status_code=500,
                 detail="Failed to save credentials. Please try again."
             )
         
         # Verify the data was saved
-        with get_db() as db:
-            cursor = db.cursor()
-            if get_db_type() == "postgres":
-                cursor.execute("SELECT * FROM users WHERE email = %s", (user.email,))
-            else:
-                cursor.execute("SELECT * FROM users WHERE email = ?", (user.email,))
-            saved_user = cursor.fetchone()
-            
-            if not saved_user:
-                raise HTTPException(
-                    status_code=500,
-                    detail="Failed to verify saved credentials. Please try again."
-                )
+        saved_user = await fetch_one(queries.USER_BY_EMAIL, (user.email,))
+        
+        if not saved_user:
+            raise HTTPException(
+                status_code=500,
+                detail="Failed to verify saved credentials. Please try again."
+            )
         
         # Redirect to frontend with success parameter
         return RedirectResponse("http://localhost:8080?auth=success")
     except Exception as e:
         error_message = str(e)
-        print(f"Auth callback error: {error_message}")
+        logger.error("Auth callback error: %s", error_message)
         # Redirect to frontend with error parameter
         return RedirectResponse(f"http://localhost:8080?error={error_message}")
 
@@ -118,17 +101,14 @@ async def callback(request: Request):
 async def get_status():
     """Check if user is connected to Gmail"""
     try:
-        with get_db() as db:
-            cursor = db.cursor()
-            cursor.execute("SELECT email, credentials FROM users LIMIT 1")
-            user = cursor.fetchone()
-            
-            if user and user['credentials']:
-                return {
-                    "is_connected": True,
-                    "email": user['email']
-                }
-            return {"is_connected": False}
+        user = await fetch_one(queries.ANY_USER)
+        
+        if user and user['credentials']:
+            return {
+                "is_connected": True,
+                "email": user['email']
+            }
+        return {"is_connected": False}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -136,15 +116,8 @@ async def get_status():
 async def logout():
     """Disconnect from Gmail but preserve user data"""
     try:
-        with get_db() as db:
-            cursor = db.cursor()
-            # Only remove credentials but keep the user record and their flag configurations
-            cursor.execute("""
-                UPDATE users 
-                SET credentials = NULL 
-                WHERE credentials IS NOT NULL
-            """)
-            db.commit()
+        # Only remove credentials but keep the user record and their flag configurations
+        await execute(queries.CLEAR_CREDENTIALS)
         return {"message": "Successfully disconnected while preserving your settings"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -153,13 +126,11 @@ async def logout():
 async def reset():
     """Clear all user data including flags and history"""
     try:
-        with get_db() as db:
-            cursor = db.cursor()
+        async with transaction() as db:
             # Delete all user data
-            cursor.execute("DELETE FROM flag_history")
-            cursor.execute("DELETE FROM user_flags")
-            cursor.execute("DELETE FROM users")
-            db.commit()
+            await db.execute(queries.DELETE_ALL_FLAG_HISTORY)
+            await db.execute(queries.DELETE_ALL_USER_FLAGS)
+            await db.execute(queries.DELETE_ALL_USERS)
         return {"message": "Successfully cleared all data"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -168,13 +139,7 @@ async def reset():
 async def clear_credentials():
     """Clear invalid credentials to allow re-authentication"""
     try:
-        with get_db() as db:
-            cursor = db.cursor()
-            if get_db_type() == "postgres":
-                cursor.execute("UPDATE users SET credentials = NULL WHERE credentials IS NOT NULL")
-            else:
-                cursor.execute("UPDATE users SET credentials = NULL WHERE credentials IS NOT NULL")
-            db.commit()
+        await execute(queries.CLEAR_CREDENTIALS)
         return {"message": "Credentials cleared. Please authenticate again."}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
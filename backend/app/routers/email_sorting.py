@@ -1,55 +1,91 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks
-from typing import Dict, Any, List
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Request
+from fastapi.responses import StreamingResponse
+from typing import Dict, Any, AsyncIterator, List, Awaitable, Optional, Tuple, TypeVar
 import asyncio
-from ..database import get_db, get_db_type
+import csv
+import io
+import json
+import logging
+from .. import queries
+from ..async_database import execute, fetch_all, fetch_one, stream
+from ..database import get_db_type
+from ..pagination import decode_cursor, split_page
 from ..services.gmail import GmailService
-from ..services.email_categorization import EmailCategorizationService
+from ..services.email_categorization import EmailCategorizationService, SOURCE_GEMINI, SOURCE_SENDER
+from ..services.near_duplicates import cluster_near_duplicates
+from ..services.rule_tables import load_user_rules
+from ..services.scoring_profile import profiling, session_profiles
+from ..services.session_progress import session_progress
+from ..logging_config import PER_EMAIL
 from ..models import User
 import uuid
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/sorting", tags=["email_sorting"])
 
 gmail_service = GmailService()
 categorization_service = EmailCategorizationService()
 
+# How often a pending AI request checks whether its HTTP client is still connected
+DISCONNECT_POLL_INTERVAL = 0.5
+
+# Fields of a processing log entry in session details and exports
+DETAIL_FIELDS = (
+    "email_id", "email_subject", "email_from", "assigned_label", "confidence_score",
+    "processing_time", "status", "error_details", "cluster_id"
+)
+
+# Export format -> media type
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+# Lines sent per chunk of a streamed export
+EXPORT_CHUNK_LINES = 500
+
+T = TypeVar("T")
+
+async def run_until_disconnected(request: Request, awaitable: Awaitable[T]) -> T:
+    """Await a long-running call, cancelling it if the HTTP client goes away first"""
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                raise HTTPException(status_code=499, detail="Client disconnected")
+    finally:
+        if not task.done():
+            task.cancel()
+
 async def get_user_by_email(email: str) -> User:
     """Get user from database by email"""
     try:
-        with get_db() as db:
-            cursor = db.cursor()
-            if get_db_type() == "postgres":
-                cursor.execute("SELECT email, credentials FROM users WHERE email = %s", (email,))
+        row = await fetch_one(queries.USER_BY_EMAIL, (email,))
+        
+        if row and row['credentials']:
+            credentials_val = row['credentials']
+            # JSONB may come back already decoded
+            if isinstance(credentials_val, dict):
+                credentials_dict = credentials_val
             else:
-                cursor.execute("SELECT email, credentials FROM users WHERE email = ?", (email,))
-            row = cursor.fetchone()
+                credentials_dict = json.loads(credentials_val)
             
-            if row:
-                # Handle different cursor types
-                if hasattr(row, 'keys'):  # RealDictCursor (PostgreSQL)
-                    email_val = row['email']
-                    credentials_val = row['credentials']
-                else:  # Regular cursor (SQLite)
-                    email_val = row[0]
-                    credentials_val = row[1]
-                
-                if credentials_val:
-                    # For PostgreSQL, credentials might already be a dict
-                    if isinstance(credentials_val, dict):
-                        credentials_dict = credentials_val
-                    else:
-                        import json
-                        credentials_dict = json.loads(credentials_val)
-                    
-                    return User(email=email_val, credentials=credentials_dict)
+            return User(email=row['email'], credentials=credentials_dict)
         return None
     except Exception as e:
-        print(f"Error getting user by email: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error getting user by email: %s", e)
         return None
 
-async def perform_email_sorting(email: str, active_flag_names: List[str]):
-    """Background task to perform the actual email sorting"""
+async def perform_email_sorting(email: str, active_flag_names: List[str], max_labels: Optional[int] = None,
+                                profile: bool = False):
+    """
+    Background task to perform the actual email sorting
+    
+    max_labels overrides settings.sorting_max_labels (1 = best flag only, k = top k, 0 = all above the threshold).
+    profile records per-stage scoring times for /sorting/session/{session_id}/profile.
+    """
     try:
         # Get user and build Gmail service
         user = await get_user_by_email(email)
@@ -66,29 +102,16 @@ async def perform_email_sorting(email: str, active_flag_names: List[str]):
             return
         
         # Get user flags for categorization
-        with get_db() as db:
-            cursor = db.cursor()
-            if get_db_type() == "postgres":
-                cursor.execute("""
-                    SELECT flag_name, flag_description, flag_color, is_active
-                    FROM user_flags 
-                    WHERE email = %s AND is_active = true
-                """, (email,))
-            else:
-                cursor.execute("""
-                    SELECT flag_name, flag_description, flag_color, is_active
-                    FROM user_flags 
-                    WHERE email = ? AND is_active = 1
-                """, (email,))
-            
-            user_flags = []
-            for row in cursor.fetchall():
-                user_flags.append({
-                    "name": row["flag_name"],
-                    "description": row["flag_description"],
-                    "color": row["flag_color"],
-                    "isActive": bool(row["is_active"])
-                })
+        rows = await fetch_all(queries.ACTIVE_USER_FLAGS, (email,))
+        
+        user_flags = []
+        for row in rows:
+            user_flags.append({
+                "name": row["flag_name"],
+                "description": row["flag_description"],
+                "color": row["flag_color"],
+                "isActive": bool(row["is_active"])
+            })
         
         if not user_flags:
             await categorization_service.update_sorting_session(
@@ -98,6 +121,14 @@ async def perform_email_sorting(email: str, active_flag_names: List[str]):
             )
             return
         
+        # The user's keyword tables, compiled once per distinct configuration
+        rules = await asyncio.to_thread(load_user_rules, email)
+        
+        settings = categorization_service.settings
+        session_profile = None
+        if profile or settings.scoring_profile_enabled:
+            session_profile = session_profiles.start(session_id, settings.scoring_profile_slowest_emails)
+        
         # Verify/create Gmail labels
         label_mapping = await gmail_service.verify_labels_exist(service, email, active_flag_names)
         if not label_mapping:
@@ -108,10 +139,17 @@ async def perform_email_sorting(email: str, active_flag_names: List[str]):
             )
             return
         
-        # Get recent emails to sort
-        emails = await gmail_service.get_recent_emails(service, max_results=100)
+        # Memoized sender decisions and the learned classifier, read from the database and disk off the event loop
+        models = await categorization_service.load_user_models(email, user_flags)
+        
+        # Get recent emails to sort; bodies are skipped for senders with a memoized decision.
+        # Checking costs a metadata call per email, so it is only done when there are decisions
+        needs_body = None
+        if models.decisions.senders or models.decisions.domains:
+            needs_body = lambda item: not categorization_service.lookup_sender_decision(email, item, user_flags, models)[0]
+        emails = await gmail_service.get_recent_emails(service, max_results=100, needs_body=needs_body)
         total_emails = len(emails)
-        print(f"Found {total_emails} emails to process")
+        logger.info("Found %s emails to process", total_emails)
         
         await categorization_service.update_sorting_session(
             session_id, 
@@ -119,7 +157,7 @@ async def perform_email_sorting(email: str, active_flag_names: List[str]):
         )
         
         if not emails:
-            print("No emails found to sort")
+            logger.info("No emails found to sort")
             await categorization_service.update_sorting_session(
                 session_id, 
                 status='completed', 
@@ -127,36 +165,109 @@ async def perform_email_sorting(email: str, active_flag_names: List[str]):
             )
             return
         
-        # Categorize and label emails
+        # Group near-identical emails so each group is categorized once
+        clusters = cluster_near_duplicates(
+            emails,
+            max_distance=categorization_service.settings.near_duplicate_max_distance,
+            min_tokens=categorization_service.settings.near_duplicate_min_tokens
+        )
+        cluster_by_email = {id(member): cluster for cluster in clusters for member in cluster.members}
+        logger.info("Grouped %s emails into %s distinct messages", total_emails, len(clusters))
+        
+        # Decide every distinct message locally first; each decision is a list of
+        # (flag, confidence), best first, with up to max_labels entries
+        if max_labels is None:
+            max_labels = categorization_service.settings.sorting_max_labels
+        cluster_decisions = {}
+        cluster_sources = {}  # cluster id -> step that decided it, recorded in the processing log
+        cluster_errors = {}
+        ambiguous = []
+        for cluster in clusters:
+            representative = cluster.representative
+            try:
+                # Repeat senders with a consistent history reuse their past decision
+                category, confidence = categorization_service.lookup_sender_decision(email, representative, user_flags, models)
+                
+                if category:
+                    cluster_decisions[cluster.cluster_id] = [(category, confidence)]
+                    cluster_sources[cluster.cluster_id] = SOURCE_SENDER
+                else:
+                    # Then the local rules, noting how close the call was; close calls the
+                    # user's learned classifier agrees with need no Gemini call either
+                    with profiling(session_profile, representative):
+                        labels, ambiguity, source = categorization_service.score_locally(
+                            email, representative, user_flags, max_labels, rules, models
+                        )
+                    if ambiguity is not None:
+                        ambiguous.append((ambiguity, cluster))
+                    cluster_decisions[cluster.cluster_id] = labels
+                    cluster_sources[cluster.cluster_id] = source
+            except Exception as e:
+                cluster_errors[cluster.cluster_id] = str(e)
+        
+        # Spend the session's Gemini budget on the least certain decisions only
+        selected = categorization_service.plan_llm_requests(ambiguous, user_flags)
+        for cluster in selected:
+            try:
+                with profiling(session_profile, cluster.representative):
+                    # Fetch Gemini keywords without blocking the event loop, then score locally
+                    enhanced_keywords = await categorization_service.prefetch_enhanced_keywords(cluster.representative, user_flags)
+                    
+                    # Categorize the email using enhanced logic
+                    cluster_decisions[cluster.cluster_id] = categorization_service.categorize_email_multi(
+                        cluster.representative, user_flags, enhanced_keywords, rules, max_labels
+                    )
+                    cluster_sources[cluster.cluster_id] = SOURCE_GEMINI
+            except Exception as e:
+                logger.warning("Error refining decision with Gemini: %s", e)
+        logger.info("Sent %s of %s ambiguous messages to Gemini", len(selected), len(ambiguous))
+        
+        # Resolve each email's flags to Gmail labels; junk goes to Marketing Mails
+        marketing_label_id = None
+        email_labels = {}  # id(email) -> [(label name, label id or None, confidence)]
+        label_groups: Dict[Tuple[str, ...], List[str]] = {}
+        for email_item in emails:
+            cluster = cluster_by_email[id(email_item)]
+            if cluster.cluster_id in cluster_errors:
+                continue
+            labels = []
+            for category, confidence in cluster_decisions[cluster.cluster_id]:
+                if category.lower() == 'junk':
+                    if not marketing_label_id:
+                        marketing_label_id = await gmail_service.get_or_create_label(service, email, "Marketing Mails", "#ff6b35")
+                    labels.append(("Marketing Mails", marketing_label_id, confidence))
+                elif category in label_mapping:
+                    labels.append((category, label_mapping[category], confidence))
+            email_labels[id(email_item)] = labels
+            
+            label_ids = tuple(sorted({label_id for _, label_id, _ in labels if label_id}))
+            if label_ids:
+                label_groups.setdefault(label_ids, []).append(email_item['id'])
+        
+        # One modify/batchModify call adds all labels to every email sharing a label set
+        labeled_ids = set()
+        for label_ids, message_ids in label_groups.items():
+            labeled_ids |= await gmail_service.apply_labels(service, message_ids, list(label_ids))
+            
+            # Small delay to avoid API rate limits
+            await asyncio.sleep(0.1)
+        logger.info("Applied labels with %s Gmail calls", len(label_groups))
+        
+        # Log results, one row per applied label
         processed_count = 0
         
         for email_item in emails:
+            cluster = cluster_by_email[id(email_item)]
+            cluster_id = cluster.cluster_id if cluster.is_duplicate_group else None
+            decision_source = cluster_sources.get(cluster.cluster_id)
             try:
-                # Categorize the email using enhanced logic
-                category, confidence = categorization_service.categorize_email_enhanced(email_item, user_flags)
-                print(f"Email '{email_item.get('subject', 'No Subject')[:50]}...' -> Category: {category}, Confidence: {confidence}")
+                if cluster.cluster_id in cluster_errors:
+                    raise RuntimeError(cluster_errors[cluster.cluster_id])
+                labels = email_labels[id(email_item)]
+                logger.debug("Email '%s...' -> Labels: %s", email_item.get('subject', 'No Subject')[:50], labels, extra=PER_EMAIL)
                 
-                # Check if this is a marketing/junk email that should be labeled as Marketing Mails
-                if category and category.lower() == 'junk':
-                    # Create/get Marketing Mails label
-                    marketing_label_id = await gmail_service.get_or_create_label(service, email, "Marketing Mails", "#ff6b35")
-                    
-                    if marketing_label_id:
-                        # Apply Marketing Mails label
-                        label_success = await gmail_service.apply_label(service, email_item['id'], marketing_label_id)
-                        print(f"Applied Marketing Mails label: {'Success' if label_success else 'Failed'}")
-                        
-                        # Log the labeling result
-                        await categorization_service.log_email_processing(session_id, {
-                            'email_id': email_item['id'],
-                            'email_subject': email_item.get('subject'),
-                            'email_from': email_item.get('from'),
-                            'assigned_category': 'Marketing Mails',
-                            'confidence_score': confidence,
-                            'status': 'success' if label_success else 'failed',
-                            'error_details': None if label_success else 'Failed to apply Marketing Mails label'
-                        })
-                    else:
+                for label_name, label_id, confidence in labels:
+                    if not label_id:
                         # Log failure to create label
                         await categorization_service.log_email_processing(session_id, {
                             'email_id': email_item['id'],
@@ -165,48 +276,49 @@ async def perform_email_sorting(email: str, active_flag_names: List[str]):
                             'assigned_category': 'junk',
                             'confidence_score': confidence,
                             'status': 'failed',
-                            'error_details': 'Failed to create Marketing Mails label'
+                            'error_details': 'Failed to create Marketing Mails label',
+                            'cluster_id': cluster_id,
+                            'decision_source': decision_source
                         })
-                
-                elif category and category in label_mapping:
-                    # Apply the label to the email for non-archive categories
-                    label_id = label_mapping[category]
-                    success = await gmail_service.apply_label(service, email_item['id'], label_id)
-                    print(f"Applied label '{category}' to email: {'Success' if success else 'Failed'}")
+                        continue
                     
-                    # Log the processing result
+                    success = email_item['id'] in labeled_ids
+                    
+                    # Log the labeling result
                     await categorization_service.log_email_processing(session_id, {
                         'email_id': email_item['id'],
                         'email_subject': email_item.get('subject'),
                         'email_from': email_item.get('from'),
-                        'assigned_category': category,
+                        'assigned_category': label_name,
                         'confidence_score': confidence,
                         'status': 'success' if success else 'failed',
-                        'error_details': None if success else 'Failed to apply label'
+                        'error_details': None if success else f"Failed to apply {label_name} label",
+                        'cluster_id': cluster_id,
+                        'decision_source': decision_source
                     })
-                else:
+                
+                if not labels:
                     # Log as unprocessed
-                    print(f"Skipping email - no category match (confidence: {confidence})")
+                    logger.debug("Skipping email - no category match", extra=PER_EMAIL)
                     await categorization_service.log_email_processing(session_id, {
                         'email_id': email_item['id'],
                         'email_subject': email_item.get('subject'),
                         'email_from': email_item.get('from'),
                         'assigned_category': None,
-                        'confidence_score': confidence,
+                        'confidence_score': 0.0,
                         'status': 'skipped',
-                        'error_details': 'No matching category or low confidence'
+                        'error_details': 'No matching category or low confidence',
+                        'cluster_id': cluster_id,
+                        'decision_source': decision_source
                     })
                 
                 processed_count += 1
                 
-                # Update progress
-                await categorization_service.update_sorting_session(
-                    session_id, 
-                    processed_emails=processed_count
-                )
-                
-                # Small delay to avoid API rate limits
-                await asyncio.sleep(0.1)
+                # Update live progress (written to the database every few seconds)
+                await categorization_service.record_email_progress(session_id, [
+                    label_name for label_name, label_id, _ in labels
+                    if label_id and email_item['id'] in labeled_ids
+                ])
                 
             except Exception as e:
                 # Log processing error
@@ -217,17 +329,23 @@ async def perform_email_sorting(email: str, active_flag_names: List[str]):
                     'assigned_category': None,
                     'confidence_score': 0.0,
                     'status': 'error',
-                    'error_details': str(e)
+                    'error_details': str(e),
+                    'cluster_id': cluster_id
                 })
                 processed_count += 1
+                await categorization_service.record_email_progress(session_id)
         
-        # Mark session as completed
+        # Mark session as completed, keeping the profile for when this process is gone
         await categorization_service.update_sorting_session(
             session_id, 
             status='completed',
-            processed_emails=processed_count
+            processed_emails=processed_count,
+            profile=json.dumps(session_profile.summary()) if session_profile else None
         )
         
+        # Relearn sender decisions with this session's results on the next run
+        categorization_service.sender_cache.invalidate(email)
+        
     except Exception as e:
         # Mark session as failed
         if 'session_id' in locals():
@@ -243,6 +361,8 @@ async def start_email_sorting(background_tasks: BackgroundTasks, sort_data: Dict
     try:
         email = sort_data.get("email")
         active_flags = sort_data.get("active_flags", [])
+        max_labels = sort_data.get("max_labels")
+        profile = bool(sort_data.get("profile", False))
         
         if not email:
             raise HTTPException(status_code=400, detail="Email is required")
@@ -250,6 +370,9 @@ async def start_email_sorting(background_tasks: BackgroundTasks, sort_data: Dict
         if not active_flags:
             raise HTTPException(status_code=400, detail="At least one active flag is required")
         
+        if max_labels is not None and (not isinstance(max_labels, int) or max_labels < 0):
+            raise HTTPException(status_code=400, detail="max_labels must be a non-negative integer")
+        
         # Verify user exists and is connected
         user = await get_user_by_email(email)
         if not user:
@@ -260,7 +383,7 @@ async def start_email_sorting(background_tasks: BackgroundTasks, sort_data: Dict
             raise HTTPException(status_code=401, detail="Gmail connection invalid")
         
         # Start background sorting task
-        background_tasks.add_task(perform_email_sorting, email, active_flags)
+        background_tasks.add_task(perform_email_sorting, email, active_flags, max_labels, profile)
         
         return {"message": "Email sorting started", "status": "running"}
         
@@ -271,131 +394,170 @@ async def start_email_sorting(background_tasks: BackgroundTasks, sort_data: Dict
 async def get_sorting_status(email: str):
     """Get current sorting status for user"""
     try:
-        with get_db() as db:
-            cursor = db.cursor()
-            if get_db_type() == "postgres":
-                cursor.execute("""
-                    SELECT session_id, status, start_time, end_time, 
-                           total_emails, processed_emails, error_message
-                    FROM sorting_sessions 
-                    WHERE email = %s 
-                    ORDER BY start_time DESC 
-                    LIMIT 1
-                """, (email,))
-            else:
-                cursor.execute("""
-                    SELECT session_id, status, start_time, end_time, 
-                           total_emails, processed_emails, error_message
-                    FROM sorting_sessions 
-                    WHERE email = ? 
-                    ORDER BY start_time DESC 
-                    LIMIT 1
-                """, (email,))
-            
-            row = cursor.fetchone()
-            if row:
-                return {
-                    "session_id": row["session_id"],
-                    "status": row["status"],
-                    "start_time": row["start_time"],
-                    "end_time": row["end_time"],
-                    "total_emails": row["total_emails"],
-                    "processed_emails": row["processed_emails"],
-                    "error_message": row["error_message"]
-                }
-            
-            return {"status": "no_session"}
+        # Running sessions of this process are answered from memory
+        progress = session_progress.latest(email)
+        if progress is not None and not progress.finished:
+            return progress.to_dict()
+        
+        row = await fetch_one(queries.LATEST_SESSION, (email,))
+        
+        if row:
+            status = {
+                "session_id": row["session_id"],
+                "status": row["status"],
+                "start_time": row["start_time"],
+                "end_time": row["end_time"],
+                "total_emails": row["total_emails"],
+                "processed_emails": row["processed_emails"],
+                "error_message": row["error_message"]
+            }
+            # Label counts are only known to the process that ran the session
+            progress = session_progress.get(row["session_id"])
+            if progress is not None:
+                status["label_counts"] = dict(progress.label_counts)
+            return status
+        
+        return {"status": "no_session"}
             
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def page_limit(limit: int) -> int:
+    if limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be at least 1")
+    return min(limit, categorization_service.settings.max_page_size)
+
+def cursor_key(cursor: str) -> Tuple[Any, int]:
+    try:
+        return decode_cursor(cursor, get_db_type())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.get("/history/{email}")
-async def get_sorting_history(email: str, limit: int = 10):
-    """Get sorting history for user"""
+async def get_sorting_history(email: str, limit: int = 10, cursor: Optional[str] = None):
+    """
+    Get sorting history for user, newest first
+    
+    Pass next_cursor from a response as cursor to get the page after it; it is None on the last page.
+    """
     try:
-        with get_db() as db:
-            cursor = db.cursor()
-            if get_db_type() == "postgres":
-                cursor.execute("""
-                    SELECT session_id, status, start_time, end_time, 
-                           total_emails, processed_emails, error_message, flags_used
-                    FROM sorting_sessions 
-                    WHERE email = %s 
-                    ORDER BY start_time DESC 
-                    LIMIT %s
-                """, (email, limit))
-            else:
-                cursor.execute("""
-                    SELECT session_id, status, start_time, end_time, 
-                           total_emails, processed_emails, error_message, flags_used
-                    FROM sorting_sessions 
-                    WHERE email = ? 
-                    ORDER BY start_time DESC 
-                    LIMIT ?
-                """, (email, limit))
-            
-            rows = cursor.fetchall()
-            
-            history = []
-            for row in rows:
-                history.append({
-                    "session_id": row["session_id"],
-                    "status": row["status"],
-                    "start_time": row["start_time"],
-                    "end_time": row["end_time"],
-                    "total_emails": row["total_emails"],
-                    "processed_emails": row["processed_emails"],
-                    "error_message": row["error_message"],
-                    "flags_used": row["flags_used"]
-                })
-            
-            return {"history": history}
-            
+        limit = page_limit(limit)
+        if cursor:
+            start_time, row_id = cursor_key(cursor)
+            rows = await fetch_all(queries.SESSION_HISTORY_AFTER, (email, start_time, row_id, limit + 1))
+        else:
+            rows = await fetch_all(queries.SESSION_HISTORY, (email, limit + 1))
+        rows, next_cursor = split_page(rows, limit, "start_time")
+        
+        history = []
+        for row in rows:
+            history.append({
+                "session_id": row["session_id"],
+                "status": row["status"],
+                "start_time": row["start_time"],
+                "end_time": row["end_time"],
+                "total_emails": row["total_emails"],
+                "processed_emails": row["processed_emails"],
+                "error_message": row["error_message"],
+                "flags_used": row["flags_used"]
+            })
+        
+        return {"history": history, "next_cursor": next_cursor}
+    
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/session/{session_id}/details")
-async def get_session_details(session_id: str):
-    """Get detailed processing log for a session"""
+async def get_session_details(session_id: str, limit: Optional[int] = None, cursor: Optional[str] = None):
+    """
+    Get one page of a session's processing log, newest first
+    
+    limit defaults to settings.session_details_page_size. Pass next_cursor from a
+    response as cursor to get the page after it; it is None on the last page.
+    Use /session/{session_id}/export for the whole log.
+    """
     try:
-        with get_db() as db:
-            cursor = db.cursor()
-            if get_db_type() == "postgres":
-                cursor.execute("""
-                    SELECT email_id, email_subject, email_from, assigned_label, 
-                           confidence_score, processing_time, status, error_details
-                    FROM email_processing_log 
-                    WHERE session_id = %s 
-                    ORDER BY processing_time DESC
-                """, (session_id,))
-            else:
-                cursor.execute("""
-                    SELECT email_id, email_subject, email_from, assigned_label, 
-                           confidence_score, processing_time, status, error_details
-                    FROM email_processing_log 
-                    WHERE session_id = ? 
-                    ORDER BY processing_time DESC
-                """, (session_id,))
-            
-            rows = cursor.fetchall()
-            
-            details = []
-            for row in rows:
-                details.append({
-                    "email_id": row["email_id"],
-                    "email_subject": row["email_subject"],
-                    "email_from": row["email_from"],
-                    "assigned_label": row["assigned_label"],
-                    "confidence_score": row["confidence_score"],
-                    "processing_time": row["processing_time"],
-                    "status": row["status"],
-                    "error_details": row["error_details"]
-                })
-            
-            return {"details": details}
-            
+        limit = page_limit(limit or categorization_service.settings.session_details_page_size)
+        if cursor:
+            processing_time, row_id = cursor_key(cursor)
+            rows = await fetch_all(queries.SESSION_LOG_PAGE_AFTER, (session_id, processing_time, row_id, limit + 1))
+        else:
+            rows = await fetch_all(queries.SESSION_LOG_PAGE, (session_id, limit + 1))
+        rows, next_cursor = split_page(rows, limit, "processing_time")
+        
+        details = [{field: row[field] for field in DETAIL_FIELDS} for row in rows]
+        
+        return {"details": details, "next_cursor": next_cursor}
+    
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e)) 
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def export_lines(rows: AsyncIterator, format: str) -> AsyncIterator[str]:
+    """Encode streamed log rows as NDJSON or CSV, a chunk of lines at a time"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if format == "csv":
+        writer.writerow(DETAIL_FIELDS)
+    lines = 0
+    async for row in rows:
+        if format == "csv":
+            writer.writerow([row[field] for field in DETAIL_FIELDS])
+        else:
+            buffer.write(json.dumps({field: row[field] for field in DETAIL_FIELDS}, default=str) + "\n")
+        lines += 1
+        if lines % EXPORT_CHUNK_LINES == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+@router.get("/session/{session_id}/export")
+async def export_session_details(session_id: str, format: str = "ndjson"):
+    """
+    Stream a session's whole processing log, oldest first, as NDJSON or CSV
+    
+    Rows are read from a database cursor and sent as they arrive, so memory use
+    does not grow with the size of the session.
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    rows = stream(queries.SESSION_LOG_EXPORT, (session_id,), categorization_service.settings.export_fetch_size)
+    return StreamingResponse(
+        export_lines(rows, format),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="session-{session_id}.{format}"'}
+    )
+
+@router.get("/session/{session_id}/profile")
+async def get_session_profile(session_id: str):
+    """
+    Get the per-stage scoring profile of a session run with profiling enabled
+    
+    Includes time per stage (normalize, keywords, patterns, urgency, gemini), per-flag
+    time and keyword comparisons, body size percentiles and the slowest emails.
+    A session still running returns its profile so far.
+    """
+    try:
+        session_profile = session_profiles.get(session_id)
+        if session_profile is not None:
+            return session_profile.summary()
+        
+        row = await fetch_one(queries.SESSION_PROFILE, (session_id,))
+        
+        if not row or not row["profile"]:
+            raise HTTPException(status_code=404, detail="No profile recorded for this session")
+        
+        return json.loads(row["profile"])
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/revert/{email}")
 async def revert_email_sorting(email: str, background_tasks: BackgroundTasks):
@@ -411,35 +573,13 @@ async def revert_email_sorting(email: str, background_tasks: BackgroundTasks):
             raise HTTPException(status_code=401, detail="Gmail connection invalid")
         
         # Get the most recent completed sorting session
-        with get_db() as db:
-            cursor = db.cursor()
-            if get_db_type() == "postgres":
-                cursor.execute("""
-                    SELECT session_id, flags_used 
-                    FROM sorting_sessions 
-                    WHERE email = %s AND status = 'completed'
-                    ORDER BY start_time DESC 
-                    LIMIT 1
-                """, (email,))
-            else:
-                cursor.execute("""
-                    SELECT session_id, flags_used 
-                    FROM sorting_sessions 
-                    WHERE email = ? AND status = 'completed'
-                    ORDER BY start_time DESC 
-                    LIMIT 1
-                """, (email,))
-            
-            row = cursor.fetchone()
-            if not row:
-                raise HTTPException(status_code=404, detail="No completed sorting sessions found to revert")
-            
-            if hasattr(row, 'keys'):  # PostgreSQL
-                session_id = row['session_id']
-                flags_used = row['flags_used']
-            else:  # SQLite
-                session_id = row[0]
-                flags_used = row[1]
+        row = await fetch_one(queries.LAST_COMPLETED_SESSION, (email,))
+        
+        if not row:
+            raise HTTPException(status_code=404, detail="No completed sorting sessions found to revert")
+        
+        session_id = row['session_id']
+        flags_used = row['flags_used']
         
         # Start background revert task
         background_tasks.add_task(perform_email_revert, email, session_id, flags_used)
@@ -462,25 +602,10 @@ async def perform_email_revert(email: str, session_id: str, flags_used: str):
             return
         
         # Get all emails that were processed in this session
-        with get_db() as db:
-            cursor = db.cursor()
-            if get_db_type() == "postgres":
-                cursor.execute("""
-                    SELECT email_id, assigned_label 
-                    FROM email_processing_log 
-                    WHERE session_id = %s AND status = 'success' AND assigned_label IS NOT NULL
-                """, (session_id,))
-            else:
-                cursor.execute("""
-                    SELECT email_id, assigned_label 
-                    FROM email_processing_log 
-                    WHERE session_id = ? AND status = 'success' AND assigned_label IS NOT NULL
-                """, (session_id,))
-            
-            processed_emails = cursor.fetchall()
+        processed_emails = await fetch_all(queries.REVERTIBLE_EMAILS, (session_id,))
         
         if not processed_emails:
-            print(f"No emails found to revert for session {session_id}")
+            logger.info("No emails found to revert for session %s", session_id)
             return
         
         # Get Gmail labels for the flags that were used
@@ -495,16 +620,12 @@ async def perform_email_revert(email: str, session_id: str, flags_used: str):
         reverted_count = 0
         failed_count = 0
         
-        print(f"Starting revert for {len(processed_emails)} emails from session {session_id}")
+        logger.info("Starting revert for %s emails from session %s", len(processed_emails), session_id)
         
         for email_row in processed_emails:
             try:
-                if hasattr(email_row, 'keys'):  # PostgreSQL
-                    email_id = email_row['email_id']
-                    assigned_label = email_row['assigned_label']
-                else:  # SQLite
-                    email_id = email_row[0]
-                    assigned_label = email_row[1]
+                email_id = email_row['email_id']
+                assigned_label = email_row['assigned_label']
                 
                 # Get the label ID for removal
                 label_id = label_mapping.get(assigned_label)
@@ -513,48 +634,35 @@ async def perform_email_revert(email: str, session_id: str, flags_used: str):
                     success = await gmail_service.remove_label(service, email_id, label_id)
                     if success:
                         reverted_count += 1
-                        print(f"Removed label '{assigned_label}' from email {email_id}")
+                        logger.debug("Removed label '%s' from email %s", assigned_label, email_id, extra=PER_EMAIL)
                     else:
                         failed_count += 1
-                        print(f"Failed to remove label '{assigned_label}' from email {email_id}")
+                        logger.warning("Failed to remove label '%s' from email %s", assigned_label, email_id, extra=PER_EMAIL)
                 else:
                     failed_count += 1
-                    print(f"Label '{assigned_label}' not found for removal")
+                    logger.warning("Label '%s' not found for removal", assigned_label)
                 
                 # Small delay to avoid API rate limits
                 await asyncio.sleep(0.1)
                 
             except Exception as e:
                 failed_count += 1
-                print(f"Error removing label from email {email_id}: {e}")
+                logger.warning("Error removing label from email %s: %s", email_id, e)
         
-        print(f"Revert completed: {reverted_count} labels removed, {failed_count} failed")
+        logger.info("Revert completed: %s labels removed, %s failed", reverted_count, failed_count)
         
-        # Log the revert operation
-        await categorization_service.create_sorting_session(email, ["REVERT"])
+        # Log the revert operation as an already finished session, so it never shows up as running
         revert_session_id = str(uuid.uuid4())
         
-        with get_db() as db:
-            cursor = db.cursor()
-            if get_db_type() == "postgres":
-                cursor.execute("""
-                    INSERT INTO sorting_sessions (session_id, email, flags_used, status, processed_emails, total_emails)
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                """, (revert_session_id, email, f"REVERT:{session_id}", 'completed', reverted_count, len(processed_emails)))
-            else:
-                cursor.execute("""
-                    INSERT INTO sorting_sessions (session_id, email, flags_used, status, processed_emails, total_emails)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                """, (revert_session_id, email, f"REVERT:{session_id}", 'completed', reverted_count, len(processed_emails)))
-            db.commit()
+        await execute(queries.INSERT_FINISHED_SESSION, (
+            revert_session_id, email, f"REVERT:{session_id}", 'completed', reverted_count, len(processed_emails)
+        ))
         
     except Exception as e:
-        print(f"Error during email revert: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error during email revert: %s", e)
 
 @router.post("/ai/enhance-keywords")
-async def enhance_keywords_with_ai(data: Dict[str, Any]):
+async def enhance_keywords_with_ai(data: Dict[str, Any], request: Request):
     """
     Enhance user prompt with AI-generated keywords using Gemini
     """
@@ -574,10 +682,10 @@ async def enhance_keywords_with_ai(data: Dict[str, Any]):
             }
         
         # Get enhanced keywords
-        enhanced_keywords = await categorization_service.enhance_user_keywords(
+        enhanced_keywords = await run_until_disconnected(request, categorization_service.enhance_user_keywords(
             user_prompt=user_prompt,
             email_context=email_context
-        )
+        ))
         
         return {
             "success": True,
@@ -586,12 +694,15 @@ async def enhance_keywords_with_ai(data: Dict[str, Any]):
             "message": f"Generated {len(enhanced_keywords)} enhanced keywords"
         }
         
+    except HTTPException:
+        # Includes 499 from run_until_disconnected
+        raise
     except Exception as e:
-        print(f"Error enhancing keywords with AI: {e}")
+        logger.error("Error enhancing keywords with AI: %s", e)
         raise HTTPException(status_code=500, detail=f"Error enhancing keywords: {str(e)}")
 
 @router.post("/ai/suggest-flags")
-async def suggest_flags_with_ai(data: Dict[str, Any]):
+async def suggest_flags_with_ai(data: Dict[str, Any], request: Request):
     """
     Get AI-powered flag suggestions for an email using Gemini
     """
@@ -614,28 +725,15 @@ async def suggest_flags_with_ai(data: Dict[str, Any]):
             }
         
         # Get user's flags
-        with get_db() as db:
-            cursor = db.cursor()
-            if get_db_type() == "postgres":
-                cursor.execute("""
-                    SELECT flag_name, flag_description, flag_color
-                    FROM user_flags 
-                    WHERE email = %s AND is_active = true
-                """, (email,))
-            else:
-                cursor.execute("""
-                    SELECT flag_name, flag_description, flag_color
-                    FROM user_flags 
-                    WHERE email = ? AND is_active = 1
-                """, (email,))
-            
-            user_flags = []
-            for row in cursor.fetchall():
-                user_flags.append({
-                    "name": row["flag_name"],
-                    "description": row["flag_description"],
-                    "color": row["flag_color"]
-                })
+        rows = await fetch_all(queries.ACTIVE_USER_FLAGS, (email,))
+        
+        user_flags = []
+        for row in rows:
+            user_flags.append({
+                "name": row["flag_name"],
+                "description": row["flag_description"],
+                "color": row["flag_color"]
+            })
         
         if not user_flags:
             return {
@@ -645,10 +743,10 @@ async def suggest_flags_with_ai(data: Dict[str, Any]):
             }
         
         # Get AI suggestions
-        suggestions = await categorization_service.get_ai_flag_suggestions(
+        suggestions = await run_until_disconnected(request, categorization_service.get_ai_flag_suggestions(
             email_data=email_data,
             user_flags=user_flags
-        )
+        ))
         
         return {
             "success": True,
@@ -656,10 +754,22 @@ async def suggest_flags_with_ai(data: Dict[str, Any]):
             "message": f"Generated {len(suggestions)} flag suggestions"
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error getting AI flag suggestions: {e}")
+        logger.error("Error getting AI flag suggestions: %s", e)
         raise HTTPException(status_code=500, detail=f"Error getting flag suggestions: {str(e)}")
 
+@router.get("/ai/cache-stats")
+async def get_ai_cache_stats():
+    """
+    Hit/miss counters of the shared Gemini response cache
+    """
+    try:
+        return categorization_service.gemini_async.cache.stats()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.get("/ai/status")
 async def get_ai_status():
     """
@@ -675,11 +785,12 @@ async def get_ai_status():
                 "flag_suggestions": gemini_available,
                 "smart_categorization": gemini_available
             },
+            "circuit_breaker": categorization_service.gemini.breaker.stats(),
             "message": "AI services are ready" if gemini_available else "AI services not configured"
         }
         
     except Exception as e:
-        print(f"Error checking AI status: {e}")
+        logger.error("Error checking AI status: %s", e)
         return {
             "gemini_available": False,
             "features_available": {
@@ -1,7 +1,20 @@
 from fastapi import APIRouter, HTTPException
 from typing import Dict, Any
+import asyncio
 import json
-from ..database import get_db, get_db_type
+from .. import queries
+from ..async_database import execute, fetch_all, transaction
+from ..services.sender_cache import sender_decision_cache
+from ..services.rule_tables import (
+    DEFAULT_CATEGORY_KEYWORDS,
+    DEFAULT_DOMAIN_CATEGORIES,
+    compile_rules,
+    default_rules,
+    delete_user_rule_tables,
+    get_user_rule_tables,
+    merge_with_defaults,
+    save_user_rule_tables,
+)
 
 router = APIRouter(prefix="/flags", tags=["flags"])
 
@@ -15,41 +28,26 @@ async def save_user_flags(flags_data: Dict[str, Any]):
         if not email:
             raise HTTPException(status_code=400, detail="Email is required")
         
-        with get_db() as db:
-            cursor = db.cursor()
-            
+        rows = [
+            (
+                email,
+                flag.get("name", ""),
+                flag.get("description", ""),
+                flag.get("color", "#000000"),
+                flag.get("isActive", False)
+            )
+            for flag in flags
+        ]
+        
+        async with transaction() as db:
             # Clear existing flags for this user
-            if get_db_type() == "postgres":
-                cursor.execute("DELETE FROM user_flags WHERE email = %s", (email,))
-            else:
-                cursor.execute("DELETE FROM user_flags WHERE email = ?", (email,))
+            await db.execute(queries.DELETE_USER_FLAGS, (email,))
             
             # Insert new flags
-            for flag in flags:
-                if get_db_type() == "postgres":
-                    cursor.execute("""
-                        INSERT INTO user_flags (email, flag_name, flag_description, flag_color, is_active)
-                        VALUES (%s, %s, %s, %s, %s)
-                    """, (
-                        email,
-                        flag.get("name", ""),
-                        flag.get("description", ""),
-                        flag.get("color", "#000000"),
-                        flag.get("isActive", False)
-                    ))
-                else:
-                    cursor.execute("""
-                        INSERT INTO user_flags (email, flag_name, flag_description, flag_color, is_active)
-                        VALUES (?, ?, ?, ?, ?)
-                    """, (
-                        email,
-                        flag.get("name", ""),
-                        flag.get("description", ""),
-                        flag.get("color", "#000000"),
-                        flag.get("isActive", False)
-                    ))
-            
-            db.commit()
+            await db.execute_many(queries.INSERT_USER_FLAG, rows)
+        
+        # Memoized sender decisions were learned against the old flags
+        sender_decision_cache.invalidate(email)
         
         return {"message": "Flags saved successfully"}
     
@@ -60,45 +58,19 @@ async def save_user_flags(flags_data: Dict[str, Any]):
 async def load_user_flags(email: str):
     """Load user's saved flag configurations"""
     try:
-        with get_db() as db:
-            cursor = db.cursor()
-            if get_db_type() == "postgres":
-                cursor.execute("""
-                    SELECT flag_name, flag_description, flag_color, is_active
-                    FROM user_flags 
-                    WHERE email = %s
-                    ORDER BY flag_name
-                """, (email,))
-            else:
-                cursor.execute("""
-                    SELECT flag_name, flag_description, flag_color, is_active
-                    FROM user_flags 
-                    WHERE email = ?
-                    ORDER BY flag_name
-                """, (email,))
-            
-            rows = cursor.fetchall()
-            
-            flags = []
-            for row in rows:
-                if hasattr(row, 'keys'):  # PostgreSQL with RealDictCursor
-                    flags.append({
-                        "id": row["flag_name"].lower().replace(" ", "_"),
-                        "name": row["flag_name"],
-                        "description": row["flag_description"],
-                        "color": row["flag_color"],
-                        "isActive": bool(row["is_active"])
-                    })
-                else:  # SQLite with regular cursor
-                    flags.append({
-                        "id": row[0].lower().replace(" ", "_"),
-                        "name": row[0],
-                        "description": row[1],
-                        "color": row[2],
-                        "isActive": bool(row[3])
-                    })
-            
-            return {"flags": flags}
+        rows = await fetch_all(queries.USER_FLAGS, (email,))
+        
+        flags = []
+        for row in rows:
+            flags.append({
+                "id": row["flag_name"].lower().replace(" ", "_"),
+                "name": row["flag_name"],
+                "description": row["flag_description"],
+                "color": row["flag_color"],
+                "isActive": bool(row["is_active"])
+            })
+        
+        return {"flags": flags}
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -107,15 +79,77 @@ async def load_user_flags(email: str):
 async def clear_user_flags(email: str):
     """Clear all flags for a user (for testing/reset purposes)"""
     try:
-        with get_db() as db:
-            cursor = db.cursor()
-            if get_db_type() == "postgres":
-                cursor.execute("DELETE FROM user_flags WHERE email = %s", (email,))
-            else:
-                cursor.execute("DELETE FROM user_flags WHERE email = ?", (email,))
-            db.commit()
+        await execute(queries.DELETE_USER_FLAGS, (email,))
+        
+        sender_decision_cache.invalidate(email)
         
         return {"message": "User flags cleared successfully"}
     
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/rules/{email}")
+async def load_user_rules_tables(email: str):
+    """Load the user's keyword and domain tables, with the defaults they override"""
+    try:
+        overrides = await asyncio.to_thread(get_user_rule_tables, email)
+        category_keywords, domain_categories = overrides or ({}, {})
+        # Compiled from the tables just read, not with a second query
+        rules = compile_rules(*merge_with_defaults(*overrides)) if overrides else default_rules()
+        
+        return {
+            "category_keywords": category_keywords,
+            "domain_categories": domain_categories,
+            "defaults": {
+                "category_keywords": DEFAULT_CATEGORY_KEYWORDS,
+                "domain_categories": DEFAULT_DOMAIN_CATEGORIES
+            },
+            "rules_hash": rules.content_hash
+        }
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/rules/save")
+async def save_user_rules_tables(rules_data: Dict[str, Any]):
+    """
+    Save a user's keyword and domain tables
+    
+    Entries replace the default entry for the same flag name; flags not listed keep the defaults.
+    """
+    try:
+        email = rules_data.get("email")
+        if not email:
+            raise HTTPException(status_code=400, detail="Email is required")
+        
+        try:
+            rules = await asyncio.to_thread(
+                save_user_rule_tables,
+                email,
+                rules_data.get("category_keywords", {}),
+                rules_data.get("domain_categories", {})
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        # Memoized sender decisions were made with the old tables
+        sender_decision_cache.invalidate(email)
+        
+        return {"message": "Rule tables saved successfully", "rules_hash": rules.content_hash}
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/rules/reset/{email}")
+async def reset_user_rules_tables(email: str):
+    """Drop a user's rule table overrides so the defaults apply again"""
+    try:
+        await asyncio.to_thread(delete_user_rule_tables, email)
+        sender_decision_cache.invalidate(email)
+        
+        return {"message": "Rule tables reset to defaults"}
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
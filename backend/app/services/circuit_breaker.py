@@ -0,0 +1,162 @@
+import logging
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose circuit is open"""
+
+@dataclass(frozen=True)
+class Permit:
+    """A call allowed by the breaker: the circuit generation it started in, and whether it is a half-open probe"""
+    generation: int
+    probe: bool = False
+
+class CircuitBreaker:
+    """
+    Error-rate and latency circuit breaker for an unreliable dependency.
+
+    Outcomes of the last window_size calls are kept. Once at least min_requests
+    are recorded, the circuit opens when the error rate reaches
+    max_error_rate or the p95 latency reaches max_p95_latency. While open,
+    calls are rejected immediately. After open_seconds the circuit goes
+    half-open and lets up to half_open_probes calls through. It closes if they
+    succeed within the latency limit and reopens otherwise.
+
+    Every state change starts a new generation. Outcomes are recorded against
+    the Permit that allowed the call, and outcomes from an earlier generation
+    are ignored: a slow call that started before the circuit opened cannot
+    close it when it finally completes. Only the probes can do that.
+
+    Thread-safe, so it can guard both the sync and the async Gemini paths.
+    """
+
+    def __init__(self, name: str, window_size: int, min_requests: int, max_error_rate: float,
+                 max_p95_latency: float, open_seconds: float, half_open_probes: int = 1):
+        self.name = name
+        self.window_size = window_size
+        self.min_requests = min_requests
+        self.max_error_rate = max_error_rate
+        self.max_p95_latency = max_p95_latency
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+
+        self._outcomes: Deque[Tuple[bool, float]] = deque(maxlen=window_size)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._generation = 0
+        self._probes_in_flight = 0
+        self._rejected = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._refresh_state()
+            return self._state
+
+    def _refresh_state(self):
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self._generation += 1
+            self._probes_in_flight = 0
+            logger.info(f"Circuit '{self.name}' half-open, probing")
+
+    def allow_request(self) -> Optional[Permit]:
+        """
+        Reserve a call, or return None if the circuit rejects it
+
+        Every permit must be passed back to record_success/failure/cancelled.
+        """
+        with self._lock:
+            self._refresh_state()
+            if self._state == CLOSED:
+                return Permit(self._generation)
+            if self._state == HALF_OPEN and self._probes_in_flight < self.half_open_probes:
+                self._probes_in_flight += 1
+                return Permit(self._generation, probe=True)
+            self._rejected += 1
+            return None
+
+    def record_success(self, latency: float, permit: Permit):
+        with self._lock:
+            if permit.generation != self._generation:
+                return
+            if permit.probe:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                if latency >= self.max_p95_latency:
+                    self._trip(f"probe took {latency:.1f}s")
+                    return
+                self._close()
+                return
+            self._outcomes.append((True, latency))
+            self._evaluate()
+
+    def record_failure(self, latency: float, permit: Permit):
+        with self._lock:
+            if permit.generation != self._generation:
+                return
+            if permit.probe:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                self._trip("probe failed")
+                return
+            self._outcomes.append((False, latency))
+            self._evaluate()
+
+    def record_cancelled(self, permit: Permit):
+        """Release a reserved call that finished without an outcome"""
+        with self._lock:
+            if permit.probe and permit.generation == self._generation:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    def _error_rate(self) -> float:
+        return sum(1 for ok, _ in self._outcomes if not ok) / len(self._outcomes) if self._outcomes else 0.0
+
+    def _p95_latency(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        latencies = sorted(latency for _, latency in self._outcomes)
+        return latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+
+    def _evaluate(self):
+        if self._state != CLOSED or len(self._outcomes) < self.min_requests:
+            return
+        error_rate = self._error_rate()
+        if error_rate >= self.max_error_rate:
+            self._trip(f"error rate {error_rate:.0%}")
+            return
+        p95 = self._p95_latency()
+        if p95 >= self.max_p95_latency:
+            self._trip(f"p95 latency {p95:.1f}s")
+
+    def _trip(self, reason: str):
+        self._state = OPEN
+        self._generation += 1
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        logger.warning(f"Circuit '{self.name}' opened: {reason}")
+
+    def _close(self):
+        self._state = CLOSED
+        self._generation += 1
+        self._outcomes.clear()
+        logger.info(f"Circuit '{self.name}' closed")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            self._refresh_state()
+            return {
+                "state": self._state,
+                "recent_calls": len(self._outcomes),
+                "error_rate": self._error_rate(),
+                "p95_latency_seconds": self._p95_latency(),
+                "rejected": self._rejected
+            }
@@ -1,53 +1,133 @@
 import re
 import json
 import uuid
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
 from datetime import datetime
-from typing import Dict, List, Tuple, Optional
-from ..database import get_db, get_db_type
-from .gemini import GeminiService
+from typing import Any, Dict, FrozenSet, Iterator, List, Tuple, Optional
+from ..config import get_settings
+from .. import queries
+from ..async_database import execute, fetch_all
+from ..logging_config import PER_EMAIL
+from .gemini import GeminiService, AsyncGeminiClient
+from .circuit_breaker import OPEN as CIRCUIT_OPEN
+from .learned_classifier import ClassifierStore, LearnedClassifier, MARKETING_LABEL, NO_LABEL
+from .sender_cache import UserDecisions, sender_decision_cache
+from .processing_log import processing_log
+from .session_progress import session_progress
+from .email_normalization import NormalizedEmail, normalize_email, term_key
+from .rule_tables import CompiledRules, default_rules
+from .scoring_profile import EmailProfile, current_email_profile, timed
+from .llm_budget import LLMBudget, estimate_tokens, schedule_llm_requests
+from .parallel_categorization import CategorizationSnapshot, iter_categorize_parallel, plan_parallelism
+
+logger = logging.getLogger(__name__)
+
+# Flag descriptions shipped as defaults by the frontend; anything else is a custom description
+DEFAULT_FLAG_DESCRIPTIONS = {
+    'high priority emails',
+    'important business emails',
+    'emails requiring follow-up',
+    'marketing and promotional emails',
+    'business and work-related emails',
+    'emails to archive'
+}
+
+# Words ignored when matching a custom flag description against an email
+DESCRIPTION_STOP_WORDS = {'or', 'and', 'the', 'a', 'an', 'to', 'for', 'of', 'in', 'on', 'at', 'with', 'by'}
+
+# Minimum confidence for an email to be assigned to its best flag
+CATEGORY_THRESHOLD = 0.15
+
+# Regex signals per predefined flag, compiled once and run against NormalizedEmail.text
+# (already casefolded, so the patterns are lowercase and need no IGNORECASE)
+URGENT_PATTERNS = [re.compile(pattern) for pattern in (
+    r'\b(urgent|asap|immediate|emergency)\b',
+    r'\b(deadline|due|expires?)\b',
+    r'\b(action required|time sensitive)\b',
+    r'[!]{2,}',  # Multiple exclamation marks
+    r'\b(final notice|last chance)\b'
+)]
+IMPORTANT_PATTERNS = [re.compile(pattern) for pattern in (
+    r'\b(meeting|conference|presentation)\b',
+    r'\b(project|proposal|contract)\b',
+    r'\b(approval|decision|review)\b',
+    r'\b(client|customer|partner)\b'
+)]
+FOLLOWUP_PATTERNS = [re.compile(pattern) for pattern in (
+    r'\b(follow.?up|reminder|checking in)\b',
+    r'\b(status|update|progress)\b',
+    r'\b(next steps|action items)\b',
+    r'\bre:\s',  # Reply emails
+    r'\bfwd:\s'  # Forwarded emails
+)]
+JUNK_PATTERNS = [re.compile(pattern) for pattern in (
+    r'\b(newsletter|notification|receipt)\b',
+    r'\b(confirmation|invoice|statement)\b',
+    r'\b(unsubscribe|opt.?out|preferences)\b',
+    r'\b(automated|system|no.?reply|noreply)\b',
+    r'\b(marketing|promo|promotion|promotional)\b',
+    r'\b(sale|discount|offer|deal|coupon)\b',
+    r'\b(advertisement|ad|sponsor|featured)\b',
+    r'\b(limited.?time|expires?|hurry)\b',
+    r'\b(free.?shipping|%\s*off|save\s*\$)\b',
+    r'\b(subscribe|mailing.?list|newsletter)\b'
+)]
+MARKETING_SENDER_PATTERNS = [re.compile(pattern) for pattern in (
+    r'@.*marketing\.',
+    r'@.*promo\.',
+    r'@.*newsletter\.',
+    r'@.*deals\.',
+    r'@.*offers?\.',
+    r'noreply@',
+    r'no-reply@',
+    r'donotreply@'
+)]
+TIME_URGENCY_PATTERNS = [re.compile(pattern) for pattern in (
+    r'\b(today|tonight|tomorrow)\b',
+    r'\b(this week|next week)\b',
+    r'\b(deadline|due date|expires?)\b'
+)]
+
+# Flag names with a dedicated branch in _analyze_email_patterns
+PATTERN_FLAGS = ('urgent', 'important', 'follow-up', 'junk')
+
+# Urgency indicator words, matched as terms of the normalized email
+HIGH_URGENCY_WORDS = ['urgent', 'asap', 'immediate', 'emergency', 'critical']
+MEDIUM_URGENCY_WORDS = ['important', 'priority', 'deadline', 'time-sensitive']
+
+# Emails scored per matrix block in vectorized batch mode, bounding peak memory
+VECTORIZED_BLOCK_SIZE = 2048
+
+# Step that decided an email, recorded as email_processing_log.decision_source
+SOURCE_SENDER = 'sender'
+SOURCE_CLASSIFIER = 'classifier'
+SOURCE_RULES = 'rules'
+SOURCE_GEMINI = 'gemini'
+
+@dataclass(frozen=True)
+class UserModels:
+    """A user's memoized sender decisions and learned classifier, loaded once per sorting session"""
+    decisions: UserDecisions
+    classifier: Optional[LearnedClassifier]
 
 class EmailCategorizationService:
     def __init__(self):
         # Initialize Gemini service for AI-powered keyword enhancement
         self.gemini = GeminiService()
+        self.gemini_async = AsyncGeminiClient(self.gemini)
         
-        # Enhanced keywords for better categorization
-        self.category_keywords = {
-            'urgent': {
-                'subject': ['urgent', 'asap', 'immediate', 'emergency', 'critical', 'deadline', 'rush', 'priority'],
-                'body': ['urgent', 'asap', 'immediately', 'emergency', 'critical', 'deadline', 'rush', 'priority', 'time-sensitive'],
-                'sender': ['boss', 'manager', 'ceo', 'director', 'admin', 'support']
-            },
-            'important': {
-                'subject': ['important', 'meeting', 'conference', 'presentation', 'project', 'report', 'review', 'approval'],
-                'body': ['important', 'meeting', 'conference', 'presentation', 'project', 'report', 'review', 'approval', 'decision'],
-                'sender': ['client', 'customer', 'partner', 'vendor', 'stakeholder']
-            },
-            'business': {
-                'subject': ['business', 'meeting', 'conference', 'presentation', 'project', 'report', 'review', 'approval', 'client', 'work'],
-                'body': ['business', 'meeting', 'conference', 'presentation', 'project', 'report', 'review', 'approval', 'decision', 'client', 'work', 'professional'],
-                'sender': ['client', 'customer', 'partner', 'vendor', 'stakeholder', 'business', 'company']
-            },
-            'follow-up': {
-                'subject': ['follow up', 'follow-up', 'reminder', 'checking in', 'status', 'update', 'progress'],
-                'body': ['follow up', 'follow-up', 'reminder', 'checking in', 'status', 'update', 'progress', 'next steps'],
-                'sender': ['team', 'colleague', 'coordinator']
-            },
-            'junk': {
-                'subject': ['newsletter', 'notification', 'receipt', 'confirmation', 'invoice', 'statement', 'update'],
-                'body': ['newsletter', 'notification', 'receipt', 'confirmation', 'invoice', 'statement', 'unsubscribe'],
-                'sender': ['no-reply', 'noreply', 'automated', 'system', 'notification']
-            }
-        }
+        # Per-user classifiers trained from sorting history (see scripts/train_classifier.py)
+        self.settings = get_settings()
+        self.classifiers = ClassifierStore(self.settings.classifier_model_dir)
         
-        # Domain-based categorization
-        self.domain_categories = {
-            'urgent': ['emergency', 'alert', 'critical'],
-            'important': ['business', 'corporate', 'company'],
-            'business': ['business', 'corporate', 'company', 'work', 'professional'],
-            'follow-up': ['team', 'project', 'collaboration'],
-            'junk': ['newsletter', 'marketing', 'promo', 'deals', 'promotion', 'sale', 'discount', 'offer', 'coupon', 'advertisement', 'unsubscribe']
-        }
+        # Memoized decisions for repeat senders, learned from the same history
+        self.sender_cache = sender_decision_cache
+        
+        # Keyword tables used when a caller doesn't pass a user's compiled rules
+        self.rules = default_rules()
 
     def normalize_flag_name(self, flag_name: str) -> str:
         """Normalize flag name for keyword matching"""
@@ -72,301 +152,591 @@ class EmailCategorizationService:
         
         return min(keyword_score + subject_weight, 1.0)
 
-    def categorize_email_enhanced(self, email_data: Dict, user_flags: List[Dict]) -> Tuple[Optional[str], float]:
-        """Enhanced email categorization using sender, subject, and message content"""
+    def has_custom_description(self, flag_description: str) -> bool:
+        """Check whether a (lowercased) flag description was written by the user"""
+        return bool(flag_description) and flag_description not in DEFAULT_FLAG_DESCRIPTIONS
+
+    async def load_user_models(self, user_email: str, user_flags: List[Dict]) -> UserModels:
+        """
+        Load the user's sender decisions and classifier on worker threads
+        
+        Both may read the database or disk, so a sorting session loads them once
+        up front and passes the result to lookup_sender_decision and classify_learned.
+        """
+        decisions, classifier = await asyncio.gather(
+            asyncio.to_thread(self.sender_cache.decisions_for, user_email, user_flags),
+            asyncio.to_thread(self.classifiers.get, user_email)
+        )
+        return UserModels(decisions, classifier)
+
+    def classify_learned(self, user_email: str, email_data: Dict, user_flags: List[Dict],
+                         models: Optional[UserModels] = None,
+                         rule_flag: Optional[str] = None) -> Tuple[Optional[str], float]:
+        """
+        Fast local check of the rules' best flag against the user's trained classifier
+        
+        Returns (flag_name, probability) when the model is trained on enough history
+        and confidently predicts rule_flag, otherwise (None, 0.0) so the caller keeps
+        the rules' decision. The classifier never picks a flag on its own: trained on
+        a skewed history it would claim off-topic emails for the dominant flag.
+        Without models the classifier is loaded here, which may block on disk.
+        """
+        if rule_flag is None:
+            return None, 0.0
+        classifier = models.classifier if models is not None else self.classifiers.get(user_email)
+        if classifier is None or classifier.trained_samples < self.settings.classifier_min_samples:
+            return None, 0.0
+        
+        label, probability = classifier.predict(email_data.get('subject', ''), email_data.get('from', ''))
+        if label is None or label == NO_LABEL or probability < self.settings.classifier_min_confidence:
+            return None, 0.0
+        
+        flag_name = self.flag_for_label(label, user_flags)
+        return (flag_name, probability) if flag_name == rule_flag else (None, 0.0)
+
+    def lookup_sender_decision(self, user_email: str, email_data: Dict, user_flags: List[Dict],
+                               models: Optional[UserModels] = None) -> Tuple[Optional[str], float]:
+        """
+        Memoized decision for a repeat sender, or (None, 0.0) if its history isn't consistent enough
+        
+        Only needs the From header, so it can run before the email body is fetched.
+        Without models stale decisions are rebuilt here, which blocks on the database.
+        """
+        if models is not None:
+            decision = models.decisions.lookup(email_data.get('from', ''))
+        else:
+            decision = self.sender_cache.lookup(user_email, email_data.get('from', ''), user_flags)
+        if decision is None:
+            return None, 0.0
+        
+        flag_name = self.flag_for_label(decision.label, user_flags)
+        return (flag_name, decision.confidence) if flag_name else (None, 0.0)
+
+    def flag_for_label(self, label: str, user_flags: List[Dict]) -> Optional[str]:
+        """Map a label from email_processing_log back to one of the user's active flags"""
+        for flag in user_flags:
+            # Junk emails are logged under the Marketing Mails label rather than the flag name
+            if flag['name'] == label or (label == MARKETING_LABEL and flag['name'].lower() == 'junk'):
+                return flag['name']
+        return None
+
+    async def prefetch_enhanced_keywords(self, email_data: Dict, user_flags: List[Dict]) -> Dict[str, List[str]]:
+        """
+        Fetch Gemini keywords for every custom-description flag of one email concurrently
+        
+        Returns a flag name -> keywords mapping suitable for the enhanced_keywords
+        argument of categorize_email_enhanced, so scoring itself never waits on the LLM.
+        """
+        enhanced_keywords = {}
+        if not self.gemini_async.is_available():
+            return enhanced_keywords
+        
+        # With the circuit open every flag falls back to its description words right away
+        if self.gemini.breaker.state == CIRCUIT_OPEN:
+            return enhanced_keywords
+        
+        subject = email_data.get('subject', '').lower()
+        body = email_data.get('body', '').lower()
+        custom_flags = [
+            flag for flag in user_flags
+            if self.has_custom_description(flag['description'].lower().strip())
+        ]
+        
+        with timed('gemini'):
+            results = await asyncio.gather(*(
+                self.gemini_async.enhance_keywords(
+                    user_prompt=flag['description'].lower().strip(),
+                    email_subject=subject,
+                    email_body=body,
+                    # Hard ceiling on how long one email can wait for the LLM
+                    timeout=self.settings.gemini_sorting_timeout_seconds
+                )
+                for flag in custom_flags
+            ))
+        
+        for flag, keywords in zip(custom_flags, results):
+            enhanced_keywords[flag['name']] = keywords
+        
+        return enhanced_keywords
+
+    def llm_request_cost(self, email_data: Dict, user_flags: List[Dict]) -> Tuple[int, int]:
+        """(calls, prompt tokens) prefetch_enhanced_keywords would spend on an email"""
+        subject = email_data.get('subject', '').lower()
+        body = email_data.get('body', '').lower()
+        prompts = [
+            self.gemini.build_keywords_prompt(flag['description'].lower().strip(), subject, body)
+            for flag in user_flags
+            if self.has_custom_description(flag['description'].lower().strip())
+        ]
+        return len(prompts), sum(estimate_tokens(prompt) for prompt in prompts)
+
+    def plan_llm_requests(self, ambiguous: List[Tuple[float, Any]], user_flags: List[Dict]) -> List[Any]:
+        """
+        Choose which locally decided items get Gemini keywords this session
+        
+        Args:
+            ambiguous: (ambiguity, item) pairs from score_with_ambiguity; items are emails
+                or anything with a representative email (e.g. a DuplicateCluster)
+        
+        Returns:
+            The chosen items, least certain first, within the per-session call/token budget
+        """
+        if not self.gemini_async.is_available() or self.gemini.breaker.state == CIRCUIT_OPEN:
+            return []
+        
+        budget = LLMBudget(self.settings.llm_session_max_calls, self.settings.llm_session_max_tokens)
+        selected = schedule_llm_requests(
+            ambiguous,
+            budget,
+            lambda item: self.llm_request_cost(getattr(item, 'representative', item), user_flags),
+            max_ambiguity=self.settings.llm_max_ambiguity
+        )
+        logger.info("LLM budget: %s", budget.stats())
+        return selected
+
+    def categorize_email_enhanced(self, email_data: Dict, user_flags: List[Dict],
+                                  enhanced_keywords: Optional[Dict[str, List[str]]] = None,
+                                  rules: Optional[CompiledRules] = None) -> Tuple[Optional[str], float]:
+        """
+        Enhanced email categorization using sender, subject, and message content
+        
+        enhanced_keywords optionally carries Gemini keywords already fetched per flag
+        (see prefetch_enhanced_keywords); when given, no Gemini call is made here.
+        rules is the user's compiled rule tables (see load_user_rules); defaults apply if omitted.
+        """
+        try:
+            # Casefold, tokenize and parse the sender once; every scorer below reuses it
+            view = self._normalize(email_data)
+            keyword_scores = self._keyword_scores(view, user_flags, enhanced_keywords, rules or self.rules)
+            
+            # Pass 2: regex signals, highest bound first, skipping flags that can't win
+            top = self._top_flags(view, keyword_scores, min_score=CATEGORY_THRESHOLD)
+            
+            # Lower threshold for better results
+            if top and top[0][1] >= CATEGORY_THRESHOLD:  # Lowered from 0.3 to 0.15
+                return top[0]
+            
+            return None, 0.0
+            
+        except Exception as e:
+            logger.error("Error in email categorization: %s", e)
+            return None, 0.0
+
+    def categorize_email_multi(self, email_data: Dict, user_flags: List[Dict],
+                               enhanced_keywords: Optional[Dict[str, List[str]]] = None,
+                               rules: Optional[CompiledRules] = None,
+                               max_labels: int = 0) -> List[Tuple[str, float]]:
+        """
+        Every flag scoring at least CATEGORY_THRESHOLD, best first, from one scoring pass
+        
+        max_labels caps how many flags are returned (top-k); 0 returns all of them. The
+        first entry is always what categorize_email_enhanced would pick.
+        """
+        try:
+            view = self._normalize(email_data)
+            keyword_scores = self._keyword_scores(view, user_flags, enhanced_keywords, rules or self.rules)
+            top = self._top_flags(view, keyword_scores, k=max_labels or len(keyword_scores) or 1,
+                                  min_score=CATEGORY_THRESHOLD)
+            return [(name, score) for name, score in top if score >= CATEGORY_THRESHOLD]
+            
+        except Exception as e:
+            logger.error("Error in email categorization: %s", e)
+            return []
+
+    def score_labels(self, email_data: Dict, user_flags: List[Dict], max_labels: int = 1,
+                     rules: Optional[CompiledRules] = None) -> Tuple[List[Tuple[str, float]], Optional[float]]:
+        """
+        Categorize with local rules only, returning the qualifying flags and how close the call was
+        
+        Returns:
+            (labels, ambiguity). labels are as from categorize_email_multi with the same
+            max_labels (1 = single label, 0 = all above the threshold). ambiguity describes
+            the best flag as in score_with_ambiguity.
+        """
         try:
-            subject = email_data.get('subject', '').lower()
-            sender = email_data.get('from', '').lower()
-            body = email_data.get('body', '').lower()
+            view = self._normalize(email_data)
+            keyword_scores = self._keyword_scores(view, user_flags, {}, rules or self.rules)
+            # The runner-up is needed for the margin even when it is below the threshold
+            k = max(2, max_labels or len(keyword_scores))
+            top = self._top_flags(view, keyword_scores, k=k)
             
-            # Extract domain from sender
-            domain = ''
-            if '@' in sender:
-                domain = sender.split('@')[1] if '@' in sender else ''
+            labels = [(name, score) for name, score in top if score >= CATEGORY_THRESHOLD][:max_labels or None]
+            best_score = top[0][1] if top else 0.0
+            second_score = top[1][1] if len(top) > 1 else 0.0
             
-            # Score each flag category
-            category_scores = {}
+            if not any(custom for _, _, custom in keyword_scores.values()):
+                return labels, None
+            if not labels:
+                return [], CATEGORY_THRESHOLD - best_score
+            return labels, min(best_score - second_score, best_score - CATEGORY_THRESHOLD)
             
-            for flag in user_flags:
-                flag_name = flag['name'].lower()
-                flag_description = flag['description'].lower().strip()
+        except Exception as e:
+            logger.error("Error in email categorization: %s", e)
+            return [], None
+
+    def score_locally(self, user_email: str, email_data: Dict, user_flags: List[Dict], max_labels: int = 1,
+                      rules: Optional[CompiledRules] = None,
+                      models: Optional[UserModels] = None) -> Tuple[List[Tuple[str, float]], Optional[float], str]:
+        """
+        Score with local rules, letting the learned classifier settle close calls
+        
+        Returns:
+            (labels, ambiguity, source) with labels and ambiguity as from score_labels.
+            When the classifier agrees with the best flag the decision needs no Gemini
+            call, so ambiguity is None and source is SOURCE_CLASSIFIER; otherwise
+            source is SOURCE_RULES.
+        """
+        labels, ambiguity = self.score_labels(email_data, user_flags, max_labels, rules)
+        if ambiguity is not None and labels:
+            confirmed, _ = self.classify_learned(user_email, email_data, user_flags, models, labels[0][0])
+            if confirmed:
+                return labels, None, SOURCE_CLASSIFIER
+        return labels, ambiguity, SOURCE_RULES
+
+    def score_with_ambiguity(self, email_data: Dict, user_flags: List[Dict],
+                             rules: Optional[CompiledRules] = None) -> Tuple[Optional[str], float, Optional[float]]:
+        """
+        Categorize with local rules only and report how close the decision was
+        
+        Returns:
+            (category, confidence, ambiguity). Lower ambiguity means less certain: for an
+            assigned email it is the smaller of the margin over the runner-up flag and
+            the distance above CATEGORY_THRESHOLD, for an unassigned one the distance
+            below the threshold. It is None when no flag has a custom description,
+            since Gemini keywords could not change the outcome.
+        """
+        labels, ambiguity = self.score_labels(email_data, user_flags, 1, rules)
+        category, confidence = labels[0] if labels else (None, 0.0)
+        return category, confidence, ambiguity
+
+    def _normalize(self, email_data: Dict) -> NormalizedEmail:
+        profile = current_email_profile()
+        if profile is None:
+            return normalize_email(email_data)
+        start = time.perf_counter()
+        view = normalize_email(email_data)
+        profile.add('normalize', time.perf_counter() - start)
+        return view
+
+    def _keyword_scores(self, view: NormalizedEmail, user_flags: List[Dict],
+                        enhanced_keywords: Optional[Dict[str, List[str]]],
+                        rules: CompiledRules) -> Dict[str, Tuple[float, float, bool]]:
+        """Keyword part of every flag's score, with an upper bound on its final score"""
+        subject = view.subject
+        body = view.body
+        
+        # Pass 1: keyword scores for every flag - cheap term-set lookups.
+        # Each flag's regex-based signals are still pending; keyword_scores holds
+        # (keyword score, upper bound on the final score, uses custom description).
+        # Like the dict the scores used to be collected in, a repeated flag name keeps
+        # its first position but takes the last occurrence's score.
+        keyword_scores = {}
+        profile = current_email_profile()  # Set in profiling mode only
+        
+        for flag in user_flags:
+            flag_name = flag['name'].lower()
+            flag_description = flag['description'].lower().strip()
+            
+            score = 0.0
+            flag_start = time.perf_counter() if profile else 0.0
+            gemini_seconds = 0.0
+            comparisons = 0
+            
+            # Check if user has provided custom description
+            if self.has_custom_description(flag_description):
+                # Use ONLY user's custom description - ignore predefined keywords
+                logger.debug("Using custom description for '%s': '%s'", flag['name'], flag_description, extra=PER_EMAIL)
                 
-                score = 0.0
+                # 1. Enhanced keyword analysis using Gemini AI (weight: 0.6)
+                flag_keywords = []
+                if enhanced_keywords is not None:
+                    flag_keywords = enhanced_keywords.get(flag['name'], [])
+                elif self.gemini.is_available():
+                    gemini_start = time.perf_counter()
+                    try:
+                        flag_keywords = self.gemini.enhance_keywords(
+                            user_prompt=flag_description,
+                            email_subject=subject,
+                            email_body=body,
+                            timeout=self.settings.gemini_sorting_timeout_seconds
+                        )
+                        logger.debug("Gemini enhanced keywords for '%s': %s", flag['name'], flag_keywords, extra=PER_EMAIL)
+                    except Exception as e:
+                        logger.warning("Error getting Gemini keywords: %s", e)
+                    gemini_seconds = time.perf_counter() - gemini_start
                 
-                # Check if user has provided custom description
-                has_custom_description = (
-                    flag_description and 
-                    flag_description not in [
-                        'high priority emails',
-                        'important business emails', 
-                        'emails requiring follow-up',
-                        'marketing and promotional emails',
-                        'business and work-related emails',
-                        'emails to archive'
-                    ]
-                )
+                # 2. Fallback: User's custom description analysis (weight: 0.8 if no Gemini, 0.4 if Gemini available)
+                # Split and clean description words, remove common stop words
+                description_words = [word.strip() for word in flag_description.split() 
+                                   if len(word) > 1 and word.lower() not in DESCRIPTION_STOP_WORDS]
                 
-                if has_custom_description:
-                    # Use ONLY user's custom description - ignore predefined keywords
-                    print(f"Using custom description for '{flag['name']}': '{flag_description}'")
-                    
-                    # 1. Enhanced keyword analysis using Gemini AI (weight: 0.6)
-                    enhanced_keywords = []
-                    if self.gemini.is_available():
-                        try:
-                            enhanced_keywords = self.gemini.enhance_keywords(
-                                user_prompt=flag_description,
-                                email_subject=subject,
-                                email_body=body
-                            )
-                            print(f"Gemini enhanced keywords for '{flag['name']}': {enhanced_keywords}")
-                        except Exception as e:
-                            print(f"Error getting Gemini keywords: {e}")
+                # Combine enhanced keywords with description words
+                all_keywords = flag_keywords + description_words
+                
+                if all_keywords:
+                    comparisons = 2 * len(all_keywords)
                     
-                    # 2. Fallback: User's custom description analysis (weight: 0.8 if no Gemini, 0.4 if Gemini available)
-                    # Split and clean description words, remove common stop words
-                    stop_words = {'or', 'and', 'the', 'a', 'an', 'to', 'for', 'of', 'in', 'on', 'at', 'with', 'by'}
-                    description_words = [word.strip() for word in flag_description.split() 
-                                       if len(word) > 1 and word.lower() not in stop_words]
+                    # Check subject (higher weight) - stemming covers plural/singular variants
+                    subject_matches = self._count_matches(view.subject_terms, all_keywords)
                     
-                    # Combine enhanced keywords with description words
-                    all_keywords = enhanced_keywords + description_words
+                    if subject_matches > 0:
+                        # Give higher weight if we have enhanced keywords from Gemini
+                        weight_factor = 0.6 if flag_keywords else 0.5
+                        score += min((subject_matches / len(all_keywords)) * weight_factor, weight_factor)
                     
-                    if all_keywords:
-                        # Check subject (higher weight) - with fuzzy matching for plurals/singulars
-                        subject_matches = 0
-                        for word in all_keywords:
-                            word_lower = word.lower()
-                            # Exact match
-                            if word_lower in subject:
-                                subject_matches += 1
-                            # Check singular/plural variants
-                            elif word_lower.endswith('s') and word_lower[:-1] in subject:  # plural -> singular
-                                subject_matches += 1
-                            elif not word_lower.endswith('s') and word_lower + 's' in subject:  # singular -> plural
-                                subject_matches += 1
-                        
-                        if subject_matches > 0:
-                            # Give higher weight if we have enhanced keywords from Gemini
-                            weight_factor = 0.6 if enhanced_keywords else 0.5
-                            score += min((subject_matches / len(all_keywords)) * weight_factor, weight_factor)
-                        
-                        # Check body with same fuzzy matching
-                        body_matches = 0
-                        for word in all_keywords:
-                            word_lower = word.lower()
-                            # Exact match
-                            if word_lower in body:
-                                body_matches += 1
-                            # Check singular/plural variants
-                            elif word_lower.endswith('s') and word_lower[:-1] in body:  # plural -> singular
-                                body_matches += 1
-                            elif not word_lower.endswith('s') and word_lower + 's' in body:  # singular -> plural
-                                body_matches += 1
-                        
-                        if body_matches > 0:
-                            # Give higher weight if we have enhanced keywords from Gemini
-                            weight_factor = 0.4 if enhanced_keywords else 0.3
-                            score += min((body_matches / len(all_keywords)) * weight_factor, weight_factor)
+                    # Check body with the same matching
+                    body_matches = self._count_matches(view.body_terms, all_keywords)
                     
-                    # 2. Secondary: Basic urgency analysis only for urgent flags (weight: 0.2)
-                    if flag_name == 'urgent':
-                        urgency_score = self._analyze_urgency(subject, body)
-                        score += urgency_score * 0.2
+                    if body_matches > 0:
+                        # Give higher weight if we have enhanced keywords from Gemini
+                        weight_factor = 0.4 if flag_keywords else 0.3
+                        score += min((body_matches / len(all_keywords)) * weight_factor, weight_factor)
                 
-                else:
-                    # Use predefined keywords for default descriptions
-                    print(f"Using predefined keywords for '{flag['name']}'")
+                # Only the urgency bonus (weight: 0.2, urgent flags) is left to add
+                bound = score + 0.2 if flag_name == 'urgent' else score
+                keyword_scores[flag['name']] = (score, min(bound, 1.0), True)
+            
+            else:
+                # Use predefined keywords for default descriptions
+                logger.debug("Using predefined keywords for '%s'", flag['name'], extra=PER_EMAIL)
+                
+                # 1. Check against predefined keywords
+                flag_rules = rules.get(flag_name)
+                if flag_rules is not None:
+                    comparisons = (len(flag_rules.subject) + len(flag_rules.body)
+                                   + len(flag_rules.sender) + len(flag_rules.domain))
+                    
+                    # Subject analysis (weight: 0.5) - increased weight
+                    subject_matches = self._count_terms(view.subject_terms, flag_rules.subject)
+                    if subject_matches > 0:
+                        score += min(subject_matches * 0.2, 0.5)  # Each match worth 0.2, max 0.5
                     
-                    # 1. Check against predefined keywords
-                    if flag_name in self.category_keywords:
-                        keywords = self.category_keywords[flag_name]
-                        
-                        # Subject analysis (weight: 0.5) - increased weight
-                        subject_matches = sum(1 for keyword in keywords['subject'] if keyword in subject)
-                        if subject_matches > 0:
-                            score += min(subject_matches * 0.2, 0.5)  # Each match worth 0.2, max 0.5
-                        
-                        # Body analysis (weight: 0.4) - increased weight  
-                        body_matches = sum(1 for keyword in keywords['body'] if keyword in body)
-                        if body_matches > 0:
-                            score += min(body_matches * 0.15, 0.4)  # Each match worth 0.15, max 0.4
-                        
-                        # Sender analysis (weight: 0.2)
-                        sender_matches = sum(1 for keyword in keywords['sender'] if keyword in sender)
-                        if sender_matches > 0:
-                            score += min(sender_matches * 0.1, 0.2)  # Each match worth 0.1, max 0.2
-                        
-                        # Domain analysis (weight: 0.1)
-                        if flag_name in self.domain_categories:
-                            domain_keywords = self.domain_categories[flag_name]
-                            domain_matches = sum(1 for keyword in domain_keywords if keyword in domain)
-                            if domain_matches > 0:
-                                score += min(domain_matches * 0.05, 0.1)  # Each match worth 0.05, max 0.1
+                    # Body analysis (weight: 0.4) - increased weight  
+                    body_matches = self._count_terms(view.body_terms, flag_rules.body)
+                    if body_matches > 0:
+                        score += min(body_matches * 0.15, 0.4)  # Each match worth 0.15, max 0.4
                     
-                    # 2. Pattern matching for common email types (weight: 0.3)
-                    pattern_score = self._analyze_email_patterns(subject, body, sender, flag_name)
-                    score += pattern_score * 0.3
+                    # Sender analysis (weight: 0.2)
+                    sender_matches = self._count_terms(view.sender_terms, flag_rules.sender)
+                    if sender_matches > 0:
+                        score += min(sender_matches * 0.1, 0.2)  # Each match worth 0.1, max 0.2
                     
-                    # 3. Sentiment and urgency analysis
-                    urgency_score = self._analyze_urgency(subject, body)
-                    if flag_name == 'urgent':
-                        score += urgency_score * 0.3
+                    # Domain analysis (weight: 0.1)
+                    domain_matches = self._count_terms(view.domain_terms, flag_rules.domain)
+                    if domain_matches > 0:
+                        score += min(domain_matches * 0.05, 0.1)  # Each match worth 0.05, max 0.1
                 
-                category_scores[flag['name']] = min(score, 1.0)  # Cap at 1.0
+                # Pattern (weight: 0.3) and urgency (weight: 0.3, urgent flags) signals are left to add
+                bound = score
+                if flag_name in PATTERN_FLAGS:
+                    bound += 0.3
+                if flag_name == 'urgent':
+                    bound += 0.3
+                keyword_scores[flag['name']] = (score, min(bound, 1.0), False)
             
-            # Find the best category
-            if category_scores:
-                best_category = max(category_scores.items(), key=lambda x: x[1])
-                category, confidence = best_category
-                
-                # Lower threshold for better results
-                if confidence >= 0.15:  # Lowered from 0.3 to 0.15
-                    return category, confidence
+            if profile is not None:
+                profile.add('keywords', time.perf_counter() - flag_start - gemini_seconds, flag['name'], comparisons)
+                if gemini_seconds:
+                    profile.add('gemini', gemini_seconds, flag['name'])
+        
+        return keyword_scores
+
+    def _top_flags(self, view: NormalizedEmail, keyword_scores: Dict[str, Tuple[float, float, bool]],
+                   k: int = 1, min_score: Optional[float] = None) -> List[Tuple[str, float]]:
+        """
+        Finish scoring with branch-and-bound and return the k best flags, best first
+        
+        Flags are completed in order of their upper bound. A flag is skipped once its
+        bound can't beat the current k-th best (ties go to the flag listed first, as
+        with max()), and scoring stops once no bound can reach min_score, so the
+        result is the same as scoring every flag in full. With min_score set, flags
+        below it may be missing from the result.
+        """
+        position = {name: index for index, name in enumerate(keyword_scores)}
+        order = sorted(keyword_scores, key=lambda name: (-keyword_scores[name][1], position[name]))
+        
+        top: List[Tuple[str, float]] = []
+        urgency = None  # Computed at most once per email
+        profile = current_email_profile()
+        
+        for name in order:
+            score, bound, custom = keyword_scores[name]
+            if min_score is not None and bound < min_score:
+                break  # Sorted by bound, so no remaining flag can reach min_score
+            if len(top) == k:
+                kth_name, kth_score = top[-1]
+                if bound < kth_score or (bound == kth_score and position[name] > position[kth_name]):
+                    continue
             
-            return None, 0.0
+            flag_name = name.lower()
+            if custom:
+                if flag_name == 'urgent':
+                    urgency = self._memoized_urgency(view, urgency, profile, name)
+                    score += urgency * 0.2
+            else:
+                pattern_start = time.perf_counter() if profile else 0.0
+                pattern_score = self._analyze_email_patterns(view, flag_name)
+                if profile is not None:
+                    profile.add('patterns', time.perf_counter() - pattern_start, name)
+                score += pattern_score * 0.3
+                if flag_name == 'urgent':
+                    urgency = self._memoized_urgency(view, urgency, profile, name)
+                    score += urgency * 0.3
+            score = min(score, 1.0)  # Cap at 1.0
             
-        except Exception as e:
-            print(f"Error in email categorization: {e}")
-            return None, 0.0
+            top.append((name, score))
+            top.sort(key=lambda item: (-item[1], position[item[0]]))
+            del top[k:]
+        
+        return top
+
+    def _memoized_urgency(self, view: NormalizedEmail, urgency: Optional[float],
+                          profile: Optional[EmailProfile], flag: str) -> float:
+        """_analyze_urgency unless already computed for this email, timed in profiling mode"""
+        if urgency is not None:
+            return urgency
+        if profile is None:
+            return self._analyze_urgency(view)
+        start = time.perf_counter()
+        urgency = self._analyze_urgency(view)
+        profile.add('urgency', time.perf_counter() - start, flag)
+        return urgency
+
+    def _count_matches(self, terms: FrozenSet[str], keywords: List[str]) -> int:
+        """Number of keywords (counting repeats) present in a term set of a NormalizedEmail"""
+        return self._count_terms(terms, [term_key(keyword) for keyword in keywords])
 
-    def _analyze_email_patterns(self, subject: str, body: str, sender: str, flag_name: str) -> float:
+    def _count_terms(self, terms: FrozenSet[str], keys: Tuple[str, ...]) -> int:
+        """Like _count_matches, for keywords already normalized with term_key"""
+        return sum(1 for key in keys if NormalizedEmail.has(terms, key))
+
+    def _analyze_email_patterns(self, view: NormalizedEmail, flag_name: str) -> float:
         """Analyze email patterns for better categorization"""
         score = 0.0
         
         # Pattern analysis for different categories
         if flag_name == 'urgent':
             # Check for urgent patterns
-            urgent_patterns = [
-                r'\b(urgent|asap|immediate|emergency)\b',
-                r'\b(deadline|due|expires?)\b',
-                r'\b(action required|time sensitive)\b',
-                r'[!]{2,}',  # Multiple exclamation marks
-                r'\b(final notice|last chance)\b'
-            ]
-            for pattern in urgent_patterns:
-                if re.search(pattern, subject + ' ' + body, re.IGNORECASE):
+            for pattern in URGENT_PATTERNS:
+                if pattern.search(view.text):
                     score += 0.2
         
         elif flag_name == 'important':
             # Check for important patterns
-            important_patterns = [
-                r'\b(meeting|conference|presentation)\b',
-                r'\b(project|proposal|contract)\b',
-                r'\b(approval|decision|review)\b',
-                r'\b(client|customer|partner)\b'
-            ]
-            for pattern in important_patterns:
-                if re.search(pattern, subject + ' ' + body, re.IGNORECASE):
+            for pattern in IMPORTANT_PATTERNS:
+                if pattern.search(view.text):
                     score += 0.15
         
         elif flag_name == 'follow-up':
             # Check for follow-up patterns
-            followup_patterns = [
-                r'\b(follow.?up|reminder|checking in)\b',
-                r'\b(status|update|progress)\b',
-                r'\b(next steps|action items)\b',
-                r'\bre:\s',  # Reply emails
-                r'\bfwd:\s'  # Forwarded emails
-            ]
-            for pattern in followup_patterns:
-                if re.search(pattern, subject + ' ' + body, re.IGNORECASE):
+            for pattern in FOLLOWUP_PATTERNS:
+                if pattern.search(view.text):
                     score += 0.2
         
         elif flag_name == 'junk':
             # Check for junk patterns (enhanced for marketing detection)
-            junk_patterns = [
-                r'\b(newsletter|notification|receipt)\b',
-                r'\b(confirmation|invoice|statement)\b',
-                r'\b(unsubscribe|opt.?out|preferences)\b',
-                r'\b(automated|system|no.?reply|noreply)\b',
-                r'\b(marketing|promo|promotion|promotional)\b',
-                r'\b(sale|discount|offer|deal|coupon)\b',
-                r'\b(advertisement|ad|sponsor|featured)\b',
-                r'\b(limited.?time|expires?|hurry)\b',
-                r'\b(free.?shipping|%\s*off|save\s*\$)\b',
-                r'\b(subscribe|mailing.?list|newsletter)\b'
-            ]
-            for pattern in junk_patterns:
-                if re.search(pattern, subject + ' ' + body + ' ' + sender, re.IGNORECASE):
+            text = view.text + ' ' + view.sender
+            for pattern in JUNK_PATTERNS:
+                if pattern.search(text):
                     score += 0.3  # Increased score for marketing detection
             
             # Check for marketing domains and sender patterns
-            marketing_sender_patterns = [
-                r'@.*marketing\.',
-                r'@.*promo\.',
-                r'@.*newsletter\.',
-                r'@.*deals\.',
-                r'@.*offers?\.',
-                r'noreply@',
-                r'no-reply@',
-                r'donotreply@'
-            ]
-            for pattern in marketing_sender_patterns:
-                if re.search(pattern, sender, re.IGNORECASE):
+            for pattern in MARKETING_SENDER_PATTERNS:
+                if pattern.search(view.sender):
                     score += 0.4  # High score for marketing senders
         
         return min(score, 1.0)
 
-    def _analyze_urgency(self, subject: str, body: str) -> float:
+    def _analyze_urgency(self, view: NormalizedEmail) -> float:
         """Analyze urgency indicators in email"""
         urgency_score = 0.0
         
-        # High urgency indicators
-        high_urgency = ['urgent', 'asap', 'immediate', 'emergency', 'critical']
-        medium_urgency = ['important', 'priority', 'deadline', 'time-sensitive']
-        
-        text = subject + ' ' + body
-        
-        for word in high_urgency:
-            if word in text:
-                urgency_score += 0.3
-        
-        for word in medium_urgency:
-            if word in text:
-                urgency_score += 0.2
+        # High and medium urgency indicators
+        urgency_score += 0.3 * self._count_matches(view.text_terms, HIGH_URGENCY_WORDS)
+        urgency_score += 0.2 * self._count_matches(view.text_terms, MEDIUM_URGENCY_WORDS)
         
         # Check for punctuation indicators
-        if '!!!' in text or '???' in text:
+        if '!!!' in view.text or '???' in view.text:
             urgency_score += 0.2
         
         # Check for time-based urgency
-        time_patterns = [
-            r'\b(today|tonight|tomorrow)\b',
-            r'\b(this week|next week)\b',
-            r'\b(deadline|due date|expires?)\b'
-        ]
-        
-        for pattern in time_patterns:
-            if re.search(pattern, text, re.IGNORECASE):
+        for pattern in TIME_URGENCY_PATTERNS:
+            if pattern.search(view.text):
                 urgency_score += 0.15
         
         return min(urgency_score, 1.0)
 
     # Keep the original method for backward compatibility
-    def categorize_email(self, email_data: Dict, user_flags: List[Dict]) -> Tuple[Optional[str], float]:
+    def categorize_email(self, email_data: Dict, user_flags: List[Dict],
+                         rules: Optional[CompiledRules] = None) -> Tuple[Optional[str], float]:
         """Original categorization method - kept for backward compatibility"""
-        return self.categorize_email_enhanced(email_data, user_flags)
+        return self.categorize_email_enhanced(email_data, user_flags, rules=rules)
+
+    def snapshot(self, user_flags: List[Dict], rules: Optional[CompiledRules] = None) -> CategorizationSnapshot:
+        """Capture the flags and rule tables in a form that can be shipped to worker processes"""
+        return CategorizationSnapshot(
+            user_flags=[dict(flag) for flag in user_flags],
+            rules=rules or self.rules
+        )
 
-    def batch_categorize_emails(self, emails: List[Dict], user_flags: List[Dict]) -> List[Dict]:
+    def _batch_result(self, email: Dict, category: Optional[str], confidence: float) -> Dict:
+        return {
+            'email_id': email.get('id'),
+            'email_subject': email.get('subject'),
+            'email_from': email.get('from'),
+            'assigned_category': category,
+            'confidence_score': confidence,
+            'timestamp': datetime.utcnow()
+        }
+
+    def iter_batch_categorize(self, emails: List[Dict], user_flags: List[Dict],
+                              parallel: bool = False, max_workers: Optional[int] = None,
+                              vectorized: bool = False, rules: Optional[CompiledRules] = None) -> Iterator[Dict]:
         """
-        Categorize a batch of emails
-        Returns list of categorization results
+        Categorize a batch of emails, yielding results in input order as they become available
+        
+        In parallel mode emails are scored with the local rules only (no Gemini calls),
+        in a process pool sized to the batch; small batches take an inline fast path.
+        Vectorized mode also uses local rules only and scores blocks of emails with
+        sparse matrix products (see VectorizedScorer). It gains the most with many
+        flags; with a handful of flags and short bodies it runs about as fast as the
+        serial loop, and it holds a block of VECTORIZED_BLOCK_SIZE emails in memory.
         """
-        results = []
+        if vectorized:
+            from .vectorized_scoring import VectorizedScorer
+            scorer = VectorizedScorer(self, user_flags, rules)
+            for start in range(0, len(emails), VECTORIZED_BLOCK_SIZE):
+                block = emails[start:start + VECTORIZED_BLOCK_SIZE]
+                for email, (category, confidence) in zip(block, scorer.categorize(block)):
+                    yield self._batch_result(email, category, confidence)
+            return
+        
+        if not parallel:
+            for email in emails:
+                category, confidence = self.categorize_email(email, user_flags, rules)
+                yield self._batch_result(email, category, confidence)
+            return
+        
+        workers, chunk_size = plan_parallelism(len(emails), max_workers)
         
-        for email in emails:
-            category, confidence = self.categorize_email(email, user_flags)
-            results.append({
-                'email_id': email.get('id'),
-                'email_subject': email.get('subject'),
-                'email_from': email.get('from'),
-                'assigned_category': category,
-                'confidence_score': confidence,
-                'timestamp': datetime.utcnow()
-            })
+        if workers == 1:
+            for email in emails:
+                category, confidence = self.categorize_email_enhanced(email, user_flags, {}, rules)
+                yield self._batch_result(email, category, confidence)
+            return
         
-        return results
+        snapshot = self.snapshot(user_flags, rules)
+        for email, category, confidence in iter_categorize_parallel(snapshot, emails, workers, chunk_size):
+            yield self._batch_result(email, category, confidence)
+
+    def batch_categorize_emails(self, emails: List[Dict], user_flags: List[Dict],
+                                parallel: bool = False, max_workers: Optional[int] = None,
+                                vectorized: bool = False, rules: Optional[CompiledRules] = None) -> List[Dict]:
+        """
+        Categorize a batch of emails
+        Returns list of categorization results
+        """
+        return list(self.iter_batch_categorize(emails, user_flags, parallel, max_workers, vectorized, rules))
 
     async def create_sorting_session(self, email: str, flag_names: List[str]) -> Optional[str]:
         """Create a new sorting session"""
@@ -374,129 +744,93 @@ class EmailCategorizationService:
             session_id = str(uuid.uuid4())
             flags_used = ','.join(flag_names)
             
-            with get_db() as db:
-                cursor = db.cursor()
-                if get_db_type() == "postgres":
-                    cursor.execute("""
-                        INSERT INTO sorting_sessions (session_id, email, flags_used, status)
-                        VALUES (%s, %s, %s, %s)
-                    """, (session_id, email, flags_used, 'running'))
-                else:
-                    cursor.execute("""
-                        INSERT INTO sorting_sessions (session_id, email, flags_used, status)
-                        VALUES (?, ?, ?, ?)
-                    """, (session_id, email, flags_used, 'running'))
-                db.commit()
+            await execute(queries.INSERT_SORTING_SESSION, (session_id, email, flags_used, 'running'))
             
+            session_progress.start(session_id, email)
             return session_id
         except Exception as e:
-            print(f"Error creating sorting session: {e}")
+            logger.error("Error creating sorting session: %s", e)
             return None
 
     async def update_sorting_session(self, session_id: str, **kwargs):
-        """Update sorting session with new data"""
+        """Update sorting session with new data (in the live progress registry and the database)"""
         try:
+            finishing = kwargs.get('status') in ['completed', 'failed']
+            if finishing:
+                kwargs['end_time'] = datetime.now()
+                # Progress counted in memory since the last write
+                progress = session_progress.get(session_id)
+                if progress is not None and kwargs.get('processed_emails') is None:
+                    kwargs['processed_emails'] = progress.processed_emails
+            session_progress.update(session_id, **kwargs)
+            
             # Build update query dynamically
             update_fields = []
             values = []
             
             for key, value in kwargs.items():
                 if value is not None:
-                    update_fields.append(f"{key} = {'%s' if get_db_type() == 'postgres' else '?'}")
+                    update_fields.append(f"{key} = ?")
                     values.append(value)
             
             if not update_fields:
                 return
             
-            # Add end_time if status is being set to completed or failed
-            if 'status' in kwargs and kwargs['status'] in ['completed', 'failed']:
-                update_fields.append(f"end_time = {'%s' if get_db_type() == 'postgres' else '?'}")
-                values.append(datetime.now())
+            if finishing:
+                # The session's log rows are readable once it is marked finished
+                await processing_log.flush_async()
             
             values.append(session_id)
             
-            query = f"UPDATE sorting_sessions SET {', '.join(update_fields)} WHERE session_id = {'%s' if get_db_type() == 'postgres' else '?'}"
+            query = f"UPDATE sorting_sessions SET {', '.join(update_fields)} WHERE session_id = ?"
             
-            with get_db() as db:
-                cursor = db.cursor()
-                cursor.execute(query, values)
-                db.commit()
+            await execute(query, values)
+            if 'processed_emails' in kwargs:
+                session_progress.mark_persisted(session_id)
                 
         except Exception as e:
-            print(f"Error updating sorting session: {e}")
+            logger.error("Error updating sorting session: %s", e)
+
+    async def record_email_progress(self, session_id: str, labels: List[str] = ()):
+        """Count one processed email and its applied labels; written to sorting_sessions at most every progress_persist_seconds"""
+        progress = session_progress.advance(session_id, labels)
+        if progress is not None and progress.persist_due(self.settings.progress_persist_seconds):
+            await self.update_sorting_session(session_id, processed_emails=progress.processed_emails)
 
     async def log_email_processing(self, session_id: str, email_data: Dict):
-        """Log email processing result"""
-        try:
-            with get_db() as db:
-                cursor = db.cursor()
-                if get_db_type() == "postgres":
-                    cursor.execute("""
-                        INSERT INTO email_processing_log 
-                        (session_id, email_id, email_subject, email_from, assigned_label, 
-                         confidence_score, status, error_details)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                    """, (
-                        session_id,
-                        email_data.get('email_id'),
-                        email_data.get('email_subject'),
-                        email_data.get('email_from'),
-                        email_data.get('assigned_category'),
-                        email_data.get('confidence_score'),
-                        email_data.get('status'),
-                        email_data.get('error_details')
-                    ))
-                else:
-                    cursor.execute("""
-                        INSERT INTO email_processing_log 
-                        (session_id, email_id, email_subject, email_from, assigned_label, 
-                         confidence_score, status, error_details)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                    """, (
-                        session_id,
-                        email_data.get('email_id'),
-                        email_data.get('email_subject'),
-                        email_data.get('email_from'),
-                        email_data.get('assigned_category'),
-                        email_data.get('confidence_score'),
-                        email_data.get('status'),
-                        email_data.get('error_details')
-                    ))
-                db.commit()
-                
-        except Exception as e:
-            print(f"Error logging email processing: {e}")
+        """Log email processing result (buffered; written in batches by processing_log)"""
+        processing_log.add((
+            session_id,
+            email_data.get('email_id'),
+            email_data.get('email_subject'),
+            email_data.get('email_from'),
+            email_data.get('assigned_category'),
+            email_data.get('confidence_score'),
+            email_data.get('status'),
+            email_data.get('error_details'),
+            email_data.get('cluster_id'),
+            email_data.get('decision_source')
+        ))
 
     async def get_sorting_history(self, email: str, limit: int = 10) -> List[Dict]:
         """Get user's sorting session history"""
         try:
-            with get_db() as db:
-                cursor = db.cursor()
-                cursor.execute("""
-                    SELECT session_id, start_time, end_time, status, 
-                           total_emails, processed_emails, flags_used, error_message
-                    FROM sorting_sessions 
-                    WHERE email = ?
-                    ORDER BY start_time DESC
-                    LIMIT ?
-                """, (email, limit))
-                
-                rows = cursor.fetchall()
-                history = []
-                
-                for row in rows:
-                    history.append({
-                        'session_id': row['session_id'],
-                        'start_time': row['start_time'],
-                        'end_time': row['end_time'],
-                        'status': row['status'],
-                        'total_emails': row['total_emails'],
-                        'processed_emails': row['processed_emails'],
-                        'flags_used': row['flags_used'].split(',') if row['flags_used'] else [],
-                        'error_message': row['error_message']
-                    })
-                
-                return history
+            rows = await fetch_all(queries.SESSION_HISTORY, (email, limit))
+            
+            history = []
+            for row in rows:
+                history.append({
+                    'session_id': row['session_id'],
+                    'start_time': row['start_time'],
+                    'end_time': row['end_time'],
+                    'status': row['status'],
+                    'total_emails': row['total_emails'],
+                    'processed_emails': row['processed_emails'],
+                    'flags_used': row['flags_used'].split(',') if row['flags_used'] else [],
+                    'error_message': row['error_message']
+                })
+            
+            return history
         except Exception:
             return []
 
@@ -524,12 +858,12 @@ class EmailCategorizationService:
             flag_names = [flag['name'] for flag in user_flags]
             
             # Get AI suggestions
-            suggestions = self.gemini.generate_flag_suggestions(email_content, flag_names)
+            suggestions = await self.gemini_async.generate_flag_suggestions(email_content, flag_names)
             
             return suggestions
             
         except Exception as e:
-            print(f"Error getting AI flag suggestions: {e}")
+            logger.error("Error getting AI flag suggestions: %s", e)
             return []
 
     async def enhance_user_keywords(self, user_prompt: str, email_context: Dict = None) -> List[str]:
@@ -550,7 +884,7 @@ class EmailCategorizationService:
             email_subject = email_context.get('subject', '') if email_context else ''
             email_body = email_context.get('body', '') if email_context else ''
             
-            enhanced_keywords = self.gemini.enhance_keywords(
+            enhanced_keywords = await self.gemini_async.enhance_keywords(
                 user_prompt=user_prompt,
                 email_subject=email_subject,
                 email_body=email_body
@@ -559,5 +893,5 @@ class EmailCategorizationService:
             return enhanced_keywords
             
         except Exception as e:
-            print(f"Error enhancing user keywords: {e}")
+            logger.error("Error enhancing user keywords: %s", e)
             return [] 
\ No newline at end of file
@@ -0,0 +1,109 @@
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Set, Tuple
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:['-][a-z0-9]+)*")
+SENDER_ADDRESS_PATTERN = re.compile(r"<([^>]+)>")
+
+def parse_sender(sender: str) -> Tuple[str, str]:
+    """Extract the lowercased address and domain from a From header"""
+    sender = (sender or '').strip().lower()
+    match = SENDER_ADDRESS_PATTERN.search(sender)
+    address = (match.group(1) if match else sender).strip()
+    domain = address.rsplit('@', 1)[1] if '@' in address else ''
+    return address, domain
+
+@lru_cache(maxsize=65536)
+def stem(token: str) -> str:
+    """Light plural stemming, so singular and plural forms share a term"""
+    if len(token) > 4 and token.endswith('ies'):
+        return token[:-3] + 'y'
+    if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+        return token[:-1]
+    return token
+
+def _tokens(text: str) -> List[str]:
+    return [stem(token) for token in TOKEN_PATTERN.findall(text)]
+
+def _terms(text: str) -> FrozenSet[str]:
+    """
+    Stemmed tokens and adjacent-token bigrams of a casefolded text
+
+    Hyphenated tokens also contribute their parts and the joined form, so
+    'no-reply' matches the keywords 'no-reply', 'reply' and 'noreply'.
+    """
+    tokens = _tokens(text)
+    terms: Set[str] = set(tokens)
+    terms.update(f"{a} {b}" for a, b in zip(tokens, tokens[1:]))
+    for token in tokens:
+        if '-' in token:
+            parts = token.split('-')
+            terms.update(stem(part) for part in parts)
+            terms.add(stem(''.join(parts)))
+    return frozenset(terms)
+
+@lru_cache(maxsize=8192)
+def term_key(keyword: str) -> str:
+    """
+    Normalize a keyword into the form stored in NormalizedEmail term sets
+
+    One-word keywords become their stem and two-word keywords a bigram. Longer
+    phrases are kept as space-joined stems and matched bigram by bigram (see
+    NormalizedEmail.has). Returns '' for keywords without any word characters.
+    """
+    return ' '.join(_tokens(keyword.casefold()))
+
+@dataclass(frozen=True)
+class NormalizedEmail:
+    """
+    Everything the scorers need from one email, computed once
+
+    Text fields are casefolded; *_terms are stemmed token and bigram sets so
+    keyword lookups are set-membership checks instead of substring scans.
+    """
+    subject: str
+    body: str
+    sender: str
+    address: str
+    domain: str
+    text: str  # subject + ' ' + body, for the regex-based analyzers
+    subject_terms: FrozenSet[str]
+    body_terms: FrozenSet[str]
+    sender_terms: FrozenSet[str]
+    domain_terms: FrozenSet[str]
+    text_terms: FrozenSet[str]  # Union of subject_terms and body_terms
+
+    @staticmethod
+    def has(terms: FrozenSet[str], key: str) -> bool:
+        """Check whether a term_key() result occurs in a term set"""
+        if not key:
+            return False
+        if key in terms:
+            return True
+        words = key.split(' ')
+        if len(words) <= 2:
+            return False
+        return all(f"{a} {b}" in terms for a, b in zip(words, words[1:]))
+
+def normalize_email(email_data: Dict) -> NormalizedEmail:
+    """Build the normalized view of an email dict ('subject', 'from', 'body')"""
+    subject = (email_data.get('subject') or '').casefold()
+    body = (email_data.get('body') or '').casefold()
+    sender = (email_data.get('from') or '').casefold()
+    address, domain = parse_sender(sender)
+    subject_terms = _terms(subject)
+    body_terms = _terms(body)
+    return NormalizedEmail(
+        subject=subject,
+        body=body,
+        sender=sender,
+        address=address,
+        domain=domain,
+        text=subject + ' ' + body,
+        subject_terms=subject_terms,
+        body_terms=body_terms,
+        sender_terms=_terms(sender),
+        domain_terms=_terms(domain.replace('.', ' ')),
+        text_terms=subject_terms | body_terms
+    )
@@ -1,39 +1,63 @@
 import google.generativeai as genai
+import asyncio
+import concurrent.futures
 import logging
+import time
 from typing import List, Optional
 from ..config import get_settings
+from .response_cache import ResponseCache, cache_key
+from .circuit_breaker import CircuitBreaker, CircuitOpenError
 
 logger = logging.getLogger(__name__)
 
+GEMINI_MODEL_NAME = 'gemini-pro'
+
+# Process-wide limit on in-flight async Gemini requests, created lazily per event loop
+_request_slots: Optional[asyncio.Semaphore] = None
+_request_slots_loop: Optional[asyncio.AbstractEventLoop] = None
+
+def _get_request_slots(max_concurrency: int) -> asyncio.Semaphore:
+    """Return the shared request semaphore for the running event loop"""
+    global _request_slots, _request_slots_loop
+    loop = asyncio.get_running_loop()
+    if _request_slots is None or _request_slots_loop is not loop:
+        _request_slots = asyncio.Semaphore(max_concurrency)
+        _request_slots_loop = loop
+    return _request_slots
+
+# Responses shared by every AsyncGeminiClient in the process, keyed by model and prompt
+_settings = get_settings()
+response_cache = ResponseCache(_settings.gemini_cache_max_entries, _settings.gemini_cache_ttl_seconds)
+
+# Threads running blocking Gemini calls, so the caller can stop waiting at the deadline.
+# A hung call keeps its thread until the client gives up, so the pool is bounded like the async path
+_blocking_calls = concurrent.futures.ThreadPoolExecutor(_settings.gemini_max_concurrency, thread_name_prefix="gemini")
+
+# Shared health tracking for every Gemini call; when open, callers fall back to local rules
+circuit_breaker = CircuitBreaker(
+    'gemini',
+    window_size=_settings.gemini_breaker_window,
+    min_requests=_settings.gemini_breaker_min_requests,
+    max_error_rate=_settings.gemini_breaker_max_error_rate,
+    max_p95_latency=_settings.gemini_breaker_max_p95_latency,
+    open_seconds=_settings.gemini_breaker_open_seconds,
+    half_open_probes=_settings.gemini_breaker_half_open_probes
+)
+
 class GeminiService:
     def __init__(self):
         self.settings = get_settings()
+        self.breaker = circuit_breaker
         if self.settings.gemini_api_key:
             genai.configure(api_key=self.settings.gemini_api_key)
-            self.model = genai.GenerativeModel('gemini-pro')
+            self.model = genai.GenerativeModel(GEMINI_MODEL_NAME)
         else:
             self.model = None
             logger.warning("Gemini API key not configured - AI keyword enhancement disabled")
 
-    def enhance_keywords(self, user_prompt: str, email_subject: str = "", email_body: str = "") -> List[str]:
-        """
-        Use Gemini AI to generate enhanced keywords based on user prompt and email content
-        
-        Args:
-            user_prompt: User's description of what emails they want to flag
-            email_subject: Subject of the email being categorized
-            email_body: Body content of the email being categorized
-            
-        Returns:
-            List of enhanced keywords for better email matching
-        """
-        if not self.model:
-            logger.warning("Gemini model not available - returning empty keywords")
-            return []
-        
-        try:
-            # Create a comprehensive prompt for Gemini
-            system_prompt = f"""
+    def build_keywords_prompt(self, user_prompt: str, email_subject: str = "", email_body: str = "") -> str:
+        """Build the keyword enhancement prompt sent to Gemini"""
+        return f"""
 You are an email categorization expert. Given a user's description of emails they want to flag and optionally some email content, generate relevant keywords that would help identify similar emails.
 
 User wants to flag emails about: "{user_prompt}"
@@ -53,22 +77,129 @@ Return only the keywords/phrases, one per line, without numbering or bullet poin
 Focus on terms that would appear in email subjects, sender names, or email content.
 """
 
-            response = self.model.generate_content(system_prompt)
+    def parse_keywords(self, text: str) -> List[str]:
+        """Parse Gemini's one-keyword-per-line response"""
+        keywords = [
+            keyword.strip()
+            for keyword in text.split('\n')
+            if keyword.strip() and len(keyword.strip()) > 1
+        ]
+        return keywords[:15]  # Limit to 15 keywords
+
+    def build_suggestions_prompt(self, email_content: str, existing_flags: List[str]) -> str:
+        """Build the flag suggestion prompt sent to Gemini"""
+        flags_list = ", ".join(existing_flags)
+        return f"""
+Analyze this email content and suggest which flags from the available list would be most appropriate:
+
+Available flags: {flags_list}
+
+Email content:
+{email_content[:1000]}
+
+For each relevant flag, provide:
+1. Flag name (must be from the available list)
+2. Confidence score (0.0 to 1.0)
+3. Brief reason
+
+Format as: FLAG_NAME|CONFIDENCE|REASON
+Example: Urgent|0.8|Contains time-sensitive deadline language
+
+Only suggest flags with confidence > 0.3. Maximum 3 suggestions.
+"""
+
+    def parse_suggestions(self, text: str, existing_flags: List[str]) -> List[dict]:
+        """Parse Gemini's FLAG|CONFIDENCE|REASON response lines"""
+        suggestions = []
+        for line in text.split('\n'):
+            if '|' in line:
+                parts = line.split('|')
+                if len(parts) >= 3:
+                    flag_name = parts[0].strip()
+                    try:
+                        confidence = float(parts[1].strip())
+                        reason = parts[2].strip()
+                        if flag_name in existing_flags and confidence > 0.3:
+                            suggestions.append({
+                                'flag': flag_name,
+                                'confidence': confidence,
+                                'reason': reason
+                            })
+                    except ValueError:
+                        continue
+        
+        return suggestions[:3]  # Limit to top 3 suggestions
+
+    def _generate(self, prompt: str, timeout: Optional[float] = None) -> str:
+        """
+        Blocking Gemini call guarded by the circuit breaker and a deadline
+        
+        The deadline is timeout, or gemini_timeout_seconds when not given.
+        
+        Raises:
+            CircuitOpenError: if the circuit is open and the call was not attempted
+            TimeoutError: if the call does not finish within the deadline
+        """
+        permit = self.breaker.allow_request()
+        if permit is None:
+            raise CircuitOpenError("Gemini circuit is open")
+        
+        deadline = timeout or self.settings.gemini_timeout_seconds
+        start = time.monotonic()
+        future = _blocking_calls.submit(self.model.generate_content, prompt)
+        try:
+            response = future.result(timeout=deadline)
+        except concurrent.futures.TimeoutError:
+            # Still queued calls are dropped; a running one is abandoned to finish on its own
+            future.cancel()
+            self.breaker.record_failure(time.monotonic() - start, permit)
+            raise TimeoutError(f"Gemini call timed out after {deadline}s")
+        except Exception:
+            self.breaker.record_failure(time.monotonic() - start, permit)
+            raise
+        self.breaker.record_success(time.monotonic() - start, permit)
+        return response.text
+
+    def enhance_keywords(self, user_prompt: str, email_subject: str = "", email_body: str = "",
+                         timeout: Optional[float] = None) -> List[str]:
+        """
+        Use Gemini AI to generate enhanced keywords based on user prompt and email content
+        
+        Args:
+            user_prompt: User's description of what emails they want to flag
+            email_subject: Subject of the email being categorized
+            email_body: Body content of the email being categorized
+            timeout: Deadline in seconds for the Gemini call (gemini_timeout_seconds by default)
+        
+        Returns:
+            List of enhanced keywords for better email matching
+        """
+        if not self.model:
+            logger.warning("Gemini model not available - returning empty keywords")
+            return []
+        
+        try:
+            # Create a comprehensive prompt for Gemini
+            system_prompt = self.build_keywords_prompt(user_prompt, email_subject, email_body)
+            
+            text = self._generate(system_prompt, timeout)
             
-            if response.text:
+            if text:
                 # Parse the response into a list of keywords
-                keywords = [
-                    keyword.strip() 
-                    for keyword in response.text.split('\n') 
-                    if keyword.strip() and len(keyword.strip()) > 1
-                ]
+                keywords = self.parse_keywords(text)
                 
                 logger.info(f"Generated {len(keywords)} keywords from Gemini for prompt: {user_prompt}")
-                return keywords[:15]  # Limit to 15 keywords
+                return keywords
             else:
                 logger.warning("Gemini returned empty response")
                 return []
-                
+        
+        except TimeoutError as e:
+            logger.warning(f"Gemini keyword enhancement failed: {e}")
+            return []
+        except CircuitOpenError:
+            logger.debug("Gemini circuit open - skipping keyword enhancement")
+            return []
         except Exception as e:
             logger.error(f"Error generating keywords with Gemini: {str(e)}")
             return []
@@ -80,7 +211,7 @@ Focus on terms that would appear in email subjects, sender names, or email conte
         Args:
             email_content: Full email content (subject + body)
             existing_flags: List of existing flag names
-            
+        
         Returns:
             List of flag suggestions with confidence scores
         """
@@ -88,54 +219,127 @@ Focus on terms that would appear in email subjects, sender names, or email conte
             return []
         
         try:
-            flags_list = ", ".join(existing_flags)
-            prompt = f"""
-Analyze this email content and suggest which flags from the available list would be most appropriate:
+            prompt = self.build_suggestions_prompt(email_content, existing_flags)
+            
+            text = self._generate(prompt)
+            
+            if text:
+                return self.parse_suggestions(text, existing_flags)
+        
+        except TimeoutError as e:
+            logger.warning(f"Gemini flag suggestions failed: {e}")
+        except CircuitOpenError:
+            logger.debug("Gemini circuit open - skipping flag suggestions")
+        except Exception as e:
+            logger.error(f"Error generating flag suggestions with Gemini: {str(e)}")
+        
+        return []
 
-Available flags: {flags_list}
+    def is_available(self) -> bool:
+        """Check if Gemini service is properly configured and available"""
+        return self.model is not None
 
-Email content:
-{email_content[:1000]}
+class AsyncGeminiClient:
+    """
+    Non-blocking wrapper around GeminiService for use from async code.
 
-For each relevant flag, provide:
-1. Flag name (must be from the available list)
-2. Confidence score (0.0 to 1.0)
-3. Brief reason
+    Every call is bounded by a deadline (which includes time spent waiting
+    for a slot) and by a process-wide concurrency limit. Identical prompts are
+    answered from a shared response cache, and concurrent identical prompts
+    share a single in-flight request.
+    """
 
-Format as: FLAG_NAME|CONFIDENCE|REASON
-Example: Urgent|0.8|Contains time-sensitive deadline language
+    def __init__(self, service: GeminiService, timeout: Optional[float] = None, max_concurrency: Optional[int] = None,
+                 cache: Optional[ResponseCache] = None):
+        self.service = service
+        self.timeout = timeout if timeout is not None else service.settings.gemini_timeout_seconds
+        self.max_concurrency = max_concurrency or service.settings.gemini_max_concurrency
+        self.cache = cache or response_cache
 
-Only suggest flags with confidence > 0.3. Maximum 3 suggestions.
-"""
+    def is_available(self) -> bool:
+        """Check if the wrapped Gemini service is available"""
+        return self.service.is_available()
 
-            response = self.model.generate_content(prompt)
-            
-            if response.text:
-                suggestions = []
-                for line in response.text.split('\n'):
-                    if '|' in line:
-                        parts = line.split('|')
-                        if len(parts) >= 3:
-                            flag_name = parts[0].strip()
-                            try:
-                                confidence = float(parts[1].strip())
-                                reason = parts[2].strip()
-                                if flag_name in existing_flags and confidence > 0.3:
-                                    suggestions.append({
-                                        'flag': flag_name,
-                                        'confidence': confidence,
-                                        'reason': reason
-                                    })
-                            except ValueError:
-                                continue
-                
-                return suggestions[:3]  # Limit to top 3 suggestions
-            
+    async def _call(self, prompt: str) -> str:
+        async with _get_request_slots(self.max_concurrency):
+            response = await self.service.model.generate_content_async(prompt)
+        return response.text
+
+    async def _guarded_call(self, prompt: str, deadline: float) -> str:
+        """Run _call under the deadline, reporting the outcome to the circuit breaker"""
+        breaker = self.service.breaker
+        permit = breaker.allow_request()
+        if permit is None:
+            raise CircuitOpenError("Gemini circuit is open")
+        
+        start = time.monotonic()
+        try:
+            text = await asyncio.wait_for(self._call(prompt), deadline)
+        except asyncio.CancelledError:
+            breaker.record_cancelled(permit)
+            raise
+        except Exception:
+            # Timeouts count as failures too
+            breaker.record_failure(time.monotonic() - start, permit)
+            raise
+        breaker.record_success(time.monotonic() - start, permit)
+        return text
+
+    async def generate_text(self, prompt: str, timeout: Optional[float] = None) -> str:
+        """
+        Send a prompt to Gemini and return the response text, using the response cache
+        
+        Raises:
+            asyncio.TimeoutError: if the call does not finish within the deadline
+            CircuitOpenError: if Gemini is considered unhealthy and was not called
+        """
+        deadline = timeout or self.timeout
+        # A request joined by later callers keeps the deadline of the caller that started it
+        return await self.cache.get_or_fetch(
+            cache_key(GEMINI_MODEL_NAME, prompt),
+            lambda: self._guarded_call(prompt, deadline),
+            deadline
+        )
+
+    async def enhance_keywords(self, user_prompt: str, email_subject: str = "", email_body: str = "",
+                               timeout: Optional[float] = None) -> List[str]:
+        """Async counterpart of GeminiService.enhance_keywords"""
+        if not self.is_available():
+            return []
+        
+        try:
+            prompt = self.service.build_keywords_prompt(user_prompt, email_subject, email_body)
+            text = await self.generate_text(prompt, timeout)
+            if text:
+                keywords = self.service.parse_keywords(text)
+                logger.info(f"Generated {len(keywords)} keywords from Gemini for prompt: {user_prompt}")
+                return keywords
+            logger.warning("Gemini returned empty response")
+        except asyncio.TimeoutError:
+            logger.warning(f"Gemini keyword enhancement timed out after {timeout or self.timeout}s")
+        except CircuitOpenError:
+            logger.debug("Gemini circuit open - skipping keyword enhancement")
         except Exception as e:
-            logger.error(f"Error generating flag suggestions with Gemini: {str(e)}")
-            
+            logger.error(f"Error generating keywords with Gemini: {str(e)}")
+        
         return []
 
-    def is_available(self) -> bool:
-        """Check if Gemini service is properly configured and available"""
-        return self.model is not None 
\ No newline at end of file
+    async def generate_flag_suggestions(self, email_content: str, existing_flags: List[str],
+                                        timeout: Optional[float] = None) -> List[dict]:
+        """Async counterpart of GeminiService.generate_flag_suggestions"""
+        if not self.is_available():
+            return []
+        
+        try:
+            prompt = self.service.build_suggestions_prompt(email_content, existing_flags)
+            text = await self.generate_text(prompt, timeout)
+            if text:
+                return self.service.parse_suggestions(text, existing_flags)
+        except asyncio.TimeoutError:
+            logger.warning(f"Gemini flag suggestions timed out after {timeout or self.timeout}s")
+        except CircuitOpenError:
+            logger.debug("Gemini circuit open - skipping flag suggestions")
+        except Exception as e:
+            logger.error(f"Error generating flag suggestions with Gemini: {str(e)}")
+        
+        return []
@@ -3,17 +3,27 @@ from google_auth_oauthlib.flow import Flow
 from googleapiclient.discovery import build
 from datetime import datetime, timedelta
 import base64
-from typing import Optional, Tuple, Dict, List
+from typing import Callable, Optional, Set, Tuple, Dict, List
 import json
+import logging
 import uuid
 
 from ..config import get_settings
 from ..models import User
-from ..database import get_db
-from ..database import get_db_type
+from .. import queries
+from ..async_database import execute, fetch_all
+from ..logging_config import PER_EMAIL
+
+logger = logging.getLogger(__name__)
 
 settings = get_settings()
 
+# Most message ids Gmail accepts in one batchModify call
+BATCH_MODIFY_MAX_IDS = 1000
+
+# Requests per HTTP batch when fetching full messages; Gmail allows 100 but advises at most 50
+FULL_FETCH_BATCH_SIZE = 50
+
 SCOPES = [
     'https://www.googleapis.com/auth/gmail.modify',
     'https://www.googleapis.com/auth/gmail.labels',
@@ -77,15 +87,15 @@ class GmailService:
             scopes = creds_dict.get('scopes', SCOPES)
             
             if not token:
-                print("Error: No access token in credentials")
+                logger.error("No access token in credentials")
                 return None
                 
             if not refresh_token:
-                print("Error: No refresh token in credentials")
+                logger.error("No refresh token in credentials")
                 return None
                 
             if not client_id or not client_secret:
-                print("Error: Missing client_id or client_secret")
+                logger.error("Missing client_id or client_secret")
                 return None
             
             credentials = Credentials(
@@ -99,9 +109,7 @@ class GmailService:
             
             return build('gmail', 'v1', credentials=credentials)
         except Exception as e:
-            print(f"Error building Gmail service: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Error building Gmail service: %s", e)
             return None
 
     async def get_user_email(self, service) -> Optional[str]:
@@ -161,10 +169,10 @@ class GmailService:
                 userId='me',
                 body=label_object
             ).execute()
-            print(f"Successfully created label: {safe_name} with ID: {result.get('id')}")
+            logger.info("Created label %s with ID %s", safe_name, result.get('id'))
             return result
         except Exception as e:
-            print(f"Failed to create label '{name}': {e}")
+            logger.error("Failed to create label '%s': %s", name, e)
             return None
 
     async def get_or_create_label(self, service, email: str, label_name: str, label_color: str = None) -> Optional[str]:
@@ -185,7 +193,7 @@ class GmailService:
             if existing_label:
                 # Update database with existing label info
                 await self.sync_label_to_db(email, label_name, existing_label['id'], label_color or '#000000')
-                print(f"Found existing label '{existing_label['name']}' for flag '{label_name}'")
+                logger.debug("Found existing label '%s' for flag '%s'", existing_label['name'], label_name, extra=PER_EMAIL)
                 return existing_label['id']
             
             # Create new label with safe name
@@ -193,39 +201,20 @@ class GmailService:
             if new_label:
                 # Add to database with original flag name
                 await self.sync_label_to_db(email, label_name, new_label['id'], label_color or '#000000')
-                print(f"Created label '{safe_label_name}' for flag '{label_name}'")
+                logger.info("Created label '%s' for flag '%s'", safe_label_name, label_name)
                 return new_label['id']
             
             return None
         except Exception as e:
-            print(f"Error in get_or_create_label: {e}")
+            logger.error("Error in get_or_create_label: %s", e)
             return None
 
     async def sync_label_to_db(self, email: str, label_name: str, label_id: str, label_color: str):
         """Sync label information to database"""
         try:
-            with get_db() as db:
-                cursor = db.cursor()
-                if get_db_type() == "postgres":
-                    cursor.execute("""
-                        INSERT INTO gmail_labels 
-                        (email, label_name, label_id, label_color, updated_at)
-                        VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP)
-                        ON CONFLICT (email, label_name) 
-                        DO UPDATE SET 
-                            label_id = EXCLUDED.label_id,
-                            label_color = EXCLUDED.label_color,
-                            updated_at = CURRENT_TIMESTAMP
-                    """, (email, label_name, label_id, label_color))
-                else:
-                    cursor.execute("""
-                        INSERT OR REPLACE INTO gmail_labels 
-                        (email, label_name, label_id, label_color, updated_at)
-                        VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
-                    """, (email, label_name, label_id, label_color))
-                db.commit()
+            await execute(queries.UPSERT_GMAIL_LABEL, (email, label_name, label_id, label_color))
         except Exception as e:
-            print(f"Error syncing label to database: {e}")
+            logger.error("Error syncing label to database: %s", e)
 
     async def update_label(self, service, label_id: str, new_name: str) -> bool:
         """Update Gmail label name"""
@@ -240,10 +229,10 @@ class GmailService:
                 id=label_id,
                 body=label_object
             ).execute()
-            print(f"Successfully updated label ID {label_id} to name: {new_name}")
+            logger.info("Updated label ID %s to name %s", label_id, new_name)
             return True
         except Exception as e:
-            print(f"Failed to update label '{label_id}' to '{new_name}': {e}")
+            logger.error("Failed to update label '%s' to '%s': %s", label_id, new_name, e)
             return False
 
     async def sync_label_changes(self, service, email: str, current_flag_names: List[str]) -> Dict[str, str]:
@@ -255,42 +244,15 @@ class GmailService:
             
             # Get stored label mappings from database
             stored_labels = {}
-            with get_db() as db:
-                cursor = db.cursor()
-                if get_db_type() == "postgres":
-                    cursor.execute("""
-                        SELECT label_name, label_id 
-                        FROM gmail_labels 
-                        WHERE email = %s
-                    """, (email,))
-                else:
-                    cursor.execute("""
-                        SELECT label_name, label_id 
-                        FROM gmail_labels 
-                        WHERE email = ?
-                    """, (email,))
-                for row in cursor.fetchall():
-                    stored_labels[row[0]] = row[1]
+            for row in await fetch_all(queries.GMAIL_LABELS, (email,)):
+                stored_labels[row[0]] = row[1]
             
             # Check for label name changes
             updated_mapping = {}
             
             # Get current user flags from database with old and new names
-            with get_db() as db:
-                cursor = db.cursor()
-                if get_db_type() == "postgres":
-                    cursor.execute("""
-                        SELECT flag_name, flag_color 
-                        FROM user_flags 
-                        WHERE email = %s AND is_active = true
-                    """, (email,))
-                else:
-                    cursor.execute("""
-                        SELECT flag_name, flag_color 
-                        FROM user_flags 
-                        WHERE email = ? AND is_active = 1
-                    """, (email,))
-                current_db_flags = {row[0]: row[1] for row in cursor.fetchall()}
+            rows = await fetch_all(queries.ACTIVE_USER_FLAGS, (email,))
+            current_db_flags = {row["flag_name"]: row["flag_color"] for row in rows}
             
             # Handle label updates and creations
             for flag_name in current_flag_names:
@@ -316,16 +278,8 @@ class GmailService:
                             await self.sync_label_to_db(email, flag_name, label_id, 
                                                       current_db_flags.get(flag_name, '#000000'))
                             # Remove old database record
-                            with get_db() as db:
-                                cursor = db.cursor()
-                                if get_db_type() == "postgres":
-                                    cursor.execute("DELETE FROM gmail_labels WHERE email = %s AND label_name = %s", 
-                                                 (email, old_name))
-                                else:
-                                    cursor.execute("DELETE FROM gmail_labels WHERE email = ? AND label_name = ?", 
-                                                 (email, old_name))
-                                db.commit()
-                            print(f"Renamed label '{old_name}' to '{flag_name}'")
+                            await execute(queries.DELETE_GMAIL_LABEL, (email, old_name))
+                            logger.info("Renamed label '%s' to '%s'", old_name, flag_name)
                         else:
                             # If rename failed, create new label
                             label_id = await self.get_or_create_label(service, email, flag_name, 
@@ -340,28 +294,16 @@ class GmailService:
                             updated_mapping[flag_name] = label_id
             
             # Clean up unused labels in database (optional - keep labels in Gmail but remove from our tracking)
-            with get_db() as db:
-                cursor = db.cursor()
-                if get_db_type() == "postgres":
-                    cursor.execute("""
-                        DELETE FROM gmail_labels 
-                        WHERE email = %s AND label_name NOT IN ({})
-                    """.format(','.join(['%s'] * len(current_flag_names))), 
-                    [email] + current_flag_names)
-                else:
-                    cursor.execute("""
-                        DELETE FROM gmail_labels 
-                        WHERE email = ? AND label_name NOT IN ({})
-                    """.format(','.join(['?'] * len(current_flag_names))), 
-                    [email] + current_flag_names)
-                db.commit()
+            await execute("""
+                DELETE FROM gmail_labels 
+                WHERE email = ? AND label_name NOT IN ({})
+            """.format(','.join(['?'] * len(current_flag_names))), 
+            [email] + current_flag_names)
             
             return updated_mapping
             
         except Exception as e:
-            print(f"Error syncing label changes: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Error syncing label changes: %s", e)
             return {}
 
     async def verify_labels_exist(self, service, email: str, flag_names: List[str]) -> Dict[str, str]:
@@ -369,7 +311,7 @@ class GmailService:
         label_mapping = {}
         
         try:
-            print(f"Verifying labels for flags: {flag_names}")
+            logger.info("Verifying labels for flags: %s", flag_names)
             
             # First, sync any label changes (renames, etc.)
             label_mapping = await self.sync_label_changes(service, email, flag_names)
@@ -377,32 +319,22 @@ class GmailService:
             # Then ensure all current flags have labels
             existing_labels = await self.get_labels(service)
             existing_label_names = {label['name']: label['id'] for label in existing_labels}
-            print(f"Found {len(existing_labels)} existing labels in Gmail")
+            logger.debug("Found %d existing labels in Gmail", len(existing_labels))
             
             # Get flag colors from database if any flags exist
             flag_colors = {}
             if flag_names:  # Only query if we have flag names
                 try:
-                    with get_db() as db:
-                        cursor = db.cursor()
-                        if get_db_type() == "postgres":
-                            placeholders = ','.join(['%s'] * len(flag_names))
-                            cursor.execute(f"""
-                                SELECT flag_name, flag_color 
-                                FROM user_flags 
-                                WHERE email = %s AND flag_name IN ({placeholders})
-                            """, [email] + flag_names)
-                        else:
-                            placeholders = ','.join(['?'] * len(flag_names))
-                            cursor.execute(f"""
-                                SELECT flag_name, flag_color 
-                                FROM user_flags 
-                                WHERE email = ? AND flag_name IN ({placeholders})
-                            """, [email] + flag_names)
-                        flag_colors = {row[0]: row[1] for row in cursor.fetchall()}
-                        print(f"Found colors for {len(flag_colors)} flags in database")
+                    placeholders = ','.join(['?'] * len(flag_names))
+                    rows = await fetch_all(f"""
+                        SELECT flag_name, flag_color 
+                        FROM user_flags 
+                        WHERE email = ? AND flag_name IN ({placeholders})
+                    """, [email] + flag_names)
+                    flag_colors = {row[0]: row[1] for row in rows}
+                    logger.debug("Found colors for %d flags in database", len(flag_colors))
                 except Exception as db_error:
-                    print(f"Warning: Could not get flag colors from database: {db_error}")
+                    logger.warning("Could not get flag colors from database: %s", db_error)
                     # Continue without colors
             
             # Check for any missing labels and create them
@@ -415,39 +347,67 @@ class GmailService:
                         # Original label name exists
                         label_id = existing_label_names[flag_name]
                         label_mapping[flag_name] = label_id
-                        print(f"Found existing label '{flag_name}' with ID: {label_id}")
+                        logger.debug("Found existing label '%s' with ID %s", flag_name, label_id)
                         await self.sync_label_to_db(email, flag_name, label_id, flag_colors.get(flag_name, '#000000'))
                     elif safe_label_name in existing_label_names:
                         # Safe label name exists (conflict resolution was already applied)
                         label_id = existing_label_names[safe_label_name]
                         label_mapping[flag_name] = label_id
-                        print(f"Found existing safe label '{safe_label_name}' for flag '{flag_name}' with ID: {label_id}")
+                        logger.debug("Found existing safe label '%s' for flag '%s' with ID %s", safe_label_name, flag_name, label_id)
                         await self.sync_label_to_db(email, flag_name, label_id, flag_colors.get(flag_name, '#000000'))
                     else:
                         # Create new label with conflict resolution
-                        print(f"Creating new label for flag '{flag_name}' (safe name: '{safe_label_name}')")
+                        logger.info("Creating new label for flag '%s' (safe name: '%s')", flag_name, safe_label_name)
                         label_id = await self.get_or_create_label(service, email, flag_name, flag_colors.get(flag_name))
                         if label_id:
                             label_mapping[flag_name] = label_id
-                            print(f"Successfully created label for '{flag_name}' with ID: {label_id}")
+                            logger.info("Created label for '%s' with ID %s", flag_name, label_id)
                         else:
-                            print(f"Failed to create label for flag: {flag_name}")
+                            logger.error("Failed to create label for flag: %s", flag_name)
             
-            print(f"Final label mapping: {label_mapping}")
+            logger.info("Final label mapping: %s", label_mapping)
             return label_mapping
         except Exception as e:
-            print(f"Error in verify_labels_exist: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Error in verify_labels_exist: %s", e)
             return {}
 
     async def apply_label(self, service, message_id: str, label_id: str) -> bool:
         """Apply label to an email"""
+        return await self.apply_label_ids(service, message_id, [label_id])
+
+    async def apply_labels(self, service, message_ids: List[str], label_ids: List[str]) -> Set[str]:
+        """
+        Add the same set of labels to several emails with as few API calls as possible
+        
+        A single email uses one modify call; more use batchModify in chunks of
+        BATCH_MODIFY_MAX_IDS. Returns the ids of the emails whose call succeeded.
+        """
+        if not message_ids or not label_ids:
+            return set()
+        
+        if len(message_ids) == 1:
+            return set(message_ids) if await self.apply_label_ids(service, message_ids[0], label_ids) else set()
+        
+        labeled = set()
+        for start in range(0, len(message_ids), BATCH_MODIFY_MAX_IDS):
+            chunk = message_ids[start:start + BATCH_MODIFY_MAX_IDS]
+            try:
+                service.users().messages().batchModify(
+                    userId='me',
+                    body={'ids': chunk, 'addLabelIds': label_ids}
+                ).execute()
+                labeled.update(chunk)
+            except Exception as e:
+                logger.warning("batchModify of %d emails failed: %s", len(chunk), e)
+        return labeled
+
+    async def apply_label_ids(self, service, message_id: str, label_ids: List[str]) -> bool:
+        """Apply several labels to an email in one modify call"""
         try:
             service.users().messages().modify(
                 userId='me',
                 id=message_id,
-                body={'addLabelIds': [label_id]}
+                body={'addLabelIds': label_ids}
             ).execute()
             return True
         except Exception:
@@ -516,8 +476,23 @@ class GmailService:
         except Exception:
             return []
 
-    async def get_recent_emails(self, service, max_results: int = 50) -> List[Dict]:
-        """Get recent emails with full content for categorization"""
+    async def get_recent_emails(
+        self,
+        service,
+        max_results: int = 50,
+        needs_body: Optional[Callable[[Dict], bool]] = None
+    ) -> List[Dict]:
+        """
+        Get recent emails with full content for categorization
+        
+        Args:
+            needs_body: Optional predicate called with each email's headers. When it
+                returns False only the metadata is fetched and the body is left empty,
+                e.g. for senders whose decision is already known. The full messages
+                still needed are then fetched in batch requests. Only pass it when it
+                can return False for some emails, since every message costs a
+                metadata call first.
+        """
         try:
             # Get list of messages
             results = service.users().messages().list(
@@ -529,14 +504,23 @@ class GmailService:
             messages = results.get('messages', [])
             email_data = []
             
+            # Headers first; the full messages that are needed follow in batch requests
+            prefetched = self._get_messages_needing_body(service, messages, needs_body) if needs_body else {}
+            
             for message in messages:
                 try:
-                    # Get full message details
-                    msg = service.users().messages().get(
-                        userId='me',
-                        id=message['id'],
-                        format='full'
-                    ).execute()
+                    if needs_body:
+                        if message['id'] not in prefetched:
+                            continue
+                        msg, fetch_full = prefetched[message['id']]
+                    else:
+                        # Get full message details
+                        msg = service.users().messages().get(
+                            userId='me',
+                            id=message['id'],
+                            format='full'
+                        ).execute()
+                        fetch_full = True
                     
                     # Extract headers
                     headers = msg.get('payload', {}).get('headers', [])
@@ -545,7 +529,7 @@ class GmailService:
                     date = next((h['value'] for h in headers if h['name'] == 'Date'), '')
                     
                     # Extract body content
-                    body = self._extract_email_body(msg.get('payload', {}))
+                    body = self._extract_email_body(msg.get('payload', {})) if fetch_full else ''
                     
                     email_data.append({
                         'id': message['id'],
@@ -558,16 +542,66 @@ class GmailService:
                     })
                     
                 except Exception as e:
-                    print(f"Error processing message {message['id']}: {e}")
+                    logger.warning("Error processing message %s: %s", message['id'], e)
                     continue
             
-            print(f"Successfully retrieved {len(email_data)} emails")
+            logger.info("Retrieved %d emails", len(email_data))
             return email_data
             
         except Exception as e:
-            print(f"Error getting recent emails: {e}")
+            logger.error("Error getting recent emails: %s", e)
             return []
 
+    def _get_messages_needing_body(self, service, messages: List[Dict],
+                                   needs_body: Callable[[Dict], bool]) -> Dict[str, Tuple[Dict, bool]]:
+        """
+        Message id -> (message, has body) for get_recent_emails with a needs_body predicate
+        
+        Each message is fetched as metadata, and the ones needs_body selects are then
+        fetched in full, FULL_FETCH_BATCH_SIZE per batch request. Messages that fail
+        to fetch are left out.
+        """
+        fetched = {}
+        full_ids = []
+        for message in messages:
+            try:
+                msg = service.users().messages().get(
+                    userId='me',
+                    id=message['id'],
+                    format='metadata',
+                    metadataHeaders=['From', 'Subject', 'Date']
+                ).execute()
+            except Exception as e:
+                logger.warning("Error processing message %s: %s", message['id'], e)
+                continue
+            headers = msg.get('payload', {}).get('headers', [])
+            sender = next((h['value'] for h in headers if h['name'] == 'From'), 'Unknown Sender')
+            subject = next((h['value'] for h in headers if h['name'] == 'Subject'), 'No Subject')
+            if needs_body({'id': message['id'], 'from': sender, 'subject': subject}):
+                full_ids.append(message['id'])
+            else:
+                fetched[message['id']] = (msg, False)
+        
+        def collect(request_id, response, exception):
+            if exception is not None:
+                logger.warning("Error processing message %s: %s", request_id, exception)
+            else:
+                fetched[request_id] = (response, True)
+        
+        for start in range(0, len(full_ids), FULL_FETCH_BATCH_SIZE):
+            chunk = full_ids[start:start + FULL_FETCH_BATCH_SIZE]
+            batch = service.new_batch_http_request(callback=collect)
+            for message_id in chunk:
+                batch.add(service.users().messages().get(userId='me', id=message_id, format='full'), request_id=message_id)
+            try:
+                batch.execute()
+            except Exception as e:
+                logger.warning("Batch fetch of %d messages failed: %s", len(chunk), e)
+        
+        logger.info("Fetched %d of %d messages in full, %d from headers only",
+                    len(full_ids), len(messages), len(messages) - len(full_ids))
+        return fetched
+
     def _extract_email_body(self, payload: Dict) -> str:
         """Extract text content from email payload"""
         try:
@@ -597,7 +631,7 @@ class GmailService:
             return body.strip()
             
         except Exception as e:
-            print(f"Error extracting email body: {e}")
+            logger.warning("Error extracting email body: %s", e)
             return ""
 
     async def archive_message(self, service, message_id: str) -> bool:
@@ -0,0 +1,261 @@
+import hashlib
+import logging
+import math
+import os
+import zlib
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from .. import queries
+from ..database import execute_query, get_db
+from .email_normalization import SENDER_ADDRESS_PATTERN, TOKEN_PATTERN
+
+logger = logging.getLogger(__name__)
+
+# Lower bound on gradient steps per partial_fit call, and the epoch cap that enforces it
+MIN_UPDATES = 100
+MAX_EPOCHS = 200
+
+# Label written to email_processing_log for emails sorted into the junk flag
+MARKETING_LABEL = "Marketing Mails"
+
+# Class learned from skipped emails, so the model can predict that no flag applies
+NO_LABEL = "(none)"
+
+# Sample weight of a skipped email; they are logged with no confidence of their own
+SKIPPED_WEIGHT = 0.5
+
+def extract_features(subject: str, sender: str) -> List[str]:
+    """
+    Named features for one email
+
+    Only the subject and sender are used because they are the fields recorded in
+    email_processing_log, so training and prediction see the same inputs.
+    """
+    subject_tokens = TOKEN_PATTERN.findall((subject or '').lower())
+    features = ['s:' + token for token in subject_tokens]
+    features += ['b:' + a + '_' + b for a, b in zip(subject_tokens, subject_tokens[1:])]
+
+    sender = (sender or '').lower()
+    match = SENDER_ADDRESS_PATTERN.search(sender)
+    address = (match.group(1) if match else sender).strip()
+    if address:
+        features.append('from:' + address)
+        if '@' in address:
+            domain = address.rsplit('@', 1)[1]
+            features.append('dom:' + domain)
+            features += ['dp:' + part for part in domain.split('.') if part]
+    display_name = sender[:match.start()] if match else ''
+    features += ['n:' + token for token in TOKEN_PATTERN.findall(display_name)]
+
+    return features
+
+def hash_features(features: Sequence[str], n_features: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Signed feature hashing into n_features buckets, L2-normalized"""
+    counts: Dict[int, float] = {}
+    for feature in features:
+        # crc32 is stable across processes, unlike the salted built-in hash()
+        h = zlib.crc32(feature.encode('utf-8'))
+        index = h % n_features
+        counts[index] = counts.get(index, 0.0) + (1.0 if h & 0x80000000 else -1.0)
+
+    indices = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+    values = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+    norm = np.linalg.norm(values)
+    if norm > 0:
+        values /= norm
+    return indices, values
+
+class LearnedClassifier:
+    """
+    Multinomial logistic regression over hashed subject/sender features.
+
+    Trained with mini-batch gradient descent on sparse inputs; partial_fit can be
+    called repeatedly as new history arrives, and labels not seen before are
+    added as new classes.
+    """
+
+    def __init__(self, n_features: int = 2 ** 16, classes: Optional[List[str]] = None):
+        self.n_features = n_features
+        self.classes: List[str] = list(classes or [])
+        self.weights = np.zeros((n_features, len(self.classes)), dtype=np.float32)
+        self.bias = np.zeros(len(self.classes), dtype=np.float32)
+        self.trained_samples = 0
+        self.last_log_id = 0
+
+    def _add_classes(self, labels: Sequence[str]):
+        new_classes = [label for label in dict.fromkeys(labels) if label not in self.classes]
+        if not new_classes:
+            return
+        self.classes.extend(new_classes)
+        self.weights = np.hstack([self.weights, np.zeros((self.n_features, len(new_classes)), dtype=np.float32)])
+        self.bias = np.concatenate([self.bias, np.zeros(len(new_classes), dtype=np.float32)])
+
+    def _matrix(self, samples: Sequence[Tuple[str, str]]) -> sparse.csr_matrix:
+        indptr, indices, values = [0], [], []
+        for subject, sender in samples:
+            idx, vals = hash_features(extract_features(subject, sender), self.n_features)
+            indices.append(idx)
+            values.append(vals)
+            indptr.append(indptr[-1] + len(idx))
+        return sparse.csr_matrix(
+            (np.concatenate(values) if values else np.zeros(0, dtype=np.float32),
+             np.concatenate(indices) if indices else np.zeros(0, dtype=np.int64),
+             indptr),
+            shape=(len(samples), self.n_features)
+        )
+
+    @staticmethod
+    def _softmax(scores: np.ndarray) -> np.ndarray:
+        scores = scores - scores.max(axis=-1, keepdims=True)
+        exp = np.exp(scores)
+        return exp / exp.sum(axis=-1, keepdims=True)
+
+    def partial_fit(self, samples: Sequence[Tuple[str, str]], labels: Sequence[str],
+                    sample_weights: Optional[Sequence[float]] = None, epochs: int = 5,
+                    learning_rate: float = 0.5, batch_size: int = 256, l2: float = 1e-4, seed: int = 0):
+        """Update the model with (subject, sender) samples and their labels"""
+        if not samples:
+            return
+        self._add_classes(labels)
+
+        X = self._matrix(samples)
+        class_index = {label: i for i, label in enumerate(self.classes)}
+        y = np.array([class_index[label] for label in labels])
+        weights = np.ones(len(samples), dtype=np.float32) if sample_weights is None \
+            else np.asarray(sample_weights, dtype=np.float32)
+
+        # Small updates still get enough gradient steps to converge
+        epochs = max(epochs, min(MAX_EPOCHS, math.ceil(MIN_UPDATES * batch_size / len(samples))))
+        
+        rng = np.random.default_rng(seed)
+        for _ in range(epochs):
+            order = rng.permutation(len(samples))
+            for start in range(0, len(order), batch_size):
+                batch = order[start:start + batch_size]
+                X_batch = X[batch]
+                probabilities = self._softmax(X_batch @ self.weights + self.bias)
+                probabilities[np.arange(len(batch)), y[batch]] -= 1.0
+                errors = probabilities * weights[batch, None] / len(batch)
+
+                # Only rows touched by this batch get gradient and decay
+                touched = np.unique(X_batch.indices)
+                gradient = (X_batch.T @ errors)[touched]
+                self.weights[touched] -= learning_rate * (gradient + l2 * self.weights[touched])
+                self.bias -= learning_rate * errors.sum(axis=0)
+
+        self.trained_samples += len(samples)
+
+    def predict_proba(self, subject: str, sender: str) -> Dict[str, float]:
+        """Class probabilities for one email"""
+        if not self.classes:
+            return {}
+        indices, values = hash_features(extract_features(subject, sender), self.n_features)
+        scores = values @ self.weights[indices] + self.bias
+        return dict(zip(self.classes, self._softmax(scores).tolist()))
+
+    def predict(self, subject: str, sender: str) -> Tuple[Optional[str], float]:
+        """Most likely label for one email and its probability"""
+        probabilities = self.predict_proba(subject, sender)
+        if not probabilities:
+            return None, 0.0
+        label = max(probabilities, key=probabilities.get)
+        return label, probabilities[label]
+
+    def save(self, path: str):
+        """Persist the model to a compressed .npz file"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        temp_path = path + '.tmp.npz'
+        np.savez_compressed(
+            temp_path,
+            weights=self.weights,
+            bias=self.bias,
+            classes=np.array(self.classes, dtype=str),
+            meta=np.array([self.n_features, self.trained_samples, self.last_log_id], dtype=np.int64)
+        )
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'LearnedClassifier':
+        """Load a model written by save()"""
+        with np.load(path) as data:
+            n_features, trained_samples, last_log_id = (int(v) for v in data['meta'])
+            model = cls(n_features=n_features, classes=[str(c) for c in data['classes']])
+            model.weights = data['weights']
+            model.bias = data['bias']
+        model.trained_samples = trained_samples
+        model.last_log_id = last_log_id
+        return model
+
+class ClassifierStore:
+    """Per-user models on disk, cached in memory and reloaded when the file changes"""
+
+    def __init__(self, model_dir: str):
+        self.model_dir = model_dir
+        self._cache: Dict[str, Tuple[float, LearnedClassifier]] = {}
+
+    def path_for(self, email: str) -> str:
+        digest = hashlib.sha256(email.lower().encode('utf-8')).hexdigest()[:24]
+        return os.path.join(self.model_dir, f"classifier_{digest}.npz")
+
+    def get(self, email: str) -> Optional[LearnedClassifier]:
+        """Return the user's trained model, or None if none has been trained"""
+        path = self.path_for(email)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return None
+
+        cached = self._cache.get(email)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+        try:
+            model = LearnedClassifier.load(path)
+        except Exception as e:
+            logger.error(f"Error loading classifier for {email}: {e}")
+            return None
+        self._cache[email] = (mtime, model)
+        return model
+
+    def load_training_rows(self, email: str, after_log_id: int = 0) -> List[Dict]:
+        """
+        Successful assignments and skipped emails from the user's sorting history, oldest first
+
+        Sessions that were later reverted are left out, since the user undid them,
+        and so are labels chosen by the sender memo or the classifier itself.
+        """
+        with get_db() as db:
+            cursor = execute_query(db.cursor(), queries.CLASSIFIER_TRAINING_ROWS, (email, after_log_id))
+            return [dict(row) for row in cursor.fetchall()]
+
+    def train(self, email: str, full: bool = False, epochs: int = 5) -> Optional[LearnedClassifier]:
+        """
+        Train (or incrementally update) the user's model from email_processing_log
+
+        Args:
+            email: User whose history to learn from
+            full: Retrain from scratch instead of only learning rows added since the last run
+        """
+        model = None if full else self.get(email)
+        model = model or LearnedClassifier()
+
+        rows = self.load_training_rows(email, model.last_log_id)
+        if not rows:
+            return model if model.trained_samples else None
+
+        skipped = [row['status'] == 'skipped' for row in rows]
+        model.partial_fit(
+            [(row['email_subject'] or '', row['email_from'] or '') for row in rows],
+            [NO_LABEL if is_skipped else row['assigned_label'] for row, is_skipped in zip(rows, skipped)],
+            # Confident past decisions count for more than borderline ones
+            sample_weights=[SKIPPED_WEIGHT if is_skipped else max(float(row['confidence_score'] or 0.0), 0.1)
+                            for row, is_skipped in zip(rows, skipped)],
+            epochs=epochs
+        )
+        model.last_log_id = max(row['id'] for row in rows)
+        model.save(self.path_for(email))
+        logger.info(f"Trained classifier for {email} on {len(rows)} new rows ({model.trained_samples} total)")
+        return model
@@ -0,0 +1,73 @@
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple, TypeVar
+
+T = TypeVar('T')
+
+def estimate_tokens(text: str) -> int:
+    """Rough prompt size in tokens (about four characters per token)"""
+    return len(text) // 4 + 1
+
+@dataclass
+class LLMBudget:
+    """
+    Per-session allowance of LLM calls and prompt tokens
+
+    A limit of 0 means unlimited. Requests are all-or-nothing: an email either
+    gets every call it needs or none.
+    """
+    max_calls: int
+    max_tokens: int
+    calls: int = 0
+    tokens: int = 0
+    skipped: int = 0  # Candidates that did not fit the remaining budget
+
+    def can_spend(self, calls: int, tokens: int) -> bool:
+        if self.max_calls and self.calls + calls > self.max_calls:
+            return False
+        if self.max_tokens and self.tokens + tokens > self.max_tokens:
+            return False
+        return True
+
+    def try_spend(self, calls: int, tokens: int) -> bool:
+        """Reserve calls and tokens if they fit, returning whether they did"""
+        if not self.can_spend(calls, tokens):
+            self.skipped += 1
+            return False
+        self.calls += calls
+        self.tokens += tokens
+        return True
+
+    def stats(self) -> Dict:
+        return {
+            "calls": self.calls,
+            "max_calls": self.max_calls,
+            "tokens": self.tokens,
+            "max_tokens": self.max_tokens,
+            "skipped": self.skipped
+        }
+
+def schedule_llm_requests(
+    candidates: List[Tuple[float, T]],
+    budget: LLMBudget,
+    cost: Callable[[T], Tuple[int, int]],
+    max_ambiguity: Optional[float] = None
+) -> List[T]:
+    """
+    Pick which emails get Gemini keywords within the budget
+
+    Args:
+        candidates: (ambiguity, item) pairs; lower ambiguity means a less certain local decision
+        cost: Returns the (calls, tokens) an item would use
+        max_ambiguity: Emails decided more clearly than this are never sent
+
+    Returns:
+        The selected items, most ambiguous first
+    """
+    selected = []
+    for ambiguity, email in sorted(candidates, key=lambda candidate: candidate[0]):
+        if max_ambiguity is not None and ambiguity > max_ambiguity:
+            break
+        calls, tokens = cost(email)
+        if budget.try_spend(calls, tokens):
+            selected.append(email)
+    return selected
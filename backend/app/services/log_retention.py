@@ -0,0 +1,233 @@
+import csv
+import gzip
+import logging
+import os
+import threading
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+
+from ..config import get_settings
+from ..database import execute_write_many, get_db, get_db_type
+from ..migrations import (
+    LOG_TABLE, add_months, create_log_partition, month_start, partition_month, partition_name
+)
+
+logger = logging.getLogger(__name__)
+
+class LogArchiver:
+    """
+    Keeps email_processing_log to the last retention_months whole months (plus the current one).
+
+    On Postgres the table is partitioned by month: each run creates the
+    partitions for the next partitions_ahead months (a month that fails is
+    logged and retried on the next run), then copies every expired partition
+    to a gzipped CSV file in archive_dir, detaches it and drops it.
+    SQLite has no partitioning, so expired rows are archived a month at a time
+    and deleted from the table in batches of delete_batch rows.
+
+    Rows are only removed after their archive file is complete. With an empty
+    archive_dir they are removed without an archive. Runs every interval
+    seconds on a background thread between start() and stop().
+    """
+
+    def __init__(self, retention_months: int = 6, archive_dir: str = "log_archive", interval: float = 3600.0,
+                 partitions_ahead: int = 2, delete_batch: int = 5000):
+        self.retention_months = retention_months
+        self.archive_dir = archive_dir
+        self.interval = interval
+        self.partitions_ahead = partitions_ahead
+        self.delete_batch = delete_batch
+        self.runs = 0
+        self.rows_archived = 0
+        self.partitions_dropped = 0
+        self.archives: List[str] = []
+        self.last_run: Optional[datetime] = None
+        self.last_error: Optional[str] = None
+        # One run at a time, whether from the thread or a direct run_once()
+        self._run_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop: Optional[threading.Event] = None
+
+    def cutoff(self, now: datetime) -> date:
+        """Rows logged before this date are expired"""
+        return add_months(month_start(now), -self.retention_months)
+
+    def run_once(self, now: Optional[datetime] = None) -> Dict:
+        """Create upcoming partitions and archive and remove expired rows; returns what was done"""
+        now = now or datetime.utcnow()
+        result = {"archives": [], "rows_archived": 0, "partitions_dropped": [], "errors": []}
+        with self._run_lock:
+            try:
+                if get_db_type() == "postgres":
+                    self._run_postgres(now, result)
+                else:
+                    self._run_sqlite(now, result)
+                self.last_error = "; ".join(result["errors"]) or None
+            except Exception as e:
+                self.last_error = str(e)
+                logger.exception("Error archiving email processing log: %s", e)
+            self.runs += 1
+            self.last_run = now
+            self.rows_archived += result["rows_archived"]
+            self.partitions_dropped += len(result["partitions_dropped"])
+            self.archives = (self.archives + result["archives"])[-20:]
+        if result["rows_archived"] or result["partitions_dropped"]:
+            logger.info("Archived %d email processing log rows to %s, dropped partitions %s",
+                        result["rows_archived"], result["archives"] or "nowhere", result["partitions_dropped"])
+        return result
+
+    def start(self):
+        """Run in the background until stop(); a no-op with retention disabled"""
+        if self.retention_months <= 0 or self._thread is not None:
+            return
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(self._stop,), name="log-archiver", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join()
+
+    def stats(self) -> Dict:
+        return {
+            "retention_months": self.retention_months,
+            "runs": self.runs,
+            "last_run": self.last_run,
+            "last_error": self.last_error,
+            "rows_archived": self.rows_archived,
+            "partitions_dropped": self.partitions_dropped,
+            "recent_archives": list(self.archives)
+        }
+
+    def _run(self, stop: threading.Event):
+        # First run right away, so a restart catches up on expired rows
+        while not stop.is_set():
+            self.run_once()
+            stop.wait(self.interval)
+
+    def _run_postgres(self, now: datetime, result: Dict):
+        current = month_start(now)
+        with get_db() as db:
+            cur = db.cursor()
+            for ahead in range(self.partitions_ahead + 1):
+                month = add_months(current, ahead)
+                # One transaction per month, so a month that fails doesn't hold back the others or the archiving
+                try:
+                    create_log_partition(cur, month)
+                    db.commit()
+                except Exception as e:
+                    db.rollback()
+                    result["errors"].append(f"{partition_name(month)}: {e}")
+                    logger.error("Could not create partition %s: %s", partition_name(month), e)
+
+            if self.retention_months <= 0:
+                return
+            cutoff = self.cutoff(now)
+            cur.execute("""
+                SELECT c.relname AS name
+                FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+                WHERE i.inhparent = %s::regclass
+            """, (LOG_TABLE,))
+            names = [row["name"] if isinstance(row, dict) else row[0] for row in cur.fetchall()]
+            expired = sorted(name for name in names if partition_month(name) and add_months(partition_month(name), 1) <= cutoff)
+
+            for name in expired:
+                if self.archive_dir:
+                    path, rows = self._write_archive(partition_month(name), lambda out: self._copy_partition(cur, name, out))
+                    result["archives"].append(path)
+                    result["rows_archived"] += rows
+                cur.execute(f"ALTER TABLE {LOG_TABLE} DETACH PARTITION {name}")
+                cur.execute(f"DROP TABLE {name}")
+                db.commit()
+                result["partitions_dropped"].append(name)
+
+    @staticmethod
+    def _copy_partition(cur, name: str, out) -> int:
+        cur.execute(f"SELECT COUNT(*) AS count FROM {name}")
+        row = cur.fetchone()
+        cur.copy_expert(f"COPY (SELECT * FROM {name} ORDER BY processing_time, id) TO STDOUT WITH CSV HEADER", out)
+        return row["count"] if isinstance(row, dict) else row[0]
+
+    def _run_sqlite(self, now: datetime, result: Dict):
+        if self.retention_months <= 0:
+            return
+        cutoff = self.cutoff(now)
+        while True:
+            with get_db() as db:
+                oldest = db.execute(
+                    f"SELECT MIN(processing_time) FROM {LOG_TABLE} WHERE processing_time < ?",
+                    (_sqlite_time(cutoff),)
+                ).fetchone()[0]
+            if oldest is None:
+                return
+            month = month_start(datetime.fromisoformat(oldest[:10]))
+            start, end = _sqlite_time(month), _sqlite_time(min(add_months(month, 1), cutoff))
+            if self.archive_dir:
+                path, rows = self._write_archive(month, lambda out: self._dump_sqlite_rows(start, end, out))
+                result["archives"].append(path)
+                result["rows_archived"] += rows
+            if not self._delete_sqlite_rows(start, end):
+                return
+
+    @staticmethod
+    def _dump_sqlite_rows(start: str, end: str, out) -> int:
+        with get_db() as db:
+            cursor = db.execute(
+                f"SELECT * FROM {LOG_TABLE} WHERE processing_time >= ? AND processing_time < ? ORDER BY processing_time, rowid",
+                (start, end)
+            )
+            writer = csv.writer(out)
+            writer.writerow([column[0] for column in cursor.description])
+            rows = 0
+            for row in cursor:
+                writer.writerow(row)
+                rows += 1
+            return rows
+
+    def _delete_sqlite_rows(self, start: str, end: str) -> int:
+        deleted = 0
+        while True:
+            count = execute_write_many(f"""
+                DELETE FROM {LOG_TABLE} WHERE rowid IN (
+                    SELECT rowid FROM {LOG_TABLE} WHERE processing_time >= ? AND processing_time < ? LIMIT ?
+                )
+            """, [(start, end, self.delete_batch)])
+            deleted += count
+            if count < self.delete_batch:
+                return deleted
+
+    def _write_archive(self, month: date, write) -> Tuple[str, int]:
+        """Write one archive file through write(out) -> rows, returning its path and row count"""
+        os.makedirs(self.archive_dir, exist_ok=True)
+        base = os.path.join(self.archive_dir, partition_name(month))
+        path = f"{base}.csv.gz"
+        # An earlier archive of the same month is never overwritten
+        suffix = 1
+        while os.path.exists(path):
+            path = f"{base}.{suffix}.csv.gz"
+            suffix += 1
+        partial = f"{path}.partial"
+        try:
+            with gzip.open(partial, "wt", newline="") as out:
+                rows = write(out)
+            os.replace(partial, path)
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+        return path, rows
+
+def _sqlite_time(day: date) -> str:
+    # Matches the text CURRENT_TIMESTAMP stores, so comparisons work on the column as is
+    return f"{day.isoformat()} 00:00:00"
+
+settings = get_settings()
+log_archiver = LogArchiver(
+    retention_months=settings.log_retention_months,
+    archive_dir=settings.log_archive_dir,
+    interval=settings.log_archive_interval_seconds,
+    partitions_ahead=settings.log_partitions_ahead,
+    delete_batch=settings.log_archive_delete_batch
+)
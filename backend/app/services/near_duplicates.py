@@ -0,0 +1,115 @@
+import hashlib
+import re
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+# Fingerprint width and the number of LSH bands it is split into. Two fingerprints
+# within MAX_BANDED_DISTANCE bits are guaranteed to agree on at least one band.
+FINGERPRINT_BITS = 64
+LSH_BANDS = 4
+BAND_BITS = FINGERPRINT_BITS // LSH_BANDS
+MAX_BANDED_DISTANCE = LSH_BANDS - 1
+
+# Tokens per shingle when fingerprinting
+SHINGLE_SIZE = 3
+
+URL_PATTERN = re.compile(r"https?://\S+|www\.\S+")
+NUMBER_PATTERN = re.compile(r"\d+")
+TOKEN_PATTERN = re.compile(r"[a-z0]+")
+SENDER_DOMAIN_PATTERN = re.compile(r"@([a-z0-9.-]+)")
+
+@dataclass
+class DuplicateCluster:
+    """A representative email and the near-identical emails that share its decision"""
+    cluster_id: str
+    representative: Dict
+    members: List[Dict] = field(default_factory=list)  # Includes the representative
+
+    @property
+    def is_duplicate_group(self) -> bool:
+        return len(self.members) > 1
+
+def fingerprint_tokens(subject: str, body: str) -> List[str]:
+    """
+    Normalized tokens used for fingerprinting
+
+    URLs are dropped and digit runs collapse to '0', so messages that differ only
+    in tracking links, order numbers, dates or counts normalize to the same text.
+    """
+    text = f"{subject or ''} {body or ''}".lower()
+    text = URL_PATTERN.sub(' ', text)
+    text = NUMBER_PATTERN.sub('0', text)
+    return TOKEN_PATTERN.findall(text)
+
+def simhash(tokens: List[str]) -> int:
+    """64-bit SimHash over word shingles"""
+    if len(tokens) < SHINGLE_SIZE:
+        shingles = [' '.join(tokens)]
+    else:
+        shingles = [' '.join(tokens[i:i + SHINGLE_SIZE]) for i in range(len(tokens) - SHINGLE_SIZE + 1)]
+
+    counts = [0] * FINGERPRINT_BITS
+    for shingle in shingles:
+        # blake2b is stable across processes, unlike the salted built-in hash()
+        h = int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big')
+        for bit in range(FINGERPRINT_BITS):
+            counts[bit] += 1 if h >> bit & 1 else -1
+
+    return sum(1 << bit for bit, count in enumerate(counts) if count > 0)
+
+def _bands(fingerprint: int) -> List[Tuple[int, int]]:
+    mask = (1 << BAND_BITS) - 1
+    return [(band, fingerprint >> (band * BAND_BITS) & mask) for band in range(LSH_BANDS)]
+
+def _sender_domain(sender: str) -> str:
+    match = SENDER_DOMAIN_PATTERN.search((sender or '').lower())
+    return match.group(1) if match else (sender or '').strip().lower()
+
+def cluster_near_duplicates(emails: List[Dict], max_distance: int = MAX_BANDED_DISTANCE,
+                            min_tokens: int = 8) -> List[DuplicateCluster]:
+    """
+    Group near-identical emails from the same sender domain
+
+    Each email joins the first earlier representative whose fingerprint is within
+    max_distance bits, found through LSH band buckets, or starts a new cluster.
+    Every member is therefore close to its representative, which is categorized
+    once on behalf of the whole cluster. Emails with fewer than min_tokens
+    normalized tokens are too short to fingerprint reliably and stay alone.
+
+    Returns:
+        Clusters in order of their representative's first appearance
+    """
+    max_distance = min(max_distance, MAX_BANDED_DISTANCE)
+    clusters: List[DuplicateCluster] = []
+    buckets: Dict[Tuple[str, int, int], List[Tuple[int, DuplicateCluster]]] = defaultdict(list)
+
+    for email in emails:
+        tokens = fingerprint_tokens(email.get('subject', ''), email.get('body', ''))
+        if len(tokens) < min_tokens:
+            clusters.append(DuplicateCluster(str(email.get('id')), email, [email]))
+            continue
+
+        fingerprint = simhash(tokens)
+        domain = _sender_domain(email.get('from', ''))
+        bands = _bands(fingerprint)
+
+        match: Optional[DuplicateCluster] = None
+        for band, value in bands:
+            for candidate_fingerprint, candidate in buckets[(domain, band, value)]:
+                if bin(fingerprint ^ candidate_fingerprint).count('1') <= max_distance:
+                    match = candidate
+                    break
+            if match:
+                break
+
+        if match:
+            match.members.append(email)
+            continue
+
+        cluster = DuplicateCluster(str(email.get('id')), email, [email])
+        clusters.append(cluster)
+        for band, value in bands:
+            buckets[(domain, band, value)].append((fingerprint, cluster))
+
+    return clusters
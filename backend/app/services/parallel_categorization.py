@@ -0,0 +1,83 @@
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from .rule_tables import CompiledRules
+
+# Batches smaller than this are scored inline - pool startup would cost more than it saves
+INLINE_BATCH_SIZE = 64
+
+# Bounds for the number of emails sent to a worker per task
+MIN_CHUNK_SIZE = 16
+MAX_CHUNK_SIZE = 256
+
+# Aim for a few chunks per worker so a slow chunk doesn't leave the others idle
+CHUNKS_PER_WORKER = 4
+
+@dataclass(frozen=True)
+class CategorizationSnapshot:
+    """Picklable copy of the flag configuration and rule tables used for scoring"""
+    user_flags: List[Dict]
+    rules: "CompiledRules"  # Pickles as its tables; each worker compiles them once
+
+# Per-process scorer, built once by the pool initializer from the snapshot
+_worker_service = None
+_worker_flags: List[Dict] = []
+
+def _init_worker(snapshot: CategorizationSnapshot):
+    """Build the worker's categorization service from the shipped snapshot"""
+    global _worker_service, _worker_flags
+    from .email_categorization import EmailCategorizationService
+
+    _worker_service = EmailCategorizationService()
+    _worker_service.rules = snapshot.rules
+    _worker_flags = snapshot.user_flags
+
+def _categorize_chunk(emails: List[Dict]) -> List[Tuple[Optional[str], float]]:
+    """Score one chunk of emails inside a worker process"""
+    # An empty keyword mapping keeps workers from ever calling Gemini
+    return [
+        _worker_service.categorize_email_enhanced(email, _worker_flags, {})
+        for email in emails
+    ]
+
+def plan_parallelism(batch_size: int, max_workers: Optional[int] = None) -> Tuple[int, int]:
+    """
+    Pick the worker count and chunk size for a batch
+
+    Returns:
+        (workers, chunk_size) - workers is 1 when the batch should be scored inline
+    """
+    if batch_size < INLINE_BATCH_SIZE:
+        return 1, batch_size
+
+    cpu_count = max_workers or os.cpu_count() or 1
+    workers = max(1, min(cpu_count, batch_size // MIN_CHUNK_SIZE))
+    chunk_size = math.ceil(batch_size / (workers * CHUNKS_PER_WORKER))
+    chunk_size = max(MIN_CHUNK_SIZE, min(chunk_size, MAX_CHUNK_SIZE))
+    return workers, chunk_size
+
+def iter_categorize_parallel(
+    snapshot: CategorizationSnapshot,
+    emails: List[Dict],
+    workers: int,
+    chunk_size: int
+) -> Iterator[Tuple[Dict, Optional[str], float]]:
+    """
+    Categorize emails across a process pool, yielding (email, category, confidence)
+    in input order as soon as each chunk completes
+    """
+    chunks = [emails[i:i + chunk_size] for i in range(0, len(emails), chunk_size)]
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(snapshot,)
+    ) as executor:
+        # executor.map yields chunk results in submission order
+        for chunk, results in zip(chunks, executor.map(_categorize_chunk, chunks)):
+            for email, (category, confidence) in zip(chunk, results):
+                yield email, category, confidence
@@ -0,0 +1,228 @@
+import asyncio
+import atexit
+import json
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from psycopg2.extras import execute_values
+
+from .. import queries
+from ..config import get_settings
+from ..database import execute_query, execute_write_many, get_db, get_db_type, sqlite_writer
+from ..queries import query_stats
+
+logger = logging.getLogger(__name__)
+
+# Column order of the buffered rows
+COLUMNS = (
+    'session_id', 'email_id', 'email_subject', 'email_from', 'assigned_label',
+    'confidence_score', 'status', 'error_details', 'cluster_id', 'decision_source'
+)
+
+class ProcessingLogWriter:
+    """
+    Buffers email_processing_log rows and inserts them in batches.
+
+    Rows are flushed by a background thread once batch_size are waiting or
+    flush_interval seconds have passed, as one multi-row INSERT (Postgres) or
+    one executemany through the SQLite writer. Call flush() before reading a
+    session's rows back, and close() on shutdown.
+
+    When a batch fails, its rows are inserted one by one so a single bad row
+    cannot hold back the rest. A row that fails on its own while others are
+    written, or max_attempts times in all, is appended to the JSON-lines file at
+    dead_letter_path and not retried. Other failed rows wait for the next
+    flush, up to max_pending.
+    """
+
+    def __init__(self, batch_size: int = 200, flush_interval: float = 1.0, max_pending: int = 20000,
+                 max_attempts: int = 3, dead_letter_path: str = ""):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.dead_letter_path = dead_letter_path
+        self.flushes = 0
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self.rows_dead_lettered = 0
+        # (row, failed single-row attempts so far)
+        self._buffer: List[Tuple[Tuple, int]] = []
+        self._lock = threading.Lock()
+        # Held for a whole flush so rows reach the database in the order they were added
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stop: Optional[threading.Event] = None
+
+    def add(self, row: Sequence):
+        """Buffer one row in COLUMNS order"""
+        with self._lock:
+            self._buffer.append((tuple(row), 0))
+            full = len(self._buffer) >= self.batch_size
+            if self._thread is None:
+                self._stop = threading.Event()
+                self._thread = threading.Thread(
+                    target=self._run, args=(self._stop,), name="processing-log-writer", daemon=True
+                )
+                self._thread.start()
+        if full:
+            self._wake.set()
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._buffer)
+
+    def flush(self) -> int:
+        """Write every buffered row now; returns the number written"""
+        with self._flush_lock:
+            with self._lock:
+                entries, self._buffer = self._buffer, []
+            if not entries:
+                return 0
+            rows = [row for row, _ in entries]
+            try:
+                self._insert(rows)
+            except Exception as e:
+                logger.warning("Batch of %d email processing log rows failed, inserting one by one: %s", len(rows), e)
+                return self._flush_each(entries)
+            self.flushes += 1
+            self.rows_written += len(rows)
+            return len(rows)
+
+    async def flush_async(self) -> int:
+        """flush() without blocking the event loop"""
+        return await asyncio.to_thread(self.flush)
+
+    def close(self):
+        """Stop the background thread and write what is left; a later add() starts a new thread"""
+        with self._lock:
+            thread, stop = self._thread, self._stop
+            self._thread = None
+        if thread is not None:
+            stop.set()
+            self._wake.set()
+            thread.join()
+        self.flush()
+
+    def stats(self) -> Dict:
+        return {
+            "pending": self.pending(),
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "rows_dropped": self.rows_dropped,
+            "rows_dead_lettered": self.rows_dead_lettered
+        }
+
+    def _run(self, stop: threading.Event):
+        while not stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            if not stop.is_set():
+                self.flush()
+
+    def _flush_each(self, entries: List[Tuple[Tuple, int]]) -> int:
+        try:
+            errors = self._insert_each([row for row, _ in entries])
+        except Exception as e:
+            # The database could not be reached at all, which says nothing about the rows
+            self._requeue(entries)
+            logger.error("Error writing %d email processing log rows: %s", len(entries), e)
+            return 0
+
+        written = errors.count(None)
+        retry, dead = [], []
+        for (row, attempts), error in zip(entries, errors):
+            if error is None:
+                continue
+            if written or attempts + 1 >= self.max_attempts:
+                dead.append((row, error))
+            else:
+                retry.append((row, attempts + 1))
+        if retry:
+            self._requeue(retry)
+            logger.error("Error writing %d email processing log rows: %s", len(retry), next(e for e in errors if e))
+        if dead:
+            self._dead_letter(dead)
+        if written:
+            self.flushes += 1
+            self.rows_written += written
+        return written
+
+    def _requeue(self, entries: List[Tuple[Tuple, int]]):
+        with self._lock:
+            self._buffer[:0] = entries
+            overflow = len(self._buffer) - self.max_pending
+            if overflow > 0:
+                del self._buffer[:overflow]
+                self.rows_dropped += overflow
+
+    def _dead_letter(self, failed: List[Tuple[Tuple, Exception]]):
+        self.rows_dead_lettered += len(failed)
+        logger.error("Gave up on %d email processing log rows (first: session %s, email %s): %s",
+                     len(failed), failed[0][0][0], failed[0][0][1], failed[0][1])
+        if not self.dead_letter_path:
+            return
+        failed_at = datetime.utcnow().isoformat()
+        try:
+            with open(self.dead_letter_path, "a", encoding="utf-8") as out:
+                for row, error in failed:
+                    entry = dict(zip(COLUMNS, row), error=str(error), failed_at=failed_at)
+                    out.write(json.dumps(entry, default=str) + "\n")
+        except OSError as e:
+            logger.error("Could not write %d rows to %s: %s", len(failed), self.dead_letter_path, e)
+
+    @staticmethod
+    def _execute_values(cursor, rows: List[Tuple]):
+        query = queries.INSERT_PROCESSING_LOG
+        with query_stats.measure(query):
+            execute_values(cursor, query.psycopg, rows, page_size=len(rows))
+
+    def _insert(self, rows: List[Tuple]):
+        if get_db_type() == "postgres":
+            with get_db() as db:
+                self._execute_values(db.cursor(), rows)
+                db.commit()
+        else:
+            execute_write_many(queries.INSERT_PROCESSING_LOG, rows)
+
+    def _insert_each(self, rows: List[Tuple]) -> List[Optional[Exception]]:
+        """Insert rows one at a time, returning each row's error, or None where it was written"""
+        postgres = get_db_type() == "postgres"
+        if not postgres and settings.sqlite_single_writer:
+            # Separate statements: the writer retries a failed batch statement by statement
+            futures = [sqlite_writer().submit(queries.INSERT_PROCESSING_LOG.sqlite, row) for row in rows]
+            return [future.exception() for future in futures]
+
+        errors = []
+        with get_db() as db:
+            cursor = db.cursor()
+            for row in rows:
+                # A savepoint per row keeps a bad row from aborting the others' transaction
+                cursor.execute("SAVEPOINT log_row")
+                try:
+                    if postgres:
+                        self._execute_values(cursor, [row])
+                    else:
+                        execute_query(cursor, queries.INSERT_PROCESSING_LOG, row)
+                    errors.append(None)
+                except Exception as e:
+                    cursor.execute("ROLLBACK TO SAVEPOINT log_row")
+                    errors.append(e)
+                cursor.execute("RELEASE SAVEPOINT log_row")
+            db.commit()
+        return errors
+
+settings = get_settings()
+processing_log = ProcessingLogWriter(
+    batch_size=settings.processing_log_batch_size,
+    flush_interval=settings.processing_log_flush_seconds,
+    max_pending=settings.processing_log_max_pending,
+    max_attempts=settings.processing_log_max_attempts,
+    dead_letter_path=settings.processing_log_dead_letter_path
+)
+
+# Scripts and tests exit without the app's shutdown event
+atexit.register(processing_log.close)
@@ -0,0 +1,106 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+def cache_key(model_name: str, prompt: str) -> str:
+    """Content hash identifying an LLM request: the model plus the full prompt text"""
+    return hashlib.sha256(f"{model_name}\0{prompt}".encode('utf-8')).hexdigest()
+
+class ResponseCache:
+    """
+    LRU + TTL cache of LLM response texts with single-flight request coalescing.
+
+    Concurrent callers asking for the same key share one in-flight call. The
+    shared call runs as its own task, so a caller that gives up (deadline or
+    client disconnect) does not cancel it for the others. Only non-empty
+    responses are cached; failures propagate to every waiter and are retried
+    on the next request.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: str, value: str):
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get_or_fetch(self, key: str, fetch: Callable[[], Awaitable[str]],
+                           timeout: Optional[float] = None) -> str:
+        """
+        Return the cached response for key, joining or starting the fetch if needed
+
+        Args:
+            fetch: Coroutine factory performing the LLM call; it should enforce its own deadline
+            timeout: How long this caller waits; the shared fetch keeps running past it
+
+        Raises:
+            asyncio.TimeoutError: if this caller's timeout expires first
+        """
+        cached = self.get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+
+        task = self._in_flight.get(key)
+        if task is not None and not task.done():
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.get_running_loop().create_task(self._fetch(key, fetch))
+            # Mark failures as retrieved in case every waiter has already given up
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._in_flight[key] = task
+
+        # shield() keeps one caller's cancellation from cancelling the shared task
+        if timeout is None:
+            return await asyncio.shield(task)
+        return await asyncio.wait_for(asyncio.shield(task), timeout)
+
+    async def _fetch(self, key: str, fetch: Callable[[], Awaitable[str]]) -> str:
+        try:
+            value = await fetch()
+            if value:
+                self.put(key, value)
+            return value
+        finally:
+            self._in_flight.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "in_flight": len(self._in_flight),
+            "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0
+        }
@@ -0,0 +1,232 @@
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from .. import queries
+from ..database import execute_query, get_db
+from .email_normalization import term_key
+
+logger = logging.getLogger(__name__)
+
+# Keyword tables for flags that keep their default description
+DEFAULT_CATEGORY_KEYWORDS = {
+    'urgent': {
+        'subject': ['urgent', 'asap', 'immediate', 'emergency', 'critical', 'deadline', 'rush', 'priority'],
+        'body': ['urgent', 'asap', 'immediately', 'emergency', 'critical', 'deadline', 'rush', 'priority', 'time-sensitive'],
+        'sender': ['boss', 'manager', 'ceo', 'director', 'admin', 'support']
+    },
+    'important': {
+        'subject': ['important', 'meeting', 'conference', 'presentation', 'project', 'report', 'review', 'approval'],
+        'body': ['important', 'meeting', 'conference', 'presentation', 'project', 'report', 'review', 'approval', 'decision'],
+        'sender': ['client', 'customer', 'partner', 'vendor', 'stakeholder']
+    },
+    'business': {
+        'subject': ['business', 'meeting', 'conference', 'presentation', 'project', 'report', 'review', 'approval', 'client', 'work'],
+        'body': ['business', 'meeting', 'conference', 'presentation', 'project', 'report', 'review', 'approval', 'decision', 'client', 'work', 'professional'],
+        'sender': ['client', 'customer', 'partner', 'vendor', 'stakeholder', 'business', 'company']
+    },
+    'follow-up': {
+        'subject': ['follow up', 'follow-up', 'reminder', 'checking in', 'status', 'update', 'progress'],
+        'body': ['follow up', 'follow-up', 'reminder', 'checking in', 'status', 'update', 'progress', 'next steps'],
+        'sender': ['team', 'colleague', 'coordinator']
+    },
+    'junk': {
+        'subject': ['newsletter', 'notification', 'receipt', 'confirmation', 'invoice', 'statement', 'update'],
+        'body': ['newsletter', 'notification', 'receipt', 'confirmation', 'invoice', 'statement', 'unsubscribe'],
+        'sender': ['no-reply', 'noreply', 'automated', 'system', 'notification']
+    }
+}
+
+# Domain-based categorization
+DEFAULT_DOMAIN_CATEGORIES = {
+    'urgent': ['emergency', 'alert', 'critical'],
+    'important': ['business', 'corporate', 'company'],
+    'business': ['business', 'corporate', 'company', 'work', 'professional'],
+    'follow-up': ['team', 'project', 'collaboration'],
+    'junk': ['newsletter', 'marketing', 'promo', 'deals', 'promotion', 'sale', 'discount', 'offer', 'coupon', 'advertisement', 'unsubscribe']
+}
+
+KEYWORD_FIELDS = ('subject', 'body', 'sender')
+
+# Compiled rule sets kept per process; distinct configurations are few
+RULE_CACHE_MAX_ENTRIES = 256
+
+@dataclass(frozen=True)
+class FlagRules:
+    """Term keys (see term_key) matched for one flag, per email field"""
+    subject: Tuple[str, ...]
+    body: Tuple[str, ...]
+    sender: Tuple[str, ...]
+    domain: Tuple[str, ...]
+
+class CompiledRules:
+    """
+    Immutable keyword matcher built from a pair of rule tables.
+
+    Keywords are normalized to term keys once at compile time. Instances are
+    shared between sessions through compile_rules(), which caches them by
+    content hash, and pickle as their source tables so worker processes
+    recompile (once each) instead of shipping the compiled form.
+    """
+
+    __slots__ = ('content_hash', 'category_keywords', 'domain_categories', '_flags')
+
+    def __init__(self, content_hash: str, category_keywords: Dict[str, Dict[str, Tuple[str, ...]]],
+                 domain_categories: Dict[str, Tuple[str, ...]]):
+        flags = {}
+        for flag_name, fields in category_keywords.items():
+            flags[flag_name] = FlagRules(
+                subject=tuple(term_key(k) for k in fields['subject']),
+                body=tuple(term_key(k) for k in fields['body']),
+                sender=tuple(term_key(k) for k in fields['sender']),
+                domain=tuple(term_key(k) for k in domain_categories.get(flag_name, ()))
+            )
+        object.__setattr__(self, 'content_hash', content_hash)
+        object.__setattr__(self, 'category_keywords', category_keywords)
+        object.__setattr__(self, 'domain_categories', domain_categories)
+        object.__setattr__(self, '_flags', flags)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("CompiledRules is immutable")
+
+    def __reduce__(self):
+        return compile_rules, (self.category_keywords, self.domain_categories)
+
+    def get(self, flag_name: str) -> Optional[FlagRules]:
+        """Rules for a lowercased flag name, or None if the tables have no entry for it"""
+        return self._flags.get(flag_name)
+
+def _canonical_tables(category_keywords: Dict, domain_categories: Dict) -> Tuple[Dict, Dict]:
+    """
+    Validate rule tables and bring them into a canonical form
+
+    Flag names are lowercased and keyword lists become tuples of stripped strings.
+
+    Raises:
+        ValueError: if the tables are not shaped like the defaults
+    """
+    if not isinstance(category_keywords, dict) or not isinstance(domain_categories, dict):
+        raise ValueError("Rule tables must be objects keyed by flag name")
+
+    def keyword_list(value, where: str) -> Tuple[str, ...]:
+        if not isinstance(value, (list, tuple)) or not all(isinstance(k, str) for k in value):
+            raise ValueError(f"{where} must be a list of strings")
+        return tuple(k.strip() for k in value if k.strip())
+
+    keywords = {}
+    for flag_name, fields in category_keywords.items():
+        if not isinstance(fields, dict):
+            raise ValueError(f"category_keywords['{flag_name}'] must be an object")
+        unknown = set(fields) - set(KEYWORD_FIELDS)
+        if unknown:
+            raise ValueError(f"category_keywords['{flag_name}'] has unknown fields: {sorted(unknown)}")
+        keywords[flag_name.lower()] = {
+            field: keyword_list(fields.get(field, []), f"category_keywords['{flag_name}']['{field}']")
+            for field in KEYWORD_FIELDS
+        }
+
+    domains = {
+        flag_name.lower(): keyword_list(value, f"domain_categories['{flag_name}']")
+        for flag_name, value in domain_categories.items()
+    }
+    return keywords, domains
+
+def rules_hash(category_keywords: Dict, domain_categories: Dict) -> str:
+    """Content hash of canonical rule tables"""
+    payload = json.dumps([category_keywords, domain_categories], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+_compiled: "OrderedDict[str, CompiledRules]" = OrderedDict()
+_compiled_lock = threading.Lock()
+
+def compile_rules(category_keywords: Dict, domain_categories: Dict) -> CompiledRules:
+    """
+    Return the compiled matcher for a pair of rule tables
+
+    Each distinct configuration is compiled once per process and then served
+    from an LRU cache keyed by its content hash.
+
+    Raises:
+        ValueError: if the tables are malformed
+    """
+    keywords, domains = _canonical_tables(category_keywords, domain_categories)
+    content_hash = rules_hash(keywords, domains)
+    with _compiled_lock:
+        rules = _compiled.get(content_hash)
+        if rules is not None:
+            _compiled.move_to_end(content_hash)
+            return rules
+
+    rules = CompiledRules(content_hash, keywords, domains)
+    with _compiled_lock:
+        rules = _compiled.setdefault(content_hash, rules)
+        _compiled.move_to_end(content_hash)
+        while len(_compiled) > RULE_CACHE_MAX_ENTRIES:
+            _compiled.popitem(last=False)
+    return rules
+
+def default_rules() -> CompiledRules:
+    return compile_rules(DEFAULT_CATEGORY_KEYWORDS, DEFAULT_DOMAIN_CATEGORIES)
+
+def merge_with_defaults(category_keywords: Dict, domain_categories: Dict) -> Tuple[Dict, Dict]:
+    """Overlay a user's tables on the defaults; a user entry replaces the default entry for that flag"""
+    keywords = dict(DEFAULT_CATEGORY_KEYWORDS)
+    keywords.update({name.lower(): fields for name, fields in category_keywords.items()})
+    domains = dict(DEFAULT_DOMAIN_CATEGORIES)
+    domains.update({name.lower(): value for name, value in domain_categories.items()})
+    return keywords, domains
+
+def get_user_rule_tables(email: str) -> Optional[Tuple[Dict, Dict]]:
+    """The user's stored (category_keywords, domain_categories) overrides, or None"""
+    with get_db() as db:
+        row = execute_query(db.cursor(), queries.USER_RULE_TABLES, (email,)).fetchone()
+
+    if not row:
+        return None
+    category_keywords, domain_categories = (
+        (row['category_keywords'], row['domain_categories']) if hasattr(row, 'keys') else (row[0], row[1])
+    )
+    return json.loads(category_keywords or '{}'), json.loads(domain_categories or '{}')
+
+def save_user_rule_tables(email: str, category_keywords: Dict, domain_categories: Dict) -> CompiledRules:
+    """
+    Validate, store and compile a user's rule table overrides
+
+    Raises:
+        ValueError: if the tables are malformed
+    """
+    keywords, domains = _canonical_tables(category_keywords, domain_categories)
+    rules = compile_rules(*merge_with_defaults(keywords, domains))
+    keywords_json = json.dumps({k: {f: list(v) for f, v in fields.items()} for k, fields in keywords.items()})
+    domains_json = json.dumps({k: list(v) for k, v in domains.items()})
+
+    with get_db() as db:
+        execute_query(db.cursor(), queries.UPSERT_USER_RULE_TABLES, (email, keywords_json, domains_json, rules.content_hash))
+        db.commit()
+
+    return rules
+
+def delete_user_rule_tables(email: str):
+    """Drop a user's overrides so the defaults apply again"""
+    with get_db() as db:
+        execute_query(db.cursor(), queries.DELETE_USER_RULE_TABLES, (email,))
+        db.commit()
+
+def load_user_rules(email: str) -> CompiledRules:
+    """
+    The compiled matcher for a user: their stored overrides on top of the defaults
+
+    Falls back to the defaults if the stored tables can't be read.
+    """
+    try:
+        tables = get_user_rule_tables(email)
+        if tables is None:
+            return default_rules()
+        return compile_rules(*merge_with_defaults(*tables))
+    except Exception as e:
+        logger.warning("Could not load rule tables for %s, using defaults: %s", email, e)
+        return default_rules()
@@ -0,0 +1,157 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, Optional
+
+import numpy as np
+
+# Scoring stages timed in profiling mode
+STAGES = ('normalize', 'keywords', 'patterns', 'urgency', 'gemini')
+
+@dataclass
+class EmailProfile:
+    """Time per scoring stage and per flag, and keyword comparisons per flag, for one email"""
+    email_id: str
+    subject: str
+    body_chars: int
+    stage_seconds: Dict[str, float] = field(default_factory=dict)
+    flag_seconds: Dict[str, float] = field(default_factory=dict)
+    flag_comparisons: Dict[str, int] = field(default_factory=dict)
+
+    def add(self, stage: str, seconds: float, flag: Optional[str] = None, comparisons: int = 0):
+        self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + seconds
+        if flag is not None:
+            self.flag_seconds[flag] = self.flag_seconds.get(flag, 0.0) + seconds
+            self.flag_comparisons[flag] = self.flag_comparisons.get(flag, 0) + comparisons
+
+    @property
+    def total_seconds(self) -> float:
+        return sum(self.stage_seconds.values())
+
+    def to_dict(self) -> Dict:
+        hot_flag = max(self.flag_seconds, key=self.flag_seconds.get) if self.flag_seconds else None
+        return {
+            "email_id": self.email_id,
+            "email_subject": self.subject,
+            "body_chars": self.body_chars,
+            "seconds": self.total_seconds,
+            "stages": dict(self.stage_seconds),
+            "hot_flag": hot_flag
+        }
+
+class SessionProfile:
+    """
+    Per-email scoring profiles of one sorting session, aggregated on request.
+
+    Repeated profiling of the same email (local rules, then Gemini refinement)
+    accumulates onto one EmailProfile.
+    """
+
+    def __init__(self, session_id: str, slowest_emails: int = 20):
+        self.session_id = session_id
+        self.slowest_emails = slowest_emails
+        self._emails: Dict[str, EmailProfile] = {}
+        self._lock = threading.Lock()
+
+    def email(self, email_data: Dict) -> EmailProfile:
+        email_id = str(email_data.get('id') or id(email_data))
+        with self._lock:
+            profile = self._emails.get(email_id)
+            if profile is None:
+                profile = self._emails[email_id] = EmailProfile(
+                    email_id=email_id,
+                    subject=(email_data.get('subject') or '')[:100],
+                    body_chars=len(email_data.get('body') or '')
+                )
+            return profile
+
+    def summary(self) -> Dict:
+        with self._lock:
+            emails = list(self._emails.values())
+
+        stage_seconds = {stage: 0.0 for stage in STAGES}
+        flags: Dict[str, Dict] = {}
+        for profile in emails:
+            for stage, seconds in profile.stage_seconds.items():
+                stage_seconds[stage] = stage_seconds.get(stage, 0.0) + seconds
+            for flag, seconds in profile.flag_seconds.items():
+                totals = flags.setdefault(flag, {"flag": flag, "seconds": 0.0, "comparisons": 0, "emails": 0})
+                totals["seconds"] += seconds
+                totals["comparisons"] += profile.flag_comparisons.get(flag, 0)
+                totals["emails"] += 1
+
+        total_seconds = sum(stage_seconds.values())
+        body_chars = np.array([profile.body_chars for profile in emails]) if emails else np.zeros(1)
+        slowest = sorted(emails, key=lambda profile: profile.total_seconds, reverse=True)[:self.slowest_emails]
+
+        return {
+            "session_id": self.session_id,
+            "emails": len(emails),
+            "total_seconds": total_seconds,
+            "stages": {
+                stage: {"seconds": seconds, "share": seconds / total_seconds if total_seconds else 0.0}
+                for stage, seconds in stage_seconds.items()
+            },
+            "flags": sorted(flags.values(), key=lambda totals: totals["seconds"], reverse=True),
+            "body_chars": {
+                "p50": float(np.percentile(body_chars, 50)),
+                "p99": float(np.percentile(body_chars, 99)),
+                "max": int(body_chars.max())
+            },
+            "slowest_emails": [profile.to_dict() for profile in slowest]
+        }
+
+class ProfileRegistry:
+    """Recent sessions' profiles, oldest dropped first once max_sessions is reached"""
+
+    def __init__(self, max_sessions: int = 50):
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, SessionProfile]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def start(self, session_id: str, slowest_emails: int = 20) -> SessionProfile:
+        with self._lock:
+            profile = self._sessions[session_id] = SessionProfile(session_id, slowest_emails)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return profile
+
+    def get(self, session_id: str) -> Optional[SessionProfile]:
+        with self._lock:
+            return self._sessions.get(session_id)
+
+session_profiles = ProfileRegistry()
+
+# Profile of the email being scored in the current task, if profiling is on
+_current_email: ContextVar[Optional[EmailProfile]] = ContextVar('current_email_profile', default=None)
+
+def current_email_profile() -> Optional[EmailProfile]:
+    return _current_email.get()
+
+@contextmanager
+def profiling(session: Optional[SessionProfile], email_data: Dict) -> Iterator[Optional[EmailProfile]]:
+    """Record scoring stages of email_data into session while the block runs; a no-op if session is None"""
+    if session is None:
+        yield None
+        return
+    token = _current_email.set(session.email(email_data))
+    try:
+        yield _current_email.get()
+    finally:
+        _current_email.reset(token)
+
+@contextmanager
+def timed(stage: str, flag: Optional[str] = None) -> Iterator[None]:
+    """Add the block's duration to the current email profile under stage (and flag)"""
+    profile = _current_email.get()
+    if profile is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add(stage, time.perf_counter() - start, flag)
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from .. import queries
+from ..config import get_settings
+from ..database import execute_query, get_db
+from .email_normalization import parse_sender
+
+logger = logging.getLogger(__name__)
+
+# Shared mailbox providers - a domain decision there would lump unrelated people together
+FREEMAIL_DOMAINS = {
+    'gmail.com', 'googlemail.com', 'yahoo.com', 'outlook.com', 'hotmail.com', 'live.com',
+    'icloud.com', 'me.com', 'aol.com', 'proton.me', 'protonmail.com', 'gmx.com'
+}
+
+def flags_fingerprint(user_flags: List[Dict]) -> str:
+    """Hash of the flag configuration; decisions are rebuilt whenever it changes"""
+    canonical = sorted((flag['name'], (flag.get('description') or '').strip().lower()) for flag in user_flags)
+    return hashlib.sha256(json.dumps(canonical).encode('utf-8')).hexdigest()
+
+@dataclass(frozen=True)
+class SenderDecision:
+    label: str
+    confidence: float  # Mean confidence of the supporting assignments
+    support: int  # Number of high-confidence assignments to this label
+    share: float  # Fraction of all the sender's logged emails that went to this label
+
+@dataclass
+class UserDecisions:
+    fingerprint: str
+    built_at: float
+    senders: Dict[str, SenderDecision]
+    domains: Dict[str, SenderDecision]
+
+    def lookup(self, sender: str) -> Optional[SenderDecision]:
+        """The decision for a sender, falling back to its domain"""
+        address, domain = parse_sender(sender)
+        return self.senders.get(address) or self.domains.get(domain)
+
+class SenderDecisionCache:
+    """
+    Per-user memo of sender and domain decisions learned from sorting history.
+
+    A sender qualifies when at least min_support of its past emails were assigned
+    the same label with confidence >= min_confidence, and that label accounts for
+    at least min_consistency of everything logged for the sender (including
+    skipped emails). Domain decisions use the same rules at domain level.
+    """
+
+    def __init__(self, min_confidence: float, min_support: int, min_consistency: float,
+                 ttl_seconds: float, history_rows: int):
+        self.min_confidence = min_confidence
+        self.min_support = min_support
+        self.min_consistency = min_consistency
+        self.ttl_seconds = ttl_seconds
+        self.history_rows = history_rows
+        self._users: Dict[str, UserDecisions] = {}
+        self._lock = threading.Lock()
+
+    def invalidate(self, user_email: str):
+        """Drop a user's decisions, e.g. after their flags change"""
+        with self._lock:
+            self._users.pop(user_email, None)
+
+    def lookup(self, user_email: str, sender: str, user_flags: List[Dict]) -> Optional[SenderDecision]:
+        """Return the memoized decision for a sender, falling back to its domain"""
+        return self.decisions_for(user_email, user_flags).lookup(sender)
+
+    def decisions_for(self, user_email: str, user_flags: List[Dict]) -> UserDecisions:
+        """All of a user's decisions, rebuilt from history (a blocking query) when stale"""
+        fingerprint = flags_fingerprint(user_flags)
+        with self._lock:
+            cached = self._users.get(user_email)
+        if cached and cached.fingerprint == fingerprint and time.monotonic() - cached.built_at < self.ttl_seconds:
+            return cached
+
+        try:
+            senders, domains = self._learn(self._load_history(user_email))
+        except Exception as e:
+            logger.error(f"Error building sender decisions for {user_email}: {e}")
+            senders, domains = {}, {}
+
+        decisions = UserDecisions(fingerprint, time.monotonic(), senders, domains)
+        with self._lock:
+            self._users[user_email] = decisions
+        logger.info(f"Learned {len(senders)} sender and {len(domains)} domain decisions for {user_email}")
+        return decisions
+
+    def _load_history(self, user_email: str) -> List[Dict]:
+        with get_db() as db:
+            cursor = execute_query(db.cursor(), queries.SENDER_HISTORY, (user_email, self.history_rows))
+            return [dict(row) for row in cursor.fetchall()]
+
+    def _learn(self, rows: List[Dict]) -> Tuple[Dict[str, SenderDecision], Dict[str, SenderDecision]]:
+        by_sender = defaultdict(list)
+        by_domain = defaultdict(list)
+        for row in rows:
+            address, domain = parse_sender(row['email_from'])
+            if not address:
+                continue
+            by_sender[address].append(row)
+            if domain and domain not in FREEMAIL_DOMAINS:
+                by_domain[domain].append(row)
+
+        senders = {key: d for key, d in ((k, self._decide(v)) for k, v in by_sender.items()) if d}
+        domains = {key: d for key, d in ((k, self._decide(v)) for k, v in by_domain.items()) if d}
+        return senders, domains
+
+    def _decide(self, rows: List[Dict]) -> Optional[SenderDecision]:
+        confident = [
+            row for row in rows
+            if row['status'] == 'success' and row['assigned_label']
+            and (row['confidence_score'] or 0.0) >= self.min_confidence
+        ]
+        if len(confident) < self.min_support:
+            return None
+
+        label, support = Counter(row['assigned_label'] for row in confident).most_common(1)[0]
+        share = support / len(rows)
+        if support < self.min_support or share < self.min_consistency:
+            return None
+
+        confidence = sum(row['confidence_score'] for row in confident if row['assigned_label'] == label) / support
+        return SenderDecision(label=label, confidence=confidence, support=support, share=share)
+
+def _build_default_cache() -> SenderDecisionCache:
+    settings = get_settings()
+    return SenderDecisionCache(
+        min_confidence=settings.sender_cache_min_confidence,
+        min_support=settings.sender_cache_min_support,
+        min_consistency=settings.sender_cache_min_consistency,
+        ttl_seconds=settings.sender_cache_ttl_seconds,
+        history_rows=settings.sender_cache_history_rows
+    )
+
+# Shared by the sorting pipeline and the flags router, which invalidates it on changes
+sender_decision_cache = _build_default_cache()
@@ -0,0 +1,124 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+# Session states after which nothing is written
+FINISHED_STATES = ('completed', 'failed')
+
+# sorting_sessions columns mirrored in memory
+PROGRESS_FIELDS = ('status', 'end_time', 'total_emails', 'processed_emails', 'error_message')
+
+@dataclass
+class SessionProgress:
+    """Live progress of one sorting session, kept in sync with its sorting_sessions row"""
+    session_id: str
+    email: str
+    status: str = 'running'
+    start_time: datetime = field(default_factory=datetime.utcnow)
+    end_time: Optional[datetime] = None
+    total_emails: int = 0
+    processed_emails: int = 0
+    error_message: Optional[str] = None
+    label_counts: Dict[str, int] = field(default_factory=dict)
+    started: float = field(default_factory=time.monotonic)
+    persisted: float = field(default_factory=time.monotonic)
+    # processed_emails as last written to sorting_sessions
+    persisted_processed: int = 0
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    def eta_seconds(self) -> Optional[float]:
+        """Remaining time at the session's average pace so far"""
+        if self.finished or not self.processed_emails or not self.total_emails:
+            return None
+        elapsed = time.monotonic() - self.started
+        return elapsed / self.processed_emails * max(self.total_emails - self.processed_emails, 0)
+
+    def persist_due(self, interval: float) -> bool:
+        return (self.processed_emails != self.persisted_processed
+                and time.monotonic() - self.persisted >= interval)
+
+    def to_dict(self) -> Dict:
+        """The /sorting/status response, plus per-label counts and an ETA"""
+        return {
+            "session_id": self.session_id,
+            "status": self.status,
+            "start_time": self.start_time,
+            "end_time": self.end_time,
+            "total_emails": self.total_emails,
+            "processed_emails": self.processed_emails,
+            "error_message": self.error_message,
+            "label_counts": dict(self.label_counts),
+            "eta_seconds": self.eta_seconds()
+        }
+
+class ProgressRegistry:
+    """
+    In-memory progress of this process's sorting sessions.
+
+    Status polls read running sessions from here instead of the database.
+    Finished sessions are kept (oldest dropped first beyond max_sessions) so
+    their per-label counts stay available.
+    """
+
+    def __init__(self, max_sessions: int = 200):
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, SessionProgress]" = OrderedDict()
+        self._latest_by_email: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def start(self, session_id: str, email: str) -> SessionProgress:
+        with self._lock:
+            progress = self._sessions[session_id] = SessionProgress(session_id, email)
+            self._latest_by_email[email] = session_id
+            while len(self._sessions) > self.max_sessions:
+                _, dropped = self._sessions.popitem(last=False)
+                if self._latest_by_email.get(dropped.email) == dropped.session_id:
+                    del self._latest_by_email[dropped.email]
+            return progress
+
+    def get(self, session_id: str) -> Optional[SessionProgress]:
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def latest(self, email: str) -> Optional[SessionProgress]:
+        """The user's most recently started session in this process"""
+        with self._lock:
+            session_id = self._latest_by_email.get(email)
+            return self._sessions.get(session_id) if session_id else None
+
+    def update(self, session_id: str, **fields) -> Optional[SessionProgress]:
+        """Apply sorting_sessions column values (None values are ignored, as in update_sorting_session)"""
+        with self._lock:
+            progress = self._sessions.get(session_id)
+            if progress is None:
+                return None
+            for name in PROGRESS_FIELDS:
+                if fields.get(name) is not None:
+                    setattr(progress, name, fields[name])
+            return progress
+
+    def advance(self, session_id: str, labels: Iterable[str] = ()) -> Optional[SessionProgress]:
+        """Count one processed email and the labels it received"""
+        with self._lock:
+            progress = self._sessions.get(session_id)
+            if progress is None:
+                return None
+            progress.processed_emails += 1
+            for label in labels:
+                progress.label_counts[label] = progress.label_counts.get(label, 0) + 1
+            return progress
+
+    def mark_persisted(self, session_id: str):
+        with self._lock:
+            progress = self._sessions.get(session_id)
+            if progress is not None:
+                progress.persisted = time.monotonic()
+                progress.persisted_processed = progress.processed_emails
+
+session_progress = ProgressRegistry()
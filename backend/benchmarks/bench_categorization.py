@@ -0,0 +1,192 @@
+"""
+Throughput, latency and memory of EmailCategorizationService on a synthetic corpus.
+
+Runs categorize_email_enhanced (one email at a time, optionally with per-stage
+profiling on to measure its overhead) and batch_categorize_emails (serial,
+vectorized and optionally parallel) for every combination of corpus
+size and flag count. Results are written as JSON and can be compared against a
+stored baseline from an earlier run.
+
+Usage (from the backend directory):
+    python benchmarks/bench_categorization.py [--sizes 1000,5000] [--flag-counts 5,10,20]
+        [--modes enhanced,batch,vectorized] [--output results.json]
+        [--baseline baseline.json] [--tolerance 0.1] [--fail-on-regression]
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent))
+from app.services.email_categorization import EmailCategorizationService
+from app.services.scoring_profile import SessionProfile, profiling
+from corpus import make_corpus, make_flags
+
+MODES = ("enhanced", "profiled", "batch", "vectorized", "parallel")
+
+# Emails scored before each measurement so caches are warm
+WARMUP_EMAILS = 200
+
+def run_mode(service: EmailCategorizationService, mode: str, emails: List[Dict], flags: List[Dict]) -> Optional[List[float]]:
+    """Score emails in one mode, returning per-email latencies where the mode has them"""
+    if mode in ("enhanced", "profiled"):
+        session = SessionProfile("benchmark") if mode == "profiled" else None
+        latencies = []
+        for email in emails:
+            start = time.perf_counter()
+            with profiling(session, email):
+                service.categorize_email_enhanced(email, flags, {})
+            latencies.append(time.perf_counter() - start)
+        return latencies
+    if mode == "batch":
+        service.batch_categorize_emails(emails, flags)
+    elif mode == "vectorized":
+        service.batch_categorize_emails(emails, flags, vectorized=True)
+    elif mode == "parallel":
+        service.batch_categorize_emails(emails, flags, parallel=True)
+    else:
+        raise ValueError(f"Unknown mode: {mode}")
+    return None
+
+def peak_memory_mb(run: Callable[[], None]) -> float:
+    """Peak traced allocation during run(), in MiB"""
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / (1024 * 1024)
+
+def measure(service: EmailCategorizationService, mode: str, emails: List[Dict], flags: List[Dict],
+            memory: bool) -> Dict:
+    run_mode(service, mode, emails[:WARMUP_EMAILS], flags)
+
+    start = time.perf_counter()
+    latencies = run_mode(service, mode, emails, flags)
+    seconds = time.perf_counter() - start
+
+    result = {
+        "benchmark": mode,
+        "emails": len(emails),
+        "flags": len(flags),
+        "seconds": round(seconds, 4),
+        "emails_per_sec": round(len(emails) / seconds, 1),
+        "p50_ms": None,
+        "p99_ms": None,
+        "peak_memory_mb": None,
+    }
+    if latencies:
+        latencies_ms = np.array(latencies) * 1000
+        result["p50_ms"] = round(float(np.percentile(latencies_ms, 50)), 4)
+        result["p99_ms"] = round(float(np.percentile(latencies_ms, 99)), 4)
+    if memory:
+        # Separate pass: tracing allocations would distort the timings above
+        result["peak_memory_mb"] = round(peak_memory_mb(lambda: run_mode(service, mode, emails, flags)), 2)
+    return result
+
+def fmt(value: Optional[float], spec: str) -> str:
+    return "-" if value is None else format(value, spec)
+
+def result_key(result: Dict):
+    return result["benchmark"], result["emails"], result["flags"]
+
+def compare(results: List[Dict], baseline: List[Dict], tolerance: float) -> List[str]:
+    """
+    Print each result next to its baseline and return the regressions
+
+    A regression is throughput falling, or p99 latency rising, by more than tolerance.
+    """
+    baseline_by_key = {result_key(result): result for result in baseline}
+    regressions = []
+    print(f"\n{'benchmark':<12}{'emails':>8}{'flags':>7}{'emails/sec':>14}{'change':>9}{'p99 ms':>10}{'change':>9}")
+    for result in results:
+        base = baseline_by_key.get(result_key(result))
+        if base is None:
+            continue
+        throughput_change = result["emails_per_sec"] / base["emails_per_sec"] - 1
+        p99_change = None
+        if result["p99_ms"] and base.get("p99_ms"):
+            p99_change = result["p99_ms"] / base["p99_ms"] - 1
+        print(f"{result['benchmark']:<12}{result['emails']:>8}{result['flags']:>7}"
+              f"{result['emails_per_sec']:>14,.0f}{throughput_change:>+9.1%}"
+              f"{fmt(result['p99_ms'], '.3f'):>10}{fmt(p99_change, '+.1%'):>9}")
+
+        name = "{} emails={} flags={}".format(*result_key(result))
+        if throughput_change < -tolerance:
+            regressions.append(f"{name}: throughput {throughput_change:+.1%}")
+        if p99_change is not None and p99_change > tolerance:
+            regressions.append(f"{name}: p99 latency {p99_change:+.1%}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,5000", help="Comma-separated corpus sizes")
+    parser.add_argument("--flag-counts", default="5,10,20", help="Comma-separated flag counts")
+    parser.add_argument("--modes", default="enhanced,batch,vectorized", help=f"Comma-separated subset of {','.join(MODES)}")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--max-body-chars", type=int, default=None, help="Truncate bodies like the Gmail fetch does")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the peak-memory pass")
+    parser.add_argument("--output", type=Path, help="Write results as JSON to this file")
+    parser.add_argument("--baseline", type=Path, help="Compare against results JSON from an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed relative slowdown before flagging a regression")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 if any regression is found")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    flag_counts = [int(count) for count in args.flag_counts.split(",")]
+    modes = [mode.strip() for mode in args.modes.split(",")]
+    unknown = set(modes) - set(MODES)
+    if unknown:
+        parser.error(f"unknown modes: {', '.join(sorted(unknown))}")
+
+    service = EmailCategorizationService()
+    results = []
+    print(f"{'benchmark':<12}{'emails':>8}{'flags':>7}{'emails/sec':>14}{'p50 ms':>10}{'p99 ms':>10}{'peak MiB':>10}")
+    for size in sizes:
+        emails = make_corpus(size, args.seed, max_body_chars=args.max_body_chars)
+        for flag_count in flag_counts:
+            flags = make_flags(flag_count)
+            for mode in modes:
+                result = measure(service, mode, emails, flags, memory=not args.no_memory)
+                results.append(result)
+                print(f"{mode:<12}{size:>8}{flag_count:>7}{result['emails_per_sec']:>14,.0f}"
+                      f"{fmt(result['p50_ms'], '.3f'):>10}{fmt(result['p99_ms'], '.3f'):>10}"
+                      f"{fmt(result['peak_memory_mb'], '.1f'):>10}")
+
+    report = {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "max_body_chars": args.max_body_chars,
+        },
+        "results": results,
+    }
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+        print(f"\nWrote {len(results)} results to {args.output}")
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("\nRegressions:")
+            for regression in regressions:
+                print(f"  {regression}")
+            if args.fail_on_regression:
+                sys.exit(1)
+        else:
+            print(f"\nNo regressions beyond {args.tolerance:.0%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Cost of get_db() with pooled connections against opening a connection per call.
+
+Runs the statement pattern of perform_email_sorting (a progress UPDATE per
+email) against a scratch SQLite database, or against Postgres when
+SUPABASE_DB_URL is set.
+
+Usage (from the backend directory):
+    python benchmarks/bench_db_connections.py [--calls 2000]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+from app import database
+from app.database import db_pool_stats, get_db, get_db_type, init_db
+
+def update_progress(conn, placeholder: str, count: int):
+    cursor = conn.cursor()
+    cursor.execute(
+        f"UPDATE sorting_sessions SET processed_emails = {placeholder} WHERE session_id = {placeholder}",
+        (count, "bench-session")
+    )
+    conn.commit()
+
+def unpooled_connect():
+    if get_db_type() == "postgres":
+        import psycopg2
+        return psycopg2.connect(database.settings.supabase_db_url)
+    return sqlite3.connect(database.SQLITE_PATH)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=2000)
+    args = parser.parse_args()
+
+    scratch = None
+    if get_db_type() == "sqlite":
+        scratch = tempfile.TemporaryDirectory()
+        database.SQLITE_PATH = os.path.join(scratch.name, "bench.db")
+    placeholder = "%s" if get_db_type() == "postgres" else "?"
+
+    init_db()
+    with get_db() as conn:
+        conn.cursor().execute(
+            f"INSERT INTO sorting_sessions (session_id, status) VALUES ({placeholder}, 'running')",
+            ("bench-session",)
+        )
+        conn.commit()
+
+    start = time.perf_counter()
+    for count in range(args.calls):
+        conn = unpooled_connect()
+        try:
+            update_progress(conn, placeholder, count)
+        finally:
+            conn.close()
+    unpooled_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for count in range(args.calls):
+        with get_db() as conn:
+            update_progress(conn, placeholder, count)
+    pooled_seconds = time.perf_counter() - start
+
+    with get_db() as conn:
+        conn.cursor().execute(f"DELETE FROM sorting_sessions WHERE session_id = {placeholder}", ("bench-session",))
+        conn.commit()
+
+    print(f"Database:   {get_db_type()}  Calls: {args.calls}")
+    print(f"Unpooled:   {unpooled_seconds:.3f}s  ({unpooled_seconds / args.calls * 1e3:.3f} ms/call)")
+    print(f"Pooled:     {pooled_seconds:.3f}s  ({pooled_seconds / args.calls * 1e3:.3f} ms/call)")
+    print(f"Speedup:    {unpooled_seconds / pooled_seconds:.1f}x")
+    print(f"Pool:       {db_pool_stats()}")
+
+    database.close_db_pool()
+    if scratch:
+        scratch.cleanup()
+
+if __name__ == "__main__":
+    main()
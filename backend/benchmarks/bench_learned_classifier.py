@@ -0,0 +1,72 @@
+"""
+Training throughput and per-email prediction latency of the learned classifier.
+
+Usage (from the backend directory):
+    python benchmarks/bench_learned_classifier.py [--samples 20000] [--predictions 5000]
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent.parent))
+from app.services.learned_classifier import LearnedClassifier
+
+# label -> (subject words, senders)
+CLASSES = {
+    "Urgent": ("urgent asap deadline action required today critical outage".split(),
+               ["Ops <alerts@pager.example.com>", "Boss <boss@corp.com>"]),
+    "Marketing Mails": ("sale discount offer newsletter weekly deals off free shipping".split(),
+                        ["Shop <noreply@deals.shop.com>", "news@newsletter.brand.com"]),
+    "Follow-up": ("re: follow up reminder status update checking in next steps".split(),
+                  ["Team <team@project.io>", "Colleague <jane@corp.com>"]),
+    "Travel": ("flight booking confirmation itinerary hotel reservation trip".split(),
+               ["Airline <booking@airline.com>", "Hotels <reservations@hotels.com>"]),
+}
+NOISE = "hello quick question about the thing from last week thanks".split()
+
+def make_samples(count: int, seed: int):
+    rng = random.Random(seed)
+    labels = list(CLASSES)
+    samples, targets = [], []
+    for _ in range(count):
+        label = rng.choice(labels)
+        words, senders = CLASSES[label]
+        subject = " ".join(rng.choices(words, k=rng.randint(2, 5)) + rng.choices(NOISE, k=rng.randint(0, 4)))
+        samples.append((subject, rng.choice(senders)))
+        targets.append(label)
+    return samples, targets
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--samples", type=int, default=20000)
+    parser.add_argument("--predictions", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    samples, labels = make_samples(args.samples, args.seed)
+    test_samples, test_labels = make_samples(args.predictions, args.seed + 1)
+
+    model = LearnedClassifier()
+    start = time.perf_counter()
+    model.partial_fit(samples, labels)
+    train_seconds = time.perf_counter() - start
+
+    latencies = []
+    correct = 0
+    for (subject, sender), label in zip(test_samples, test_labels):
+        start = time.perf_counter()
+        predicted, _ = model.predict(subject, sender)
+        latencies.append(time.perf_counter() - start)
+        correct += predicted == label
+
+    latencies_us = np.array(latencies) * 1e6
+    print(f"Training:    {len(samples)} rows in {train_seconds:.2f}s ({len(samples) / train_seconds:,.0f} rows/sec)")
+    print(f"Prediction:  p50 {np.percentile(latencies_us, 50):.0f}us  p99 {np.percentile(latencies_us, 99):.0f}us")
+    print(f"Accuracy:    {correct / len(test_samples):.3f} on {len(test_samples)} held-out emails")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Scoring-loop throughput under different logging setups.
+
+Compares categorize_email_enhanced with logging off, with the production
+queue handler at INFO, with per-email DEBUG records sampled through the
+queue, and with an unsampled synchronous DEBUG handler (the old print()
+behaviour). Log output goes to os.devnull so only the logging cost is measured.
+
+Usage (from the backend directory):
+    python benchmarks/bench_logging.py [--emails 10000] [--seed 42]
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent))
+from app.logging_config import LOG_FORMAT, setup_logging, stop_logging
+from app.services.email_categorization import EmailCategorizationService
+from corpus import make_corpus, make_flags
+
+FLAGS = make_flags(6)
+
+def reset_logging():
+    stop_logging()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+
+def run(service, emails) -> float:
+    start = time.perf_counter()
+    for email in emails:
+        service.categorize_email_enhanced(email, FLAGS, {})
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--emails", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    service = EmailCategorizationService()
+    emails = make_corpus(args.emails, args.seed, max_body_chars=1000)
+    devnull = open(os.devnull, "w")
+    root = logging.getLogger()
+
+    def disabled():
+        reset_logging()
+        root.setLevel(logging.WARNING)
+
+    def queue_info():
+        reset_logging()
+        setup_logging("INFO", stream=devnull)
+
+    def queue_debug_sampled():
+        reset_logging()
+        setup_logging("DEBUG", stream=devnull)
+
+    def sync_debug():
+        reset_logging()
+        handler = logging.StreamHandler(devnull)
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        root.addHandler(handler)
+        root.setLevel(logging.DEBUG)
+
+    setups = [
+        ("Disabled", disabled),
+        ("Queue INFO", queue_info),
+        ("Queue DEBUG sampled", queue_debug_sampled),
+        ("Sync DEBUG", sync_debug),
+    ]
+
+    # Warm the normalization caches so the first setup is not penalized
+    run(service, emails[:1000])
+
+    print(f"Emails: {len(emails)}  Flags: {len(FLAGS)}")
+    baseline = None
+    for name, setup in setups:
+        setup()
+        seconds = run(service, emails)
+        reset_logging()
+        baseline = baseline or seconds
+        print(f"{name + ':':<22}{seconds:.3f}s  ({len(emails) / seconds:,.0f} emails/sec, "
+              f"{seconds / baseline:.2f}x disabled)")
+    devnull.close()
+
+if __name__ == "__main__":
+    main()
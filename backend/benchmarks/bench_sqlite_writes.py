@@ -0,0 +1,207 @@
+"""
+Insert throughput of concurrent sorting sessions on SQLite.
+
+Every session logs one email_processing_log row and one progress UPDATE per
+email, as perform_email_sorting does, while reader threads poll the session
+status. Compared setups, each on a fresh scratch database:
+
+    rollback   default journal, every session commits its own writes
+    wal        tuned connection (WAL, synchronous=NORMAL), own commits
+    writer     tuned connection, writes queued to the single writer thread
+    async      sessions as coroutines awaiting async_database.execute
+    buffered   as async, with log rows going through ProcessingLogWriter (the app's path)
+
+Usage (from the backend directory):
+    python benchmarks/bench_sqlite_writes.py [--sessions 16] [--emails 200] [--readers 4]
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent.parent))
+from app import database
+from app.async_database import close_async_db, execute
+from app.database import init_db
+from app.services.processing_log import ProcessingLogWriter
+
+MODES = ("rollback", "wal", "writer", "async", "buffered")
+
+INSERT_LOG = """
+    INSERT INTO email_processing_log (session_id, email_id, email_subject, email_from, assigned_label,
+                                      confidence_score, status)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+UPDATE_PROGRESS = "UPDATE sorting_sessions SET processed_emails = ? WHERE session_id = ?"
+SELECT_STATUS = "SELECT status, processed_emails, total_emails FROM sorting_sessions WHERE session_id = ?"
+
+def log_params(session_id: str, index: int):
+    return (session_id, f"msg-{index}", f"Subject {index}", "sender@example.com", "Business", 0.8, "success")
+
+def connect(mode: str) -> sqlite3.Connection:
+    if mode == "rollback":
+        conn = sqlite3.connect(database.SQLITE_PATH)
+        conn.execute("PRAGMA journal_mode=DELETE")
+        return conn
+    return database._connect_sqlite()
+
+def run_session_direct(mode: str, session_id: str, emails: int, errors: list):
+    conn = connect(mode)
+    try:
+        for index in range(emails):
+            try:
+                conn.execute(INSERT_LOG, log_params(session_id, index))
+                conn.execute(UPDATE_PROGRESS, (index + 1, session_id))
+                conn.commit()
+            except sqlite3.OperationalError as e:
+                conn.rollback()
+                errors.append(str(e))
+    finally:
+        conn.close()
+
+def run_session_writer(session_id: str, emails: int, errors: list):
+    writer = database.sqlite_writer()
+    for index in range(emails):
+        try:
+            writer.submit(INSERT_LOG, log_params(session_id, index)).result()
+            writer.submit(UPDATE_PROGRESS, (index + 1, session_id)).result()
+        except sqlite3.OperationalError as e:
+            errors.append(str(e))
+
+async def run_session_async(session_id: str, emails: int, errors: list):
+    for index in range(emails):
+        try:
+            await execute(INSERT_LOG, log_params(session_id, index))
+            await execute(UPDATE_PROGRESS, (index + 1, session_id))
+        except sqlite3.OperationalError as e:
+            errors.append(str(e))
+
+async def run_session_buffered(session_id: str, emails: int, errors: list, log_writer: ProcessingLogWriter):
+    for index in range(emails):
+        log_writer.add(log_params(session_id, index) + (None, None))
+        try:
+            await execute(UPDATE_PROGRESS, (index + 1, session_id))
+        except sqlite3.OperationalError as e:
+            errors.append(str(e))
+    # As update_sorting_session does when the session completes
+    await log_writer.flush_async()
+
+def poll_status(mode: str, session_ids: list, stop: threading.Event, latencies: list, errors: list):
+    conn = connect(mode)
+    try:
+        index = 0
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                conn.execute(SELECT_STATUS, (session_ids[index % len(session_ids)],)).fetchall()
+                latencies.append(time.perf_counter() - start)
+            except sqlite3.OperationalError as e:
+                errors.append(str(e))
+            index += 1
+            time.sleep(0.001)
+    finally:
+        conn.close()
+
+def run_mode(mode: str, sessions: int, emails: int, readers: int) -> dict:
+    scratch = tempfile.TemporaryDirectory()
+    database.SQLITE_PATH = os.path.join(scratch.name, f"{mode}.db")
+    init_db()
+    session_ids = [f"bench-{mode}-{index}" for index in range(sessions)]
+    with database.get_db() as conn:
+        conn.executemany(
+            "INSERT INTO sorting_sessions (session_id, status, total_emails) VALUES (?, 'running', ?)",
+            [(session_id, emails) for session_id in session_ids]
+        )
+        conn.commit()
+    if mode == "rollback":
+        # init_db's connection switched the file to WAL; close it and switch back
+        database.close_db_pool()
+        connect(mode).close()
+
+    write_errors, read_errors, read_latencies = [], [], []
+    stop = threading.Event()
+    pollers = [
+        threading.Thread(target=poll_status, args=(mode, session_ids, stop, read_latencies, read_errors))
+        for _ in range(readers)
+    ]
+    for poller in pollers:
+        poller.start()
+
+    start = time.perf_counter()
+    if mode in ("async", "buffered"):
+        log_writer = ProcessingLogWriter()
+        async def run_all():
+            if mode == "buffered":
+                sessions = (run_session_buffered(session_id, emails, write_errors, log_writer) for session_id in session_ids)
+            else:
+                sessions = (run_session_async(session_id, emails, write_errors) for session_id in session_ids)
+            await asyncio.gather(*sessions)
+            await close_async_db()
+        asyncio.run(run_all())
+        log_writer.close()
+    else:
+        if mode == "writer":
+            workers = [threading.Thread(target=run_session_writer, args=(session_id, emails, write_errors))
+                       for session_id in session_ids]
+        else:
+            workers = [threading.Thread(target=run_session_direct, args=(mode, session_id, emails, write_errors))
+                       for session_id in session_ids]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    seconds = time.perf_counter() - start
+
+    stop.set()
+    for poller in pollers:
+        poller.join()
+    writer_stats = database.db_pool_stats().get("writer")
+    database.close_db_pool()
+
+    with sqlite3.connect(database.SQLITE_PATH) as conn:
+        rows = conn.execute("SELECT COUNT(*) FROM email_processing_log").fetchone()[0]
+    scratch.cleanup()
+
+    latencies_ms = np.array(read_latencies or [0.0]) * 1000
+    return {
+        "mode": mode,
+        "rows": rows,
+        "seconds": seconds,
+        "rows_per_sec": rows / seconds,
+        "write_errors": len(write_errors),
+        "read_errors": len(read_errors),
+        "read_p99_ms": float(np.percentile(latencies_ms, 99)),
+        "batches": writer_stats["batches"] if writer_stats else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=16, help="Concurrent sorting sessions")
+    parser.add_argument("--emails", type=int, default=200, help="Emails logged per session")
+    parser.add_argument("--readers", type=int, default=4, help="Threads polling session status")
+    parser.add_argument("--modes", default=",".join(MODES), help=f"Comma-separated subset of {','.join(MODES)}")
+    args = parser.parse_args()
+
+    modes = [mode.strip() for mode in args.modes.split(",")]
+    unknown = set(modes) - set(MODES)
+    if unknown:
+        parser.error(f"unknown modes: {', '.join(sorted(unknown))}")
+
+    print(f"Sessions: {args.sessions}  Emails/session: {args.emails}  Readers: {args.readers}")
+    print(f"{'mode':<10}{'rows':>8}{'seconds':>10}{'rows/sec':>12}{'write errs':>12}{'read errs':>11}"
+          f"{'read p99 ms':>13}{'batches':>9}")
+    for mode in modes:
+        result = run_mode(mode, args.sessions, args.emails, args.readers)
+        batches = "-" if result["batches"] is None else str(result["batches"])
+        print(f"{mode:<10}{result['rows']:>8}{result['seconds']:>10.3f}{result['rows_per_sec']:>12,.0f}"
+              f"{result['write_errors']:>12}{result['read_errors']:>11}{result['read_p99_ms']:>13.3f}{batches:>9}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Seeded synthetic email corpus and flag sets shared by the benchmarks.
+
+Every email is a dict shaped like GmailService.get_recent_emails output
+('id', 'subject', 'from', 'body', 'date'). The same seed always yields the
+same corpus, so runs on different machines or commits are comparable.
+"""
+import random
+from typing import Dict, List, Optional, Sequence
+
+FILLER = (
+    "hello team please find the notes from today thanks regards see you soon let me know if you have "
+    "any questions about this when you get a chance have a great weekend best wishes"
+).split()
+
+NEWSLETTER_WORDS = (
+    "newsletter weekly digest sale discount offer limited time free shipping deals coupon promo "
+    "unsubscribe new arrivals exclusive members save percent off shop now"
+).split()
+
+MEETING_WORDS = (
+    "meeting agenda project review presentation conference report approval decision client "
+    "stakeholder quarterly roadmap notes calendar invite tomorrow business work"
+).split()
+
+URGENT_WORDS = (
+    "urgent asap critical emergency outage incident deadline immediately action required "
+    "priority escalation time-sensitive today now alert"
+).split()
+
+FOLLOW_UP_WORDS = "follow up follow-up reminder checking in status update progress next steps".split()
+
+PERSONAL_WORDS = "lunch dinner family photos weekend birthday trip holiday kids game movie".split()
+
+SENDERS = {
+    "newsletter": ["Deals <noreply@deals.shop.com>", "news@newsletter.marketing.com", "Brand <promo@brand-mail.com>"],
+    "meeting": ["Manager <manager@corp.com>", "Client <client@partner-business.com>", "PMO <pmo@company.io>"],
+    "urgent_alert": ["Ops <alerts@pager.example.com>", "Boss <boss@corp.com>", "Security <admin@emergency-alert.org>"],
+    "html_long": ["Shop <orders@store.example.com>", "Updates <notification@system.example.com>"],
+    "follow_up": ["Team Lead <team@project.io>", "Colleague <colleague@corp.com>"],
+    "personal": ["Friend <friend@gmail.com>", "Mom <mom@yahoo.com>"],
+}
+
+# Share of each kind in a default corpus
+DEFAULT_MIX = {
+    "newsletter": 0.3,
+    "meeting": 0.2,
+    "urgent_alert": 0.1,
+    "html_long": 0.1,
+    "follow_up": 0.15,
+    "personal": 0.15,
+}
+
+DEFAULT_FLAGS = [
+    {"name": "Urgent", "description": "High priority emails"},
+    {"name": "Important", "description": "Important business emails"},
+    {"name": "Business", "description": "Business and work-related emails"},
+    {"name": "Follow-up", "description": "Emails requiring follow-up"},
+    {"name": "Junk", "description": "Marketing and promotional emails"},
+]
+
+# Custom-description flags used to pad flag sets beyond the defaults
+CUSTOM_FLAGS = [
+    {"name": "Travel", "description": "Flight confirmations and hotel bookings"},
+    {"name": "Family", "description": "photos from family and weekend plans"},
+    {"name": "Finance", "description": "invoices receipts and bank statements"},
+    {"name": "Incidents", "description": "outage incident escalation"},
+    {"name": "Shopping", "description": "orders shipping and delivery updates"},
+    {"name": "Events", "description": "conference invites and calendar events"},
+    {"name": "Recruiting", "description": "job candidates interviews and offers"},
+    {"name": "Legal", "description": "contracts agreements and compliance review"},
+    {"name": "Social", "description": "birthday parties dinner and lunch plans"},
+    {"name": "Reports", "description": "quarterly report roadmap and metrics"},
+]
+
+def make_flags(count: int) -> List[Dict]:
+    """The default flags followed by custom-description flags, count in total"""
+    flags = (DEFAULT_FLAGS + CUSTOM_FLAGS)[:count]
+    # Beyond the predefined list, repeat custom descriptions under new names
+    for index in range(len(flags), count):
+        template = CUSTOM_FLAGS[index % len(CUSTOM_FLAGS)]
+        flags.append({"name": f"{template['name']} {index}", "description": template["description"]})
+    return flags
+
+def _words(rng: random.Random, topic: Sequence[str], count: int, topic_share: float) -> str:
+    return " ".join(rng.choice(topic) if rng.random() < topic_share else rng.choice(FILLER) for _ in range(count))
+
+def _html_body(rng: random.Random, paragraphs: int) -> str:
+    blocks = []
+    for _ in range(paragraphs):
+        text = _words(rng, NEWSLETTER_WORDS + MEETING_WORDS, rng.randint(30, 80), 0.3)
+        blocks.append(f'<tr><td style="font-family:Arial;padding:12px"><p>{text}</p>'
+                      f'<a href="https://example.com/track?id={rng.randint(0, 10**9)}">View</a></td></tr>')
+    return f"<html><body><table>{''.join(blocks)}</table></body></html>"
+
+def make_email(rng: random.Random, kind: str, index: int) -> Dict:
+    """One synthetic email of the given kind"""
+    if kind == "newsletter":
+        subject = _words(rng, NEWSLETTER_WORDS, rng.randint(3, 8), 0.8)
+        body = _words(rng, NEWSLETTER_WORDS, rng.randint(40, 160), 0.5)
+    elif kind == "meeting":
+        subject = _words(rng, MEETING_WORDS, rng.randint(3, 8), 0.8)
+        body = _words(rng, MEETING_WORDS, rng.randint(30, 140), 0.4)
+    elif kind == "urgent_alert":
+        subject = _words(rng, URGENT_WORDS, rng.randint(2, 6), 0.9).upper() + "!!!"
+        body = _words(rng, URGENT_WORDS + MEETING_WORDS, rng.randint(20, 80), 0.5)
+    elif kind == "html_long":
+        subject = _words(rng, NEWSLETTER_WORDS, rng.randint(3, 8), 0.6)
+        body = _html_body(rng, rng.randint(10, 40))
+    elif kind == "follow_up":
+        subject = "Re: " + _words(rng, FOLLOW_UP_WORDS + MEETING_WORDS, rng.randint(3, 7), 0.7)
+        body = _words(rng, FOLLOW_UP_WORDS, rng.randint(20, 100), 0.3)
+    elif kind == "personal":
+        subject = _words(rng, PERSONAL_WORDS, rng.randint(2, 6), 0.6)
+        body = _words(rng, PERSONAL_WORDS, rng.randint(10, 60), 0.3)
+    else:
+        raise ValueError(f"Unknown email kind: {kind}")
+
+    return {
+        "id": f"{kind}-{index}",
+        "subject": subject.capitalize(),
+        "from": rng.choice(SENDERS[kind]),
+        "body": body,
+        "date": "Mon, 1 Jan 2024 09:00:00 +0000",
+    }
+
+def make_corpus(count: int, seed: int = 42, mix: Optional[Dict[str, float]] = None,
+                max_body_chars: Optional[int] = None) -> List[Dict]:
+    """
+    A seeded corpus of count emails
+
+    Args:
+        mix: kind -> relative share (default DEFAULT_MIX)
+        max_body_chars: Truncate bodies like GmailService does (None keeps long bodies)
+    """
+    rng = random.Random(seed)
+    mix = mix or DEFAULT_MIX
+    kinds, weights = list(mix), list(mix.values())
+    emails = []
+    for index, kind in enumerate(rng.choices(kinds, weights=weights, k=count)):
+        email = make_email(rng, kind, index)
+        if max_body_chars is not None:
+            email["body"] = email["body"][:max_body_chars]
+        emails.append(email)
+    return emails
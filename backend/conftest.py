@@ -0,0 +1,26 @@
+"""
+Shared pytest fixtures for the database tests.
+
+app.database keeps module-level state (SQLITE_PATH, the Postgres pool, the
+SQLite writer thread and cached connections). These fixtures point it at a
+file under tmp_path, close every pool before and after the test, and restore
+SQLITE_PATH afterwards, so tests cannot leak a database into each other.
+"""
+import pytest
+
+from app import database
+
+@pytest.fixture
+def empty_db(tmp_path, monkeypatch) -> str:
+    """Path of a new SQLite database with no tables, used by app.database for this test"""
+    database.close_db_pool()
+    path = str(tmp_path / "test.db")
+    monkeypatch.setattr(database, "SQLITE_PATH", path)
+    yield path
+    database.close_db_pool()
+
+@pytest.fixture
+def scratch_db(empty_db) -> str:
+    """Like empty_db, with every schema migration applied"""
+    database.init_db()
+    return empty_db
@@ -10,6 +10,7 @@ import os
 # Add the parent directory to sys.path
 sys.path.append(str(Path(__file__).parent.parent))
 from app.config import get_settings
+from app.migrations import migrate
 
 def get_sqlite_connection():
     """Connect to SQLite database"""
@@ -24,94 +25,7 @@ def get_postgres_connection():
 
 def create_tables(pg_conn):
     """Create tables in Supabase"""
-    with pg_conn.cursor() as cur:
-        # Users table
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                email TEXT PRIMARY KEY,
-                credentials JSONB
-            )
-        """)
-        
-        # User flags table
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS user_flags (
-                email TEXT,
-                flag_name TEXT,
-                flag_description TEXT,
-                flag_color TEXT,
-                is_active BOOLEAN DEFAULT FALSE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                PRIMARY KEY (email, flag_name),
-                FOREIGN KEY (email) REFERENCES users(email) ON DELETE CASCADE
-            )
-        """)
-        
-        # Flag history table
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS flag_history (
-                id SERIAL PRIMARY KEY,
-                email TEXT,
-                message_id TEXT,
-                flag_name TEXT,
-                action TEXT,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (email) REFERENCES users(email) ON DELETE CASCADE
-            )
-        """)
-        
-        # Gmail labels table
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS gmail_labels (
-                id SERIAL PRIMARY KEY,
-                email TEXT,
-                label_name TEXT,
-                label_id TEXT,
-                label_color TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                is_active BOOLEAN DEFAULT TRUE,
-                UNIQUE(email, label_name),
-                FOREIGN KEY (email) REFERENCES users(email) ON DELETE CASCADE
-            )
-        """)
-        
-        # Sorting sessions table
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS sorting_sessions (
-                id SERIAL PRIMARY KEY,
-                email TEXT,
-                session_id TEXT UNIQUE,
-                start_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                end_time TIMESTAMP,
-                status TEXT DEFAULT 'running',
-                total_emails INTEGER DEFAULT 0,
-                processed_emails INTEGER DEFAULT 0,
-                error_message TEXT,
-                flags_used TEXT,
-                FOREIGN KEY (email) REFERENCES users(email) ON DELETE CASCADE
-            )
-        """)
-        
-        # Email processing log table
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS email_processing_log (
-                id SERIAL PRIMARY KEY,
-                session_id TEXT,
-                email_id TEXT,
-                email_subject TEXT,
-                email_from TEXT,
-                assigned_label TEXT,
-                confidence_score REAL,
-                processing_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                status TEXT DEFAULT 'success',
-                error_details TEXT,
-                FOREIGN KEY (session_id) REFERENCES sorting_sessions(session_id) ON DELETE CASCADE
-            )
-        """)
-        
-        pg_conn.commit()
+    migrate(pg_conn, "postgres")
 
 def migrate_table(sqlite_cur, pg_conn, table_name, columns):
     """Migrate data from SQLite table to PostgreSQL"""
@@ -161,8 +75,9 @@ def main():
             'user_flags': ['email', 'flag_name', 'flag_description', 'flag_color', 'is_active', 'created_at', 'updated_at'],
             'flag_history': ['email', 'message_id', 'flag_name', 'action', 'timestamp'],
             'gmail_labels': ['email', 'label_name', 'label_id', 'label_color', 'created_at', 'updated_at', 'is_active'],
-            'sorting_sessions': ['email', 'session_id', 'start_time', 'end_time', 'status', 'total_emails', 'processed_emails', 'error_message', 'flags_used'],
-            'email_processing_log': ['session_id', 'email_id', 'email_subject', 'email_from', 'assigned_label', 'confidence_score', 'processing_time', 'status', 'error_details']
+            'sorting_sessions': ['email', 'session_id', 'start_time', 'end_time', 'status', 'total_emails', 'processed_emails', 'error_message', 'flags_used', 'profile'],
+            'email_processing_log': ['session_id', 'email_id', 'email_subject', 'email_from', 'assigned_label', 'confidence_score', 'processing_time', 'status', 'error_details', 'cluster_id', 'decision_source'],
+            'user_rule_tables': ['email', 'category_keywords', 'domain_categories', 'content_hash', 'updated_at']
         }
         
         # Migrate each table
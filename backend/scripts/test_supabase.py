@@ -8,6 +8,8 @@ from datetime import datetime
 # Add the parent directory to sys.path
 sys.path.append(str(Path(__file__).parent.parent))
 from app.config import get_settings
+from app.migrations import HOT_QUERY_INDEXES
+from test_schema_migrations import HOT_QUERIES
 
 def get_postgres_connection():
     """Connect to Supabase PostgreSQL database"""
@@ -84,6 +86,24 @@ def run_test_queries(conn):
             if rows:
                 print("Sample row:", rows[0])
 
+def explain_hot_queries(conn):
+    """Check that the router queries are planned with their indexes"""
+    print("\nChecking query plans...")
+    with conn.cursor() as cur:
+        # The test tables are tiny, so make the planner prefer any usable index
+        cur.execute("SET enable_seqscan = off")
+        for name, query, params, index, _ in HOT_QUERIES:
+            query = query.replace("?", "%s")
+            cur.execute(f"EXPLAIN {query}", params)
+            plan = "\n".join(row[0] for row in cur.fetchall())
+            # email_processing_log is partitioned; each partition's copy of the index is named after its columns
+            columns = HOT_QUERY_INDEXES[index].split("(")[1].rstrip(")").split(", ")
+            if index not in plan and f"{'_'.join(columns)}_idx" not in plan:
+                raise AssertionError(f"{name} does not use {index}:\n{plan}")
+            print(f"{name}: uses {index}")
+        cur.execute("RESET enable_seqscan")
+    conn.rollback()
+
 def cleanup_test_data(conn):
     """Clean up test data"""
     print("\nCleaning up test data...")
@@ -110,6 +130,9 @@ def main():
         # Run test queries
         run_test_queries(conn)
         
+        # Verify the hot queries use their indexes
+        explain_hot_queries(conn)
+        
         # Clean up test data
         cleanup_test_data(conn)
         
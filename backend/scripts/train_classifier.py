@@ -0,0 +1,36 @@
+import argparse
+from pathlib import Path
+import sys
+from dotenv import load_dotenv
+
+# Add the parent directory to sys.path
+sys.path.append(str(Path(__file__).parent.parent))
+from app.config import get_settings
+from app.services.learned_classifier import ClassifierStore
+
+def main():
+    """Train a user's categorization model from their sorting history"""
+    # Load environment variables
+    load_dotenv(Path(__file__).parent.parent / "details.env")
+    
+    parser = argparse.ArgumentParser(description="Train the learned email classifier for a user")
+    parser.add_argument("email", help="User whose email_processing_log history to train on")
+    parser.add_argument("--full", action="store_true", help="Retrain from scratch instead of incrementally")
+    parser.add_argument("--epochs", type=int, default=5)
+    args = parser.parse_args()
+    
+    store = ClassifierStore(get_settings().classifier_model_dir)
+    
+    print(f"Training classifier for {args.email}...")
+    model = store.train(args.email, full=args.full, epochs=args.epochs)
+    
+    if model is None:
+        print("No successful assignments found in sorting history - nothing to train on")
+        return
+    
+    print(f"Model saved to {store.path_for(args.email)}")
+    print(f"Classes: {', '.join(model.classes)}")
+    print(f"Trained on {model.trained_samples} rows (last log id {model.last_log_id})")
+
+if __name__ == "__main__":
+    main()
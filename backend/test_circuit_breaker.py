@@ -0,0 +1,98 @@
+import sys
+sys.path.append('.')
+import time
+from app.services.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+OPEN_SECONDS = 0.05
+
+def make_breaker(half_open_probes: int = 1) -> CircuitBreaker:
+    return CircuitBreaker('test', window_size=10, min_requests=4, max_error_rate=0.5,
+                          max_p95_latency=1.0, open_seconds=OPEN_SECONDS, half_open_probes=half_open_probes)
+
+def trip(breaker: CircuitBreaker):
+    for _ in range(4):
+        breaker.record_failure(0.01, breaker.allow_request())
+    assert breaker.state == OPEN
+
+def test_opens_on_error_rate_and_latency():
+    breaker = make_breaker()
+    for ok in (True, False, True):
+        permit = breaker.allow_request()
+        if ok:
+            breaker.record_success(0.01, permit)
+        else:
+            breaker.record_failure(0.01, permit)
+    # One failure in four calls stays below the 50% error rate
+    breaker.record_success(0.01, breaker.allow_request())
+    assert breaker.state == CLOSED
+    breaker.record_failure(0.01, breaker.allow_request())
+    breaker.record_failure(0.01, breaker.allow_request())
+    assert breaker.state == OPEN
+    assert breaker.allow_request() is None and breaker.stats()["rejected"] == 1
+
+    slow = make_breaker()
+    for _ in range(4):
+        slow.record_success(2.0, slow.allow_request())
+    assert slow.state == OPEN
+
+def test_half_open_probe_closes_or_reopens():
+    breaker = make_breaker()
+    trip(breaker)
+    time.sleep(OPEN_SECONDS * 1.5)
+    assert breaker.state == HALF_OPEN
+
+    probe = breaker.allow_request()
+    assert probe is not None and probe.probe
+    # Only half_open_probes calls go through while the probe is out
+    assert breaker.allow_request() is None
+    breaker.record_failure(0.01, probe)
+    assert breaker.state == OPEN
+
+    time.sleep(OPEN_SECONDS * 1.5)
+    probe = breaker.allow_request()
+    breaker.record_success(0.01, probe)
+    assert breaker.state == CLOSED
+    assert not breaker.allow_request().probe
+
+    # A probe that succeeds too slowly reopens the circuit
+    trip(breaker)
+    time.sleep(OPEN_SECONDS * 1.5)
+    breaker.record_success(2.0, breaker.allow_request())
+    assert breaker.state == OPEN
+
+def test_cancelled_probe_frees_its_slot():
+    breaker = make_breaker()
+    trip(breaker)
+    time.sleep(OPEN_SECONDS * 1.5)
+    breaker.record_cancelled(breaker.allow_request())
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow_request() is not None
+
+def test_late_results_from_before_the_trip_are_ignored():
+    breaker = make_breaker()
+    slow_call = breaker.allow_request()
+    trip(breaker)
+    time.sleep(OPEN_SECONDS * 1.5)
+    probe = breaker.allow_request()
+    assert breaker.state == HALF_OPEN
+
+    # The call that started while closed finishes now; it must not close the circuit
+    breaker.record_success(0.01, slow_call)
+    assert breaker.state == HALF_OPEN
+    # Nor free the probe's slot
+    assert breaker.allow_request() is None
+    breaker.record_failure(0.01, slow_call)
+    assert breaker.state == HALF_OPEN
+
+    breaker.record_success(0.01, probe)
+    assert breaker.state == CLOSED
+    # An outcome from the half-open generation is stale once closed, too
+    breaker.record_failure(0.01, probe)
+    assert breaker.stats()["recent_calls"] == 0
+
+if __name__ == "__main__":
+    test_opens_on_error_rate_and_latency()
+    test_half_open_probe_closes_or_reopens()
+    test_cancelled_probe_frees_its_slot()
+    test_late_results_from_before_the_trip_are_ignored()
+    print("✅ Circuit breaker opens, probes and closes as expected")
@@ -0,0 +1,165 @@
+import sys
+sys.path.append('.')
+import asyncio
+import threading
+import time
+from fastapi import HTTPException
+from app.routers import email_sorting
+from app.services.circuit_breaker import CircuitBreaker
+from app.services.gemini import AsyncGeminiClient, GeminiService
+from app.services.response_cache import ResponseCache
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+class FakeModel:
+    """Stands in for genai.GenerativeModel, tracking how many calls run at once"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.calls = 0
+
+    async def generate_content_async(self, prompt: str):
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        return FakeResponse("alpha\nbeta\ngamma")
+
+class HangingModel:
+    """A blocking generate_content that never answers until released, like an unreachable API"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.calls = 0
+
+    def generate_content(self, prompt: str):
+        self.calls += 1
+        self.release.wait()
+        return FakeResponse("alpha\nbeta\ngamma")
+
+class FakeRequest:
+    """A client that hangs up after disconnect_after polls"""
+
+    def __init__(self, disconnect_after: int):
+        self.disconnect_after = disconnect_after
+        self.polls = 0
+
+    async def is_disconnected(self) -> bool:
+        self.polls += 1
+        return self.polls >= self.disconnect_after
+
+def make_client(delay: float, timeout: float = 5.0, max_concurrency: int = 4):
+    service = GeminiService()
+    service.model = FakeModel(delay)
+    # A private breaker and cache, so these calls leave the shared ones alone
+    service.breaker = CircuitBreaker('test', window_size=20, min_requests=100, max_error_rate=0.5,
+                                     max_p95_latency=60.0, open_seconds=30.0)
+    return AsyncGeminiClient(service, timeout=timeout, max_concurrency=max_concurrency,
+                             cache=ResponseCache(max_entries=16, ttl_seconds=60))
+
+def test_deadline():
+    client = make_client(delay=5.0, timeout=0.05)
+
+    async def run():
+        start = time.monotonic()
+        try:
+            await client.generate_text("slow prompt")
+            assert False, "the deadline must cut the call short"
+        except asyncio.TimeoutError:
+            pass
+        # The keyword helper turns the timeout into no keywords rather than an error
+        assert await client.enhance_keywords("another slow prompt") == []
+        return time.monotonic() - start
+
+    assert asyncio.run(run()) < 1.0
+    assert client.service.breaker.stats()["error_rate"] == 1.0
+
+def test_blocking_call_deadline():
+    client = make_client(delay=0.0)
+    service = client.service
+    service.model = HangingModel()
+    # A copy, so the shared settings are left alone
+    service.settings = service.settings.model_copy(update={'gemini_timeout_seconds': 0.1})
+
+    start = time.monotonic()
+    try:
+        try:
+            service._generate("hanging prompt")
+            assert False, "the deadline must cut the call short"
+        except TimeoutError:
+            pass
+        # The blocking helpers turn the timeout into no result rather than an error
+        assert service.enhance_keywords("travel", timeout=0.05) == []
+        assert service.generate_flag_suggestions("Flight booked", ["Travel"]) == []
+        assert time.monotonic() - start < 1.0
+    finally:
+        service.model.release.set()
+    assert service.model.calls == 3
+    assert service.breaker.stats()["error_rate"] == 1.0
+
+def test_concurrency_limit():
+    client = make_client(delay=0.05, max_concurrency=2)
+
+    async def run():
+        return await asyncio.gather(*(client.enhance_keywords(f"prompt {i}") for i in range(6)))
+
+    results = asyncio.run(run())
+    assert all(keywords == ["alpha", "beta", "gamma"] for keywords in results)
+    assert client.service.model.calls == 6
+    assert client.service.model.max_in_flight == 2
+
+def test_disconnect_cancels_call():
+    cancelled = asyncio.Event()
+
+    async def slow_call():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    async def run():
+        try:
+            await email_sorting.run_until_disconnected(FakeRequest(disconnect_after=1), slow_call())
+            assert False, "a disconnect must abort the call"
+        except HTTPException as e:
+            assert e.status_code == 499
+        await asyncio.sleep(0)
+        return cancelled.is_set()
+
+    assert asyncio.run(run())
+
+def test_endpoint_reports_disconnect():
+    service = email_sorting.categorization_service
+    original_model = service.gemini.model
+
+    async def slow_keywords(**kwargs):
+        await asyncio.sleep(10)
+        return []
+
+    service.gemini.model = FakeModel(delay=0)
+    service.enhance_user_keywords = slow_keywords
+    try:
+        asyncio.run(email_sorting.enhance_keywords_with_ai({"user_prompt": "travel"}, FakeRequest(disconnect_after=1)))
+        assert False, "a disconnect must abort the request"
+    except HTTPException as e:
+        # Not turned into a 500 by the endpoint's error handling
+        assert e.status_code == 499
+    finally:
+        service.gemini.model = original_model
+        del service.enhance_user_keywords
+
+if __name__ == "__main__":
+    test_deadline()
+    test_blocking_call_deadline()
+    test_concurrency_limit()
+    test_disconnect_cancels_call()
+    test_endpoint_reports_disconnect()
+    print("✅ Gemini calls respect deadlines, the concurrency limit and client disconnects")
@@ -0,0 +1,160 @@
+import sys
+sys.path.append('.')
+import numpy as np
+import pytest
+from app import database
+from app.services.email_categorization import SOURCE_CLASSIFIER, SOURCE_RULES, EmailCategorizationService, UserModels
+from app.services.learned_classifier import NO_LABEL, ClassifierStore, LearnedClassifier
+from app.services.sender_cache import UserDecisions
+
+FLAGS = [
+    {"name": "Business", "description": "Business and work-related emails"},
+    {"name": "Marketing Mails", "description": "Marketing and promotional emails"},
+]
+
+BUSINESS = [(f"Quarterly report review {i}", "Boss <boss@corp.com>") for i in range(30)]
+MARKETING = [(f"Huge sale discount {i}", "Deals <noreply@promo.deals.com>") for i in range(30)]
+
+def trained_model() -> LearnedClassifier:
+    model = LearnedClassifier(n_features=2 ** 12)
+    model.partial_fit(BUSINESS + MARKETING, ["Business"] * 30 + ["Marketing Mails"] * 30)
+    return model
+
+def test_partial_fit_learns_and_adds_classes():
+    model = trained_model()
+    assert model.classes == ["Business", "Marketing Mails"]
+    assert model.trained_samples == 60
+    assert model.predict("Report review for the board", "boss@corp.com")[0] == "Business"
+    assert model.predict("Weekend sale", "noreply@promo.deals.com")[0] == "Marketing Mails"
+
+    # A later update with an unseen label grows the model instead of starting over
+    travel = [(f"Flight booking confirmation {i}", "Airline <trips@air.example>") for i in range(20)]
+    model.partial_fit(travel, ["Travel"] * 20)
+    assert model.classes == ["Business", "Marketing Mails", "Travel"]
+    assert model.weights.shape == (2 ** 12, 3) and model.bias.shape == (3,)
+    assert model.trained_samples == 80
+    assert model.predict("Flight booking", "trips@air.example")[0] == "Travel"
+
+def test_save_load_round_trip(tmp_path):
+    model = trained_model()
+    model.last_log_id = 42
+    path = str(tmp_path / "nested" / "model.npz")
+    model.save(path)
+    loaded = LearnedClassifier.load(path)
+
+    assert loaded.classes == model.classes
+    assert (loaded.n_features, loaded.trained_samples, loaded.last_log_id) == (2 ** 12, 60, 42)
+    assert np.array_equal(loaded.weights, model.weights) and np.array_equal(loaded.bias, model.bias)
+    for subject, sender in BUSINESS[:3] + MARKETING[:3]:
+        assert loaded.predict_proba(subject, sender) == model.predict_proba(subject, sender)
+
+def test_confidence_threshold():
+    service = EmailCategorizationService()
+    settings = service.settings
+    model = trained_model()
+    no_decisions = UserDecisions(fingerprint="", built_at=0.0, senders={}, domains={})
+    models = UserModels(decisions=no_decisions, classifier=model)
+    email = {'subject': "Quarterly report review", 'from': "Boss <boss@corp.com>"}
+    label, probability = model.predict(email['subject'], email['from'])
+    assert label == "Business"
+
+    # A copy, so the shared settings are left alone
+    service.settings = settings.model_copy(update={'classifier_min_samples': 50, 'classifier_min_confidence': probability - 0.01})
+    assert service.classify_learned("user@example.com", email, FLAGS, models, "Business") == ("Business", probability)
+
+    # The classifier only confirms the rules' best flag, never picks one itself
+    assert service.classify_learned("user@example.com", email, FLAGS, models, "Marketing Mails") == (None, 0.0)
+    assert service.classify_learned("user@example.com", email, FLAGS, models) == (None, 0.0)
+
+    # Not confident enough: keep the rules' decision
+    service.settings = settings.model_copy(update={'classifier_min_samples': 50, 'classifier_min_confidence': probability + 0.01})
+    assert service.classify_learned("user@example.com", email, FLAGS, models, "Business") == (None, 0.0)
+
+    # Confident, but trained on too little history to be trusted
+    service.settings = settings.model_copy(update={'classifier_min_samples': 61, 'classifier_min_confidence': probability - 0.01})
+    assert service.classify_learned("user@example.com", email, FLAGS, models, "Business") == (None, 0.0)
+
+    # The label is no longer one of the user's flags
+    service.settings = settings.model_copy(update={'classifier_min_samples': 50, 'classifier_min_confidence': probability - 0.01})
+    assert service.classify_learned("user@example.com", email, FLAGS[1:], models, "Business") == (None, 0.0)
+
+def test_training_rows_follow_log_order(scratch_db, tmp_path):
+    with database.get_db() as conn:
+        conn.execute(
+            "INSERT INTO sorting_sessions (session_id, email, status) VALUES ('s1', 'user@example.com', 'completed')"
+        )
+        conn.executemany(
+            "INSERT INTO email_processing_log (session_id, email_id, email_subject, email_from, assigned_label, "
+            "confidence_score, status) VALUES ('s1', ?, ?, ?, ?, 0.9, 'success')",
+            [(f"msg-{i}", subject, sender, label)
+             for i, ((subject, sender), label) in enumerate(zip(BUSINESS + MARKETING, ["Business"] * 30 + ["Marketing Mails"] * 30))]
+        )
+        conn.commit()
+
+    store = ClassifierStore(str(tmp_path / "models"))
+    rows = store.load_training_rows("user@example.com")
+    ids = [row['id'] for row in rows]
+    assert len(ids) == 60 and ids == sorted(ids)
+    assert store.load_training_rows("user@example.com", after_log_id=ids[49]) == rows[50:]
+
+    model = store.train("user@example.com")
+    assert model.trained_samples == 60 and model.last_log_id == ids[-1]
+    # Nothing new since the last run: the saved model comes back unchanged
+    assert store.train("user@example.com").trained_samples == 60
+
+def test_skewed_history_does_not_claim_off_topic_mail(scratch_db, tmp_path):
+    # 98% of the rule decisions went to Marketing Mails
+    marketing = [(f"Huge sale discount {i}", "Deals <noreply@promo.deals.com>", "Marketing Mails", "rules") for i in range(490)]
+    business = [(f"Quarterly report review {i}", "Boss <boss@corp.com>", "Business", "rules") for i in range(10)]
+    # Labels the memo and the classifier chose themselves must not be learned back
+    own_decisions = [(f"Board meeting minutes {i}", "Boss <boss@corp.com>", "Marketing Mails", source)
+                     for i, source in enumerate(["sender", "classifier"] * 20)]
+    with database.get_db() as conn:
+        conn.execute(
+            "INSERT INTO sorting_sessions (session_id, email, status) VALUES ('s1', 'user@example.com', 'completed')"
+        )
+        conn.executemany(
+            "INSERT INTO email_processing_log (session_id, email_id, email_subject, email_from, assigned_label, "
+            "confidence_score, status, decision_source) VALUES ('s1', ?, ?, ?, ?, 0.6, 'success', ?)",
+            [(f"msg-{i}", *row) for i, row in enumerate(marketing + business + own_decisions)]
+        )
+        conn.executemany(
+            "INSERT INTO email_processing_log (session_id, email_id, email_subject, email_from, assigned_label, "
+            "confidence_score, status, decision_source) VALUES ('s1', ?, ?, 'Friends <pals@mail.example>', NULL, 0.0, 'skipped', 'rules')",
+            [(f"skip-{i}", f"Catching up this weekend {i}") for i in range(20)]
+        )
+        conn.commit()
+
+    store = ClassifierStore(str(tmp_path / "models"))
+    rows = store.load_training_rows("user@example.com")
+    assert len(rows) == 520
+    assert not any(row['email_subject'].startswith("Board meeting") for row in rows)
+
+    model = store.train("user@example.com")
+    assert set(model.classes) == {"Marketing Mails", "Business", NO_LABEL}
+
+    service = EmailCategorizationService()
+    service.settings = service.settings.model_copy(update={'classifier_min_samples': 100, 'classifier_min_confidence': 0.7})
+    no_decisions = UserDecisions(fingerprint="", built_at=0.0, senders={}, domains={})
+    models = UserModels(decisions=no_decisions, classifier=model)
+    flags = [
+        {"name": "Business", "description": "quarterly reports and board reviews"},
+        {"name": "Marketing Mails", "description": "sales discounts and promotions"},
+    ]
+
+    # The skew alone makes the model confident about off-topic mail...
+    label, probability = model.predict("Lunch with grandma on Sunday", "mom@gmail.com")
+    assert label == "Marketing Mails" and probability >= service.settings.classifier_min_confidence
+    # ...but with no flag from the rules it has nothing to confirm, so the email is not claimed
+    for email in ({'subject': "Lunch with grandma on Sunday", 'from': "mom@gmail.com", 'body': "See you at noon"},
+                  {'subject': "hello", 'from': "friend@x.org", 'body': ""}):
+        labels, ambiguity, source = service.score_locally("user@example.com", email, flags, 1, models=models)
+        assert labels == [] and ambiguity is not None and source == SOURCE_RULES
+
+    # A close call it agrees with is settled without Gemini
+    sale = {'subject': "Weekend sale", 'from': "Deals <noreply@promo.deals.com>", 'body': "discount on everything"}
+    labels, ambiguity, source = service.score_locally("user@example.com", sale, flags, 1, models=models)
+    assert labels[0][0] == "Marketing Mails" and ambiguity is None and source == SOURCE_CLASSIFIER
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
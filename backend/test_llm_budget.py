@@ -0,0 +1,59 @@
+import sys
+sys.path.append('.')
+from app.services.llm_budget import LLMBudget, estimate_tokens, schedule_llm_requests
+
+def one_call(item):
+    return 1, 100
+
+def test_most_ambiguous_first_within_call_budget():
+    budget = LLMBudget(max_calls=3, max_tokens=0)
+    candidates = [(0.15, 'd'), (0.01, 'a'), (0.30, 'e'), (0.05, 'b'), (0.10, 'c')]
+    assert schedule_llm_requests(candidates, budget, one_call) == ['a', 'b', 'c']
+    assert (budget.calls, budget.tokens, budget.skipped) == (3, 300, 2)
+
+def test_ties_keep_candidate_order():
+    budget = LLMBudget(max_calls=2, max_tokens=0)
+    assert schedule_llm_requests([(0.1, 'x'), (0.0, 'y'), (0.1, 'z')], budget, one_call) == ['y', 'x']
+
+def test_max_ambiguity_cutoff():
+    budget = LLMBudget(max_calls=0, max_tokens=0)
+    candidates = [(0.05, 'a'), (0.2, 'b'), (0.25, 'c'), (0.5, 'd')]
+    assert schedule_llm_requests(candidates, budget, one_call, max_ambiguity=0.2) == ['a', 'b']
+    # Clear decisions are not sent at all, so they don't count as skipped
+    assert budget.skipped == 0
+
+def test_token_budget_skips_what_does_not_fit():
+    costs = {'big': (1, 900), 'small': (1, 200), 'tiny': (1, 50)}
+    budget = LLMBudget(max_calls=0, max_tokens=1000)
+    candidates = [(0.0, 'small'), (0.1, 'big'), (0.2, 'tiny')]
+    # 'big' no longer fits after 'small', but the cheaper, less ambiguous 'tiny' still does
+    assert schedule_llm_requests(candidates, budget, costs.get) == ['small', 'tiny']
+    assert (budget.tokens, budget.skipped) == (250, 1)
+
+def test_requests_are_all_or_nothing():
+    budget = LLMBudget(max_calls=3, max_tokens=0)
+    # Each email needs one call per custom flag
+    costs = {'two_flags': (2, 10), 'three_flags': (3, 10), 'one_flag': (1, 10)}
+    candidates = [(0.0, 'two_flags'), (0.1, 'three_flags'), (0.2, 'one_flag')]
+    assert schedule_llm_requests(candidates, budget, costs.get) == ['two_flags', 'one_flag']
+    assert budget.calls == 3
+
+def test_unlimited_budget():
+    budget = LLMBudget(max_calls=0, max_tokens=0)
+    candidates = [(i / 100, i) for i in range(50)]
+    assert schedule_llm_requests(candidates, budget, one_call) == list(range(50))
+    assert budget.stats() == {"calls": 50, "max_calls": 0, "tokens": 5000, "max_tokens": 0, "skipped": 0}
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 1
+    assert estimate_tokens("x" * 400) == 101
+
+if __name__ == "__main__":
+    test_most_ambiguous_first_within_call_budget()
+    test_ties_keep_candidate_order()
+    test_max_ambiguity_cutoff()
+    test_token_budget_skips_what_does_not_fit()
+    test_requests_are_all_or_nothing()
+    test_unlimited_budget()
+    test_estimate_tokens()
+    print("✅ LLM requests are scheduled by ambiguity within the budget")
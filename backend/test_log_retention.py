@@ -0,0 +1,76 @@
+import sys
+sys.path.append('.')
+import csv
+import gzip
+import os
+import pytest
+from datetime import date, datetime
+from app import database
+from app.migrations import add_months, partition_month, partition_name
+from app.services.log_retention import LogArchiver
+
+NOW = datetime(2026, 10, 19, 12, 0, 0)
+
+def test_month_arithmetic():
+    assert add_months(date(2026, 1, 1), -1) == date(2025, 12, 1)
+    assert add_months(date(2026, 11, 1), 3) == date(2027, 2, 1)
+    assert partition_name(date(2026, 7, 1)) == "email_processing_log_y2026m07"
+    assert partition_month("email_processing_log_y2026m07") == date(2026, 7, 1)
+    assert partition_month("email_processing_log_default") is None
+    assert LogArchiver(retention_months=3).cutoff(NOW) == date(2026, 7, 1)
+
+def seed_log(rows_per_month: dict):
+    with database.get_db() as conn:
+        conn.execute("INSERT INTO sorting_sessions (session_id, email, status) VALUES ('s1', 'user@example.com', 'completed')")
+        for month, count in rows_per_month.items():
+            conn.executemany(
+                "INSERT INTO email_processing_log (session_id, email_id, assigned_label, processing_time) VALUES ('s1', ?, 'Business', ?)",
+                [(f"{month}-{index}", f"{month}-{index % 28 + 1:02d} 08:00:00") for index in range(count)]
+            )
+        conn.commit()
+
+def log_months():
+    with database.get_db() as conn:
+        rows = conn.execute("SELECT substr(processing_time, 1, 7), COUNT(*) FROM email_processing_log GROUP BY 1 ORDER BY 1").fetchall()
+        return {row[0]: row[1] for row in rows}
+
+def read_archive(path):
+    with gzip.open(path, "rt", newline="") as archive:
+        return list(csv.DictReader(archive))
+
+def test_expired_months_archived_and_deleted(scratch_db, tmp_path):
+    seed_log({"2026-05": 30, "2026-06": 12, "2026-07": 7, "2026-10": 3})
+
+    archive_dir = str(tmp_path / "archive")
+    # Small batches so deletes take several write transactions
+    archiver = LogArchiver(retention_months=3, archive_dir=archive_dir, delete_batch=8)
+    result = archiver.run_once(NOW)
+
+    assert log_months() == {"2026-07": 7, "2026-10": 3}
+    assert result["rows_archived"] == 42 and result["partitions_dropped"] == []
+    assert [os.path.basename(path) for path in result["archives"]] == [
+        "email_processing_log_y2026m05.csv.gz", "email_processing_log_y2026m06.csv.gz"
+    ]
+    may = read_archive(result["archives"][0])
+    assert len(may) == 30 and may[0]["session_id"] == "s1" and "cluster_id" in may[0]
+    assert not [name for name in os.listdir(archive_dir) if name.endswith(".partial")]
+
+    # Nothing left to expire; a later month rolls off without overwriting earlier archives
+    assert archiver.run_once(NOW)["rows_archived"] == 0
+    with database.get_db() as conn:
+        conn.execute("INSERT INTO email_processing_log (session_id, email_id, processing_time) VALUES ('s1', 'late', '2026-06-30 23:59:59')")
+        conn.commit()
+    result = archiver.run_once(NOW)
+    assert [os.path.basename(path) for path in result["archives"]] == ["email_processing_log_y2026m06.1.csv.gz"]
+    assert archiver.stats()["rows_archived"] == 43 and archiver.stats()["last_error"] is None
+
+def test_retention_disabled_keeps_rows(scratch_db, tmp_path):
+    seed_log({"2020-01": 5})
+    archiver = LogArchiver(retention_months=0, archive_dir=str(tmp_path / "archive"))
+    archiver.run_once(NOW)
+    archiver.start()
+    assert archiver._thread is None
+    assert log_months() == {"2020-01": 5}
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,77 @@
+import sys
+sys.path.append('.')
+import random
+from app.services.near_duplicates import (
+    MAX_BANDED_DISTANCE, cluster_near_duplicates, fingerprint_tokens, simhash
+)
+
+WORDS = [
+    'project', 'status', 'report', 'review', 'open', 'items', 'before', 'friday', 'reply', 'questions',
+    'team', 'budget', 'meeting', 'notes', 'agenda', 'client', 'update', 'timeline', 'release', 'plan'
+]
+
+def email(email_id: str, body: str, sender: str = "Reports <reports@corp.com>", subject: str = "Weekly status") -> dict:
+    return {'id': email_id, 'subject': subject, 'from': sender, 'body': body}
+
+def distance(a: dict, b: dict) -> int:
+    fingerprints = [simhash(fingerprint_tokens(e['subject'], e['body'])) for e in (a, b)]
+    return bin(fingerprints[0] ^ fingerprints[1]).count('1')
+
+def test_numbers_and_links_are_normalized():
+    first = email('1', "Order 1234 shipped on 2024-05-01, track it at https://t.example/abc?x=1 thanks for shopping with us")
+    second = email('2', "Order 98 shipped on 2025-11-30, track it at https://t.example/zzz?y=2 thanks for shopping with us")
+    assert distance(first, second) == 0
+
+    clusters = cluster_near_duplicates([first, second])
+    assert len(clusters) == 1
+    assert clusters[0].representative is first and clusters[0].members == [first, second]
+    assert clusters[0].is_duplicate_group
+
+def test_sender_domains_and_short_emails_stay_apart():
+    body = "Your invoice for this month is attached please pay it within thirty days of receipt"
+    same_domain = email('1', body, "Billing <billing@corp.com>")
+    other_address = email('2', body, "Accounts <accounts@corp.com>")
+    other_domain = email('3', body, "Billing <billing@vendor.io>")
+    clusters = cluster_near_duplicates([same_domain, other_address, other_domain])
+    assert [[m['id'] for m in c.members] for c in clusters] == [['1', '2'], ['3']]
+
+    # Identical, but too short to fingerprint reliably
+    short = [email(str(i), "see you soon", subject="Hi") for i in range(3)]
+    assert [len(c.members) for c in cluster_near_duplicates(short)] == [1, 1, 1]
+    assert len(cluster_near_duplicates(short, min_tokens=2)) == 1
+
+def test_grouping_follows_distance_threshold():
+    rng = random.Random(3)
+    base_words = rng.choices(WORDS, k=120)
+    base = email('base', ' '.join(base_words))
+
+    variants = []
+    for index in range(40):
+        words = list(base_words)
+        words[rng.randrange(len(words))] = rng.choice(['alpha', 'omega', 'zulu'])
+        variants.append(email(f"v{index}", ' '.join(words)))
+
+    distances = [distance(base, variant) for variant in variants]
+    # The corpus covers both sides of the banded limit
+    assert min(distances) <= MAX_BANDED_DISTANCE < max(distances)
+
+    for max_distance in (0, 1, 2, 3, 10):
+        limit = min(max_distance, MAX_BANDED_DISTANCE)
+        for variant, bits in zip(variants, distances):
+            clusters = cluster_near_duplicates([base, variant], max_distance=max_distance)
+            assert (len(clusters) == 1) == (bits <= limit), (max_distance, bits)
+
+def test_members_join_the_first_close_representative():
+    body = "The quarterly planning meeting moves to the large room on the third floor after lunch"
+    emails = [email(str(i), body) for i in range(4)] + [email('x', "Completely different text about the annual company picnic and its schedule")]
+    clusters = cluster_near_duplicates(emails)
+    assert [c.cluster_id for c in clusters] == ['0', 'x']
+    assert [m['id'] for m in clusters[0].members] == ['0', '1', '2', '3']
+    assert not clusters[1].is_duplicate_group
+
+if __name__ == "__main__":
+    test_numbers_and_links_are_normalized()
+    test_sender_domains_and_short_emails_stay_apart()
+    test_grouping_follows_distance_threshold()
+    test_members_join_the_first_close_representative()
+    print("✅ Near-duplicate clustering follows the SimHash threshold")
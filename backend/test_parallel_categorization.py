@@ -0,0 +1,67 @@
+import sys
+sys.path.append('.')
+import os
+from app.services.email_categorization import EmailCategorizationService
+from app.services.parallel_categorization import (
+    INLINE_BATCH_SIZE, MAX_CHUNK_SIZE, MIN_CHUNK_SIZE, iter_categorize_parallel, plan_parallelism
+)
+from app.services.rule_tables import compile_rules, merge_with_defaults
+from test_rule_tables import TRAVEL_FLAGS, TRAVEL_TABLES
+from test_vectorized_scoring import make_emails
+
+def test_plan_parallelism():
+    # Small batches are scored inline, as one chunk
+    assert plan_parallelism(0, max_workers=8) == (1, 0)
+    assert plan_parallelism(INLINE_BATCH_SIZE - 1, max_workers=8) == (1, INLINE_BATCH_SIZE - 1)
+
+    # A few chunks per worker, but never below MIN_CHUNK_SIZE emails...
+    assert plan_parallelism(INLINE_BATCH_SIZE, max_workers=2) == (2, MIN_CHUNK_SIZE)
+    assert plan_parallelism(1000, max_workers=4) == (4, 63)
+    # ...nor above MAX_CHUNK_SIZE
+    assert plan_parallelism(100000, max_workers=4) == (4, MAX_CHUNK_SIZE)
+
+    # No more workers than there are minimum-size chunks to keep busy
+    assert plan_parallelism(100, max_workers=32) == (100 // MIN_CHUNK_SIZE, MIN_CHUNK_SIZE)
+
+    workers, _ = plan_parallelism(100000)
+    assert 1 <= workers <= (os.cpu_count() or 1)
+
+def test_pool_matches_serial():
+    service = EmailCategorizationService()
+    rules = compile_rules(*merge_with_defaults(
+        {'trips': TRAVEL_TABLES[0]['Travel']}, {'trips': TRAVEL_TABLES[1]['travel']}
+    ))
+    emails = make_emails(INLINE_BATCH_SIZE * 3, seed=13)
+    for index in range(0, len(emails), 40):
+        emails.insert(index, {'id': f"trip-{index}", 'subject': 'Your flight and hotel',
+                              'from': 'Airline <booking@airline.com>', 'body': 'Booking itinerary attached'})
+    expected = [service.categorize_email_enhanced(email, TRAVEL_FLAGS, {}, rules) for email in emails]
+    # Only the user's rules match Trips, so workers scoring with the defaults would differ
+    assert any(category == 'Trips' for category, _ in expected)
+
+    # Large enough for the pool path
+    assert plan_parallelism(len(emails), max_workers=2)[0] == 2
+    results = service.batch_categorize_emails(emails, TRAVEL_FLAGS, parallel=True, max_workers=2, rules=rules)
+    assert [r['email_id'] for r in results] == [email['id'] for email in emails]
+    assert [(r['assigned_category'], r['confidence_score']) for r in results] == expected
+
+def test_chunks_stream_in_input_order():
+    service = EmailCategorizationService()
+    emails = make_emails(INLINE_BATCH_SIZE + 5, seed=17)
+    snapshot = service.snapshot(TRAVEL_FLAGS, None)
+
+    # Uneven chunks spread over two workers still come back in input order
+    streamed = iter_categorize_parallel(snapshot, emails, workers=2, chunk_size=MIN_CHUNK_SIZE)
+    first_email, _, _ = next(streamed)
+    assert first_email is emails[0]
+    results = [(first_email, None, None)] + list(streamed)
+    assert [email for email, _, _ in results] == emails
+
+    for email, category, confidence in results[1:]:
+        assert (category, confidence) == service.categorize_email_enhanced(email, TRAVEL_FLAGS, {})
+
+if __name__ == "__main__":
+    test_plan_parallelism()
+    test_pool_matches_serial()
+    test_chunks_stream_in_input_order()
+    print("✅ Parallel categorization plans, chunks and streams batches like the serial path")
@@ -0,0 +1,85 @@
+import sys
+sys.path.append('.')
+import asyncio
+import json
+import pytest
+from app import database
+from app.services.email_categorization import EmailCategorizationService
+from app.services.processing_log import ProcessingLogWriter, processing_log
+
+def log_rows(session_id: str):
+    with database.get_db() as conn:
+        return conn.execute(
+            "SELECT email_id, assigned_label, status FROM email_processing_log WHERE session_id = ? ORDER BY rowid",
+            (session_id,)
+        ).fetchall()
+
+def test_rows_written_in_batches(scratch_db):
+    writer = ProcessingLogWriter(batch_size=50, flush_interval=60)
+    for index in range(120):
+        writer.add(("batched", f"msg-{index}", "Subject", "a@example.com", "Business", 0.8, "success", None, None, None))
+    writer.close()
+    rows = log_rows("batched")
+    assert [row[0] for row in rows] == [f"msg-{index}" for index in range(120)]
+    # Two size-triggered flushes (timing permitting) and the rest on close, never one per row
+    assert writer.flushes <= 3 and writer.rows_written == 120
+
+def test_session_end_flushes(scratch_db):
+    async def run(service):
+        session_id = await service.create_sorting_session("user@example.com", ["Business"])
+        for index in range(5):
+            await service.log_email_processing(session_id, {
+                'email_id': f"msg-{index}", 'assigned_category': 'Business', 'status': 'success'
+            })
+        assert processing_log.pending() == 5
+        await service.update_sorting_session(session_id, status='completed', processed_emails=5)
+        return session_id
+
+    session_id = asyncio.run(run(EmailCategorizationService()))
+    assert processing_log.pending() == 0
+    assert len(log_rows(session_id)) == 5
+    processing_log.close()
+
+def test_failed_flush_keeps_rows(empty_db):
+    writer = ProcessingLogWriter(batch_size=1000, flush_interval=60, max_pending=3)
+    # No tables yet, so the insert fails
+    for index in range(5):
+        writer.add(("failing", f"msg-{index}", None, None, None, None, "success", None, None, None))
+    assert writer.flush() == 0
+    assert writer.pending() == 3 and writer.rows_dropped == 2
+
+    database.init_db()
+    writer.close()
+    assert [row[0] for row in log_rows("failing")] == ["msg-2", "msg-3", "msg-4"]
+
+def test_bad_row_goes_to_dead_letter(scratch_db, tmp_path):
+    dead_letter_path = str(tmp_path / "dead_letter.jsonl")
+    writer = ProcessingLogWriter(batch_size=1000, flush_interval=60, dead_letter_path=dead_letter_path)
+    for index in range(4):
+        # A dict can't be bound as a column value, so this row fails whatever else is in the batch
+        error_details = {"unserializable": True} if index == 2 else None
+        writer.add(("bad-row", f"msg-{index}", None, None, "Business", 0.9, "success", error_details, None, None))
+    assert writer.flush() == 3
+    assert writer.pending() == 0 and writer.rows_dead_lettered == 1
+    assert [row[0] for row in log_rows("bad-row")] == ["msg-0", "msg-1", "msg-3"]
+
+    with open(dead_letter_path) as dead_letters:
+        entries = [json.loads(line) for line in dead_letters]
+    assert [(entry["session_id"], entry["email_id"]) for entry in entries] == [("bad-row", "msg-2")]
+    assert entries[0]["error"]
+
+    # Later flushes are not held back by it
+    writer.add(("bad-row", "msg-4", None, None, "Business", 0.9, "success", None, None, None))
+    writer.close()
+    assert len(log_rows("bad-row")) == 4
+
+def test_rows_failing_every_time_are_given_up(empty_db):
+    writer = ProcessingLogWriter(batch_size=1000, flush_interval=60, max_attempts=2)
+    writer.add(("failing", "msg-0", None, None, None, None, "success", None, None, None))
+    assert writer.flush() == 0 and writer.pending() == 1
+    assert writer.flush() == 0 and writer.pending() == 0
+    assert writer.rows_dead_lettered == 1
+    writer.close()
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
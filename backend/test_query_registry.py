@@ -0,0 +1,73 @@
+import sys
+sys.path.append('.')
+import asyncio
+import pytest
+from app import database, queries
+from app.async_database import close_async_db, execute, fetch_all, fetch_one, transaction
+from app.queries import QUERIES, define, query_stats, to_asyncpg, to_pyformat
+from app.services.rule_tables import delete_user_rule_tables, get_user_rule_tables, save_user_rule_tables
+
+def test_rendering():
+    assert to_asyncpg("SELECT * FROM t WHERE a = ? AND b = '?' AND c = %s") == "SELECT * FROM t WHERE a = $1 AND b = '?' AND c = $2"
+    assert queries.DELETE_GMAIL_LABEL.sql("postgres").endswith("email = $1 AND label_name = $2")
+    assert queries.DELETE_GMAIL_LABEL.sql("sqlite").endswith("email = ? AND label_name = ?")
+    assert to_pyformat("SELECT * FROM t WHERE a = ? AND b LIKE '%?%' AND c = %s AND d % 2 = 0") == \
+        "SELECT * FROM t WHERE a = %s AND b LIKE '%%?%%' AND c = %s AND d %% 2 = 0"
+    assert queries.DELETE_GMAIL_LABEL.sync_sql("postgres").endswith("email = %s AND label_name = %s")
+    assert queries.DELETE_GMAIL_LABEL.sync_sql("sqlite") == queries.DELETE_GMAIL_LABEL.sqlite
+    try:
+        define("user_by_email", "SELECT 1")
+        assert False, "duplicate names must be rejected"
+    except ValueError:
+        pass
+
+def test_statements_compile_on_sqlite(scratch_db):
+    with database.get_db() as conn:
+        for query in QUERIES.values():
+            conn.execute(f"EXPLAIN {query.sqlite}", (None,) * query.sqlite.count("?"))
+
+def test_named_queries_are_timed(scratch_db):
+    async def run():
+        await execute(queries.UPSERT_USER, ("user@example.com", "{}"))
+        await execute(queries.UPSERT_USER, ("user@example.com", '{"token": "x"}'))
+        async with transaction() as conn:
+            await conn.execute(queries.DELETE_USER_FLAGS, ("user@example.com",))
+            await conn.execute_many(queries.INSERT_USER_FLAG, [
+                ("user@example.com", "Work", "", "#000000", True),
+                ("user@example.com", "Bills", "", "#000000", False)
+            ])
+        user = await fetch_one(queries.USER_BY_EMAIL, ("user@example.com",))
+        active = await fetch_all(queries.ACTIVE_USER_FLAGS, ("user@example.com",))
+        await fetch_one("SELECT COUNT(*) FROM users")
+        await close_async_db()
+        return user, active
+
+    query_stats.reset()
+    user, active = asyncio.run(run())
+    assert user["credentials"] == '{"token": "x"}'
+    assert [row["flag_name"] for row in active] == ["Work"]
+
+    stats = query_stats.stats()
+    assert stats["upsert_user"]["calls"] == 2 and stats["upsert_user"]["errors"] == 0
+    assert set(stats) == {"upsert_user", "delete_user_flags", "insert_user_flag", "user_by_email", "active_user_flags"}
+    assert 0 <= stats["user_by_email"]["p50_ms"] <= stats["user_by_email"]["max_ms"]
+
+def test_sync_queries_are_timed(scratch_db):
+    query_stats.reset()
+    with database.get_db() as conn:
+        conn.execute("INSERT INTO users (email) VALUES ('user@example.com')")
+        conn.commit()
+
+    save_user_rule_tables("user@example.com", {"travel": {"subject": ["flight"]}}, {})
+    # A second save replaces the row in place
+    save_user_rule_tables("user@example.com", {"travel": {"subject": ["hotel"]}}, {})
+    assert get_user_rule_tables("user@example.com")[0]["travel"]["subject"] == ["hotel"]
+    delete_user_rule_tables("user@example.com")
+    assert get_user_rule_tables("user@example.com") is None
+
+    stats = query_stats.stats()
+    assert stats["upsert_user_rule_tables"]["calls"] == 2
+    assert stats["user_rule_tables"]["calls"] == 2 and stats["delete_user_rule_tables"]["calls"] == 1
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
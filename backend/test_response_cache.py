@@ -0,0 +1,102 @@
+import sys
+sys.path.append('.')
+import asyncio
+import time
+from app.services.response_cache import ResponseCache, cache_key
+
+def test_lru_eviction():
+    cache = ResponseCache(max_entries=2, ttl_seconds=60)
+    cache.put("a", "A")
+    cache.put("b", "B")
+    # Reading "a" makes "b" the least recently used
+    assert cache.get("a") == "A"
+    cache.put("c", "C")
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == ("A", "C")
+    assert cache.evictions == 1 and cache.stats()["entries"] == 2
+
+def test_ttl_expiry():
+    cache = ResponseCache(max_entries=10, ttl_seconds=0.05)
+    cache.put("a", "A")
+    assert cache.get("a") == "A"
+    time.sleep(0.1)
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0
+
+def test_cache_key():
+    assert cache_key("gemini-pro", "prompt") == cache_key("gemini-pro", "prompt")
+    assert cache_key("gemini-pro", "prompt") != cache_key("gemini-pro", "prompt ")
+    assert cache_key("gemini-pro", "prompt") != cache_key("other-model", "prompt")
+
+def test_single_flight():
+    cache = ResponseCache(max_entries=10, ttl_seconds=60)
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    async def run():
+        results = await asyncio.gather(*(cache.get_or_fetch("key", fetch) for _ in range(5)))
+        # Answered from the cache now, without another call
+        results.append(await cache.get_or_fetch("key", fetch))
+        return results
+
+    assert asyncio.run(run()) == ["answer"] * 6
+    assert len(calls) == 1
+    stats = cache.stats()
+    assert (stats["misses"], stats["coalesced"], stats["hits"], stats["in_flight"]) == (1, 4, 1, 0)
+
+def test_caller_timeout_keeps_shared_fetch():
+    cache = ResponseCache(max_entries=10, ttl_seconds=60)
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return "answer"
+
+    async def run():
+        impatient = asyncio.ensure_future(cache.get_or_fetch("key", fetch, timeout=0.01))
+        patient = asyncio.ensure_future(cache.get_or_fetch("key", fetch))
+        try:
+            await impatient
+            assert False, "the short timeout must expire"
+        except asyncio.TimeoutError:
+            pass
+        return await patient
+
+    assert asyncio.run(run()) == "answer"
+    assert len(calls) == 1 and cache.get("key") == "answer"
+
+def test_failures_and_empty_responses_are_not_cached():
+    cache = ResponseCache(max_entries=10, ttl_seconds=60)
+    responses = iter([RuntimeError("quota"), "", "answer"])
+
+    async def fetch():
+        response = next(responses)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    async def run():
+        try:
+            await cache.get_or_fetch("key", fetch)
+            assert False, "the failure must reach the caller"
+        except RuntimeError:
+            pass
+        assert await cache.get_or_fetch("key", fetch) == ""
+        return await cache.get_or_fetch("key", fetch)
+
+    assert asyncio.run(run()) == "answer"
+    assert cache.misses == 3
+
+if __name__ == "__main__":
+    test_lru_eviction()
+    test_ttl_expiry()
+    test_cache_key()
+    test_single_flight()
+    test_caller_timeout_keeps_shared_fetch()
+    test_failures_and_empty_responses_are_not_cached()
+    print("✅ Response cache evicts, expires and coalesces requests")
@@ -0,0 +1,70 @@
+import sys
+sys.path.append('.')
+import pickle
+from app.services.email_categorization import EmailCategorizationService
+from app.services.rule_tables import (
+    DEFAULT_CATEGORY_KEYWORDS,
+    DEFAULT_DOMAIN_CATEGORIES,
+    compile_rules,
+    default_rules,
+    merge_with_defaults,
+)
+from app.services.vectorized_scoring import VectorizedScorer
+from test_vectorized_scoring import FLAGS, TOLERANCE, make_emails
+
+# Travel keywords for a flag that keeps a default-looking description
+TRAVEL_TABLES = (
+    {'Travel': {'subject': ['flight', 'hotel'], 'body': ['booking', 'itinerary'], 'sender': ['airline']}},
+    {'travel': ['airline', 'travel']}
+)
+TRAVEL_FLAGS = FLAGS + [{"name": "Trips", "description": "Emails to archive"}]
+
+def test_compiled_once_per_configuration():
+    assert default_rules() is default_rules()
+    # Same content in a different shape (case, list vs tuple) hashes the same
+    reordered = {name.upper(): {field: tuple(words) for field, words in fields.items()}
+                 for name, fields in DEFAULT_CATEGORY_KEYWORDS.items()}
+    assert compile_rules(reordered, DEFAULT_DOMAIN_CATEGORIES) is default_rules()
+
+    custom = compile_rules(*merge_with_defaults(*TRAVEL_TABLES))
+    assert custom.content_hash != default_rules().content_hash
+    assert pickle.loads(pickle.dumps(custom)) is custom
+
+    try:
+        custom.content_hash = 'x'
+        assert False, "CompiledRules should be immutable"
+    except AttributeError:
+        pass
+
+def test_rejects_malformed_tables():
+    for tables in (({'urgent': ['asap']}, {}), ({'urgent': {'title': ['asap']}}, {}), ({}, {'junk': 'sale'})):
+        try:
+            compile_rules(*tables)
+            assert False, tables
+        except ValueError:
+            pass
+
+def test_user_rules_change_scoring():
+    service = EmailCategorizationService()
+    rules = compile_rules(*merge_with_defaults(
+        {'trips': TRAVEL_TABLES[0]['Travel']}, {'trips': TRAVEL_TABLES[1]['travel']}
+    ))
+    email = {'id': '1', 'subject': 'Your flight and hotel', 'from': 'Airline <booking@airline.com>',
+             'body': 'Booking itinerary attached'}
+
+    assert service.categorize_email_enhanced(email, TRAVEL_FLAGS, {})[0] != 'Trips'
+    assert service.categorize_email_enhanced(email, TRAVEL_FLAGS, {}, rules)[0] == 'Trips'
+
+    # The vectorized scorer reads the same compiled tables
+    emails = make_emails(200, seed=5) + [email]
+    scorer = VectorizedScorer(service, TRAVEL_FLAGS, rules)
+    for item, (category, confidence) in zip(emails, scorer.categorize(emails)):
+        expected_category, expected_confidence = service.categorize_email_enhanced(item, TRAVEL_FLAGS, {}, rules)
+        assert category == expected_category, (item, category, expected_category)
+        assert abs(confidence - expected_confidence) <= TOLERANCE
+
+if __name__ == "__main__":
+    test_compiled_once_per_configuration()
+    test_rejects_malformed_tables()
+    test_user_rules_change_scoring()
+    print("✅ Rule tables compile, cache and score correctly")
@@ -0,0 +1,70 @@
+import sys
+sys.path.append('.')
+import sqlite3
+import pytest
+from app import database, queries
+from app.migrations import HOT_QUERY_INDEXES, MIGRATIONS, latest_version, migrate
+
+# Hot queries as the routers and services issue them on SQLite (named statements from app.queries),
+# with the index each must use and whether it may sort afterwards (a join ordered across sessions cannot
+# read rows in index order)
+HOT_QUERIES = [
+    ("session details", queries.SESSION_LOG_PAGE.sqlite, ("s1", 500), "idx_processing_log_session_time", False),
+    ("session details next page", queries.SESSION_LOG_PAGE_AFTER.sqlite, ("s1", "2026-10-01 00:00:00", 42, 500),
+     "idx_processing_log_session_time", False),
+    ("session export", queries.SESSION_LOG_EXPORT.sqlite, ("s1",), "idx_processing_log_session_time", False),
+    ("revert session", queries.REVERTIBLE_EMAILS.sqlite, ("s1",), "idx_processing_log_session_time", False),
+    ("sorting status", queries.LATEST_SESSION.sqlite, ("user@example.com",), "idx_sorting_sessions_email_start", False),
+    ("sorting history", queries.SESSION_HISTORY.sqlite, ("user@example.com", 10), "idx_sorting_sessions_email_start", False),
+    ("sorting history next page", queries.SESSION_HISTORY_AFTER.sqlite, ("user@example.com", "2026-10-01 00:00:00", 42, 10),
+     "idx_sorting_sessions_email_start", False),
+    ("last completed session", queries.LAST_COMPLETED_SESSION.sqlite, ("user@example.com",),
+     "idx_sorting_sessions_email_status_start", False),
+    ("active flags", queries.ACTIVE_USER_FLAGS.sqlite, ("user@example.com",), "idx_user_flags_email_active", False),
+    ("sender history", queries.SENDER_HISTORY.sqlite, ("user@example.com", 500), "idx_sorting_sessions_email_flags", True),
+]
+
+def query_plan(conn, query, params):
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall()]
+
+def test_migrations_apply_once(empty_db):
+    database.init_db()
+    database.init_db()
+    with database.get_db() as conn:
+        rows = conn.execute("SELECT version, name FROM schema_migrations ORDER BY version").fetchall()
+        assert [tuple(row) for row in rows] == [(m.version, m.name) for m in MIGRATIONS]
+        assert migrate(conn, "sqlite") == []
+        indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        assert set(HOT_QUERY_INDEXES) <= indexes
+
+def test_legacy_database_upgrades(empty_db):
+    # A database from before schema_migrations: tables exist, later columns do not
+    with sqlite3.connect(empty_db) as conn:
+        conn.execute("CREATE TABLE users (email TEXT PRIMARY KEY, credentials TEXT)")
+        conn.execute("CREATE TABLE sorting_sessions (id SERIAL PRIMARY KEY, email TEXT, session_id TEXT UNIQUE, "
+                     "start_time TIMESTAMP, status TEXT, flags_used TEXT)")
+        conn.execute("CREATE TABLE email_processing_log (id SERIAL PRIMARY KEY, session_id TEXT, email_id TEXT, "
+                     "processing_time TIMESTAMP, status TEXT)")
+        conn.execute("INSERT INTO sorting_sessions (session_id, email, status) VALUES ('old', 'user@example.com', 'completed')")
+    conn.close()
+    
+    database.init_db()
+    with database.get_db() as conn:
+        assert max(row[0] for row in conn.execute("SELECT version FROM schema_migrations")) == latest_version()
+        session_columns = [row[1] for row in conn.execute("PRAGMA table_info(sorting_sessions)")]
+        log_columns = [row[1] for row in conn.execute("PRAGMA table_info(email_processing_log)")]
+        assert 'profile' in session_columns and 'cluster_id' in log_columns
+        assert conn.execute("SELECT COUNT(*) FROM sorting_sessions").fetchone()[0] == 1
+
+def test_hot_queries_use_indexes(scratch_db):
+    with database.get_db() as conn:
+        for name, query, params, index, may_sort in HOT_QUERIES:
+            plan = query_plan(conn, query, params)
+            assert any(index in step for step in plan), (name, plan)
+            # No step may read a whole table
+            assert not [step for step in plan if step.startswith("SCAN") and "INDEX" not in step], (name, plan)
+            if not may_sort:
+                assert not any("TEMP B-TREE" in step for step in plan), (name, plan)
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,71 @@
+import sys
+sys.path.append('.')
+import asyncio
+import csv
+import io
+import json
+import pytest
+from fastapi import HTTPException
+from app import database
+from app.async_database import close_async_db
+from app.routers.email_sorting import export_session_details, get_session_details, get_sorting_history
+
+def seed(log_rows: int, sessions: int):
+    with database.get_db() as conn:
+        conn.executemany(
+            "INSERT INTO sorting_sessions (session_id, email, status, start_time) VALUES (?, 'user@example.com', 'completed', ?)",
+            # Pairs of sessions share a start time, as do runs of log rows, so ordering relies on the row id
+            [(f"s{index}", f"2026-10-{index // 2 + 1:02d} 09:00:00") for index in range(sessions)]
+        )
+        conn.executemany(
+            "INSERT INTO email_processing_log (session_id, email_id, assigned_label, processing_time) VALUES ('s0', ?, 'Business', ?)",
+            [(f"msg-{index}", f"2026-10-01 09:{index // 60:02d}:{index % 60 // 10:02d}") for index in range(log_rows)]
+        )
+        conn.commit()
+
+async def all_pages(fetch, key: str, **kwargs):
+    pages, cursor = [], None
+    while True:
+        page = await fetch(cursor=cursor, **kwargs)
+        pages.append(page[key])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return pages
+
+async def read_export(format: str) -> str:
+    response = await export_session_details("s0", format=format)
+    chunks = [chunk async for chunk in response.body_iterator]
+    return "".join(chunks)
+
+def test_keyset_pages_and_exports(scratch_db):
+    async def run():
+        details = await all_pages(lambda **kw: get_session_details("s0", **kw), "details", limit=97)
+        history = await all_pages(lambda **kw: get_sorting_history("user@example.com", **kw), "history", limit=4)
+        ndjson = await read_export("ndjson")
+        csv_text = await read_export("csv")
+        try:
+            await get_session_details("s0", cursor="not-a-cursor")
+            assert False, "a malformed cursor must be rejected"
+        except HTTPException as e:
+            assert e.status_code == 400
+        await close_async_db()
+        return details, history, ndjson, csv_text
+
+    seed(log_rows=1000, sessions=9)
+    details, history, ndjson, csv_text = asyncio.run(run())
+
+    # Every row exactly once, newest first, with ties broken by insertion order
+    assert [len(page) for page in details] == [97] * 10 + [30]
+    email_ids = [row["email_id"] for page in details for row in page]
+    assert email_ids == [f"msg-{index}" for index in reversed(range(1000))]
+    assert set(details[0][0]) == {"email_id", "email_subject", "email_from", "assigned_label", "confidence_score",
+                                  "processing_time", "status", "error_details", "cluster_id"}
+    assert [row["session_id"] for page in history for row in page] == [f"s{index}" for index in reversed(range(9))]
+
+    lines = ndjson.splitlines()
+    assert len(lines) == 1000 and json.loads(lines[0])["email_id"] == "msg-0"
+    rows = list(csv.DictReader(io.StringIO(csv_text)))
+    assert len(rows) == 1000 and rows[-1]["email_id"] == "msg-999" and rows[0]["assigned_label"] == "Business"
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,112 @@
+import sys
+sys.path.append('.')
+import random
+from app.services.email_categorization import CATEGORY_THRESHOLD, EmailCategorizationService
+from app.services.vectorized_scoring import VectorizedScorer
+
+TOLERANCE = 1e-9
+
+WORDS = [
+    'urgent', 'asap', 'deadline', 'meeting', 'project', 'report', 'client', 'review', 'follow', 'up',
+    'follow-up', 'reminder', 'status', 'update', 'newsletter', 'unsubscribe', 'sale', 'discount',
+    'invoice', 'receipt', 'flight', 'flights', 'hotel', 'booking', 'today', 'tomorrow', 'next', 'week',
+    'this', 're:', 'fwd:', '!!!', 'time-sensitive', 'priority', 'lunch', 'family', 'photos', 'the', 'and'
+]
+
+SENDERS = [
+    'Boss <boss@corp.com>', 'Deals <noreply@promo.deals.com>', 'Team Lead <team@project.io>',
+    'Friend <friend@gmail.com>', 'Alerts <alert@emergency-alert.org>', 'news@newsletter.marketing.com'
+]
+
+FLAGS = [
+    {"name": "Urgent", "description": "High priority emails"},
+    {"name": "Important", "description": "Important business emails"},
+    {"name": "Business", "description": "Business and work-related emails"},
+    {"name": "Follow-up", "description": "Emails requiring follow-up"},
+    {"name": "Junk", "description": "Marketing and promotional emails"},
+    {"name": "Travel", "description": "Flights and hotel bookings for the team"},
+    {"name": "Family", "description": "photos from family"},
+]
+
+def make_emails(count: int, seed: int = 7):
+    rng = random.Random(seed)
+    return [
+        {
+            'id': str(i),
+            'subject': ' '.join(rng.choices(WORDS, k=rng.randint(1, 6))).capitalize(),
+            'from': rng.choice(SENDERS),
+            'body': ' '.join(rng.choices(WORDS, k=rng.randint(0, 80)))
+        }
+        for i in range(count)
+    ]
+
+def test_vectorized_matches_loop_scorer():
+    service = EmailCategorizationService()
+    emails = make_emails(400)
+    scorer = VectorizedScorer(service, FLAGS)
+
+    for email, (category, confidence) in zip(emails, scorer.categorize(emails)):
+        expected_category, expected_confidence = service.categorize_email_enhanced(email, FLAGS, {})
+        assert category == expected_category, (email, category, expected_category)
+        assert abs(confidence - expected_confidence) <= TOLERANCE
+
+MANY_FLAGS = FLAGS + [
+    {"name": "urgent", "description": "anything that is due today"},
+    {"name": "Receipts", "description": "invoice and receipt emails"},
+    {"name": "Projects", "description": "project status reports"},
+    {"name": "Clients", "description": "client review meeting"},
+    {"name": "Newsletters", "description": "newsletter unsubscribe"},
+    {"name": "Deadlines", "description": "deadline tomorrow"},
+    {"name": "Lunch", "description": "lunch next week"},
+    {"name": "Hotels", "description": "hotel booking"},
+]
+
+def test_branch_and_bound_matches_full_scoring():
+    # The unpruned score matrix computes every flag, so it is the exhaustive reference for both scorers
+    service = EmailCategorizationService()
+    emails = make_emails(400, seed=3)
+    scorer = VectorizedScorer(service, MANY_FLAGS)
+    full = scorer.score_matrix(emails)
+    pruned = scorer.score_matrix(emails, prune=True)
+
+    assert (full.argmax(axis=1) == pruned.argmax(axis=1)).all()
+    assert (full.max(axis=1) == pruned.max(axis=1)).all()
+    assert (pruned <= full + TOLERANCE).all()
+
+    for email, scores, (category, confidence) in zip(emails, full, scorer.categorize(emails)):
+        best = scores.argmax()
+        expected = (MANY_FLAGS[best]['name'], scores[best]) if scores[best] >= CATEGORY_THRESHOLD else (None, 0.0)
+        assert (category, confidence) == expected, (email, category, expected)
+        expected_category, expected_confidence = service.categorize_email_enhanced(email, MANY_FLAGS, {})
+        assert category == expected_category, (email, category, expected_category)
+        assert abs(confidence - expected_confidence) <= TOLERANCE
+
+def test_multi_label_matches_single_label():
+    service = EmailCategorizationService()
+    emails = make_emails(400, seed=5)
+
+    for email in emails:
+        category, confidence = service.categorize_email_enhanced(email, MANY_FLAGS, {})
+        labels = service.categorize_email_multi(email, MANY_FLAGS, {})
+        assert (labels[0] if labels else (None, 0.0)) == (category, confidence), (email, labels)
+        assert all(score >= CATEGORY_THRESHOLD for _, score in labels)
+        assert [score for _, score in labels] == sorted((score for _, score in labels), reverse=True)
+        assert service.categorize_email_multi(email, MANY_FLAGS, {}, max_labels=2) == labels[:2]
+
+        scored, _ = service.score_labels(email, MANY_FLAGS, 0)
+        assert scored == labels
+
+def test_vectorized_batch_mode():
+    service = EmailCategorizationService()
+    emails = make_emails(50, seed=11)
+    serial = service.batch_categorize_emails(emails, FLAGS, parallel=True)
+    vectorized = service.batch_categorize_emails(emails, FLAGS, vectorized=True)
+
+    assert [r['assigned_category'] for r in serial] == [r['assigned_category'] for r in vectorized]
+
+if __name__ == "__main__":
+    test_vectorized_matches_loop_scorer()
+    test_branch_and_bound_matches_full_scoring()
+    test_multi_label_matches_single_label()
+    test_vectorized_batch_mode()
+    print("✅ Vectorized scores match categorize_email_enhanced")